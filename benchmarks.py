@@ -0,0 +1,1132 @@
+#--------------------------------------------
+# micro-benchmarks for ipydbg's hot paths, run against the fakedbg stand-ins
+# so they work without the CLR debugger. ipydbg's own functions are run
+# against them too, through clrnames:
+#   ipy benchmarks.py [-o results.json] [-c baseline.json] [benchmark names]
+
+import os
+os.environ['IPYDBG_FAKES'] = '1'
+
+import json
+import os.path
+import platform
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from timeit import default_timer as _clock
+
+import fakedbg
+import ipydbg
+from symcache import sequence_point, sequence_point_table, sequence_point_cache, \
+  symbol_index, HIDDEN_LINE
+from breakpoints import parse_breakpoint_spec, breakpoint_state
+from tracelog import trace_log
+from inspector import value_inspector
+from headless import event_writer
+from profiler import sample_profile
+from jmc import jmc_classifier, jmc_batch
+from renderer import console_renderer, background_writer
+from sourcecache import source_cache, source_file, source_nbytes, \
+  read_source_lines
+from evaluator import expression_evaluator
+from linecoverage import line_coverage
+from instrumentation import instrumentation
+from symstore import symbol_store, encode_symbols
+from heapwalk import heap_walker
+from lazymodules import deferred_modules
+from threadstacks import frame_resolver, dump_threads, group_stacks
+from stepping import step_range_cache, step_request
+from recording import session_recorder, session_log, index_path
+from snapshot import stop_snapshot
+from dbgserver import debug_server, encode_message, decode_messages
+
+_benchmarks = []
+
+def benchmark(name):
+  def deco(f):
+    _benchmarks.append((name, f))
+    return f
+  return deco
+
+#best wall clock time of repeat calls to f, in seconds
+def best_of(f, repeat = 3):
+  best = None
+  for i in range(repeat):
+    start = _clock()
+    f()
+    elapsed = _clock() - start
+    if best == None or elapsed < best:
+      best = elapsed
+  return best
+
+#--------------------------------------------
+# sequence points
+
+@benchmark('sequence_points')
+def bench_sequence_points(method_count = 200, line_count = 500, lookups = 5000):
+  module = fakedbg.FakeModule(fakedbg.FakeRoundTrips(), "generated", True)
+  doc = fakedbg.FakeSymDocument(r"c:\scripts\generated.py")
+  methods = [fakedbg.generate_symmethod(0x06000001 + i, doc, 1 + i * line_count,
+               line_count) for i in range(method_count)]
+  functions = dict((m, module.GetFunctionFromToken(m.Token.GetToken())) 
+                     for m in methods)
+  rnd = random.Random(42)
+  queries = [(rnd.choice(methods), rnd.randint(0, line_count * 12))
+               for i in range(lookups)]
+
+  #what get_location did per frame before the tables: read the points into
+  #fresh arrays, wrap each one in a sequence_point and scan for the offset
+  def linear():
+    for m, offset in queries:
+      offsets, docs, sls, scs, els, ecs = m.read_sequence_points()
+      prev_sp = None
+      for i in range(len(offsets)):
+        if sls[i] == HIDDEN_LINE:
+          continue
+        sp = sequence_point(offsets[i], docs[i], sls[i], scs[i], els[i], ecs[i])
+        if sp.offset > offset:
+          break
+        prev_sp = sp
+
+  #ipydbg's get_location, which builds each method's table once
+  def indexed():
+    for m, offset in queries:
+      ipydbg.get_location(symbols, functions[m], offset)
+
+  #a process's symbols, as if CorDebug had read the module's
+  symbols = ipydbg.debuggee_symbols()
+  symbols.update_module(module, fakedbg.FakeSymReader(methods))
+  tables = symbols.sequence_point_tables
+  linear_time = best_of(linear)
+  misses = tables.misses
+  indexed_time = best_of(indexed)
+  built = tables.misses - misses
+  return [('linear us/lookup', linear_time * 1e6 / lookups),
+          ('indexed us/lookup', indexed_time * 1e6 / lookups),
+          ('speedup', linear_time / indexed_time),
+          ('tables built', built)]
+
+#--------------------------------------------
+# breakpoint resolution
+
+@benchmark('breakpoint_resolution')
+def bench_breakpoint_resolution(module_count = 100, doc_count = 20, adds = 2000):
+  trips = fakedbg.FakeRoundTrips()
+  modules = []
+  for m in range(module_count):
+    methods = []
+    for d in range(doc_count):
+      doc = fakedbg.FakeSymDocument("/scripts/pkg%d/mod%d.py" % (m, d))
+      methods.append(fakedbg.generate_symmethod(0x06000001 + d, doc, 1, 50))
+    modules.append((fakedbg.FakeModule(trips, "module%d" % m, True), 
+                    fakedbg.FakeSymReader(methods)))
+  rnd = random.Random(42)
+  queries = [("/scripts/pkg%d/mod%d.py" % (rnd.randrange(module_count),
+               rnd.randrange(doc_count)), rnd.randint(1, 50)) for i in range(adds)]
+
+  #what _bp_add did before the index: ask every module's reader for its
+  #documents and compare base names one at a time
+  def scan():
+    for filename, line in queries:
+      name = os.path.basename(filename).lower()
+      for module, reader in modules:
+        found = None
+        for doc in reader.GetDocuments():
+          if os.path.basename(doc.URL).lower() == name:
+            found = doc
+            break
+        if found != None:
+          closest = found.FindClosestLine(line)
+          method = reader.GetMethodFromDocumentPosition(found, closest, 0)
+          table = sequence_point_table(*method.read_sequence_points())
+          table.find_line(found.URL, closest)
+          break
+
+  symbols = ipydbg.debuggee_symbols()
+  def build():
+    for module, reader in modules:
+      symbols.update_module(module, reader)
+
+  #what _set_breakpoint does with ipydbg's index
+  def indexed():
+    for filename, line in queries:
+      for module, doc in ipydbg.find_documents(symbols, filename):
+        ipydbg.create_document_breakpoint(symbols, module, doc, line)
+
+  scan_time = best_of(scan)
+  build_time = best_of(build)
+  indexed_time = best_of(indexed)
+  return [('scan us/add', scan_time * 1e6 / adds),
+          ('index build ms', build_time * 1e3),
+          ('indexed us/add', indexed_time * 1e6 / adds),
+          ('speedup', scan_time / indexed_time)]
+
+#--------------------------------------------
+# tracepoints
+
+@benchmark('tracepoints')
+def bench_tracepoints(hits = 50000):
+  spec = parse_breakpoint_spec("/scripts/loop.py:12 log i=%(i)s total=%(total)s")
+  get_values = lambda names: {'i': 12345, 'total': 67890}
+  filename = tempfile.mktemp(suffix = '.jsonl')
+
+  #a synchronous write and flush of the same JSON line per hit, like 
+  #printing each value from the callback
+  class synchronous_log(object):
+    def __init__(self):
+      self.file = open(filename, 'w')
+    def append(self, location, hit_count, message):
+      self.file.write(json.dumps({'time': time.time(), 'location': location, 
+                                  'hit': hit_count, 'message': message}) + "\n")
+      self.file.flush()
+
+  def synchronous():
+    log = synchronous_log()
+    hit_loop(log)()
+    log.file.close()
+
+  #the callback thread only pays for the hits, the writer thread batches
+  #the file writes; the final flush is timed separately
+  def hit_loop(log):
+    state = breakpoint_state(spec.condition, "/scripts/loop.py:12", log)
+    def f():
+      for i in range(hits):
+        state.hit(get_values)
+    return f
+
+  log = trace_log(filename, flush_interval = 0.1)
+  try:
+    synchronous_time = best_of(synchronous)
+    memory_time = best_of(hit_loop(trace_log()))
+    log.start()
+    hit_time = best_of(hit_loop(log))
+    start = _clock()
+    log.close()
+    close_time = _clock() - start
+  finally:
+    os.remove(filename)
+  return [('synchronous hits/s', hits / synchronous_time),
+          ('in-memory hits/s', hits / memory_time),
+          ('buffered hits/s', hits / hit_time),
+          ('final flush ms', close_time * 1e3),
+          ('records written', log.written),
+          ('waits for the writer', log.waits)]
+
+#--------------------------------------------
+# value inspector
+
+@benchmark('inspector')
+def bench_inspector(count = 100000, pages = 3):
+  lst = fakedbg.generate_list(fakedbg.FakeRoundTrips(), count)
+  data = lst.values[0]
+
+  #reading every element, which is what showing the whole list would take
+  def eager():
+    [data.GetElementAtPosition(i) for i in range(count)]
+
+  inspector = value_inspector(ipydbg.extract_value, ipydbg.display_value,
+                              ipydbg.get_fields, ipydbg.get_elements)
+  def paged():
+    inspector.clear()
+    node = inspector.root('lst', lambda name: lst)
+    for page in range(pages):
+      [child.display() for child in node.children(page)]
+
+  eager_time = best_of(eager)
+  data.reads = 0
+  paged_time = best_of(paged, repeat = 1)
+  return [('eager ms', eager_time * 1e3),
+          ('paged ms', paged_time * 1e3),
+          ('elements read', data.reads)]
+
+#--------------------------------------------
+# locals
+
+#reading the locals at a series of stops in one method with a deep scope
+#tree: walking the scope objects at every stop, the way get_locals used to,
+#against ipydbg's get_locals, which reads them into a scope table at the 
+#first stop. The table is built again for each run, so its time includes
+#reading the whole tree once. Round trips are the debuggee reads and the
+#symbol reader's COM calls, which cost nothing here but don't in ipydbg
+@benchmark('locals')
+def bench_locals(stops = 2000, depth = 6, width = 3):
+  trips = fakedbg.FakeRoundTrips()
+  root, count = fakedbg.generate_scope_tree(trips, depth, width)
+  module = fakedbg.FakeModule(trips, "generated", True)
+  function = module.GetFunctionFromToken(0x06000001)
+  values = range(count)
+  rnd = random.Random(0)
+  frames = [fakedbg.FakeLocalsFrame(trips, rnd.randint(0, root.EndOffset), 
+              values, function) for i in range(stops)]
+
+  def walk(frame, scope, offset = None):
+    for lv in scope.GetLocals():
+      if lv.Name == "$site":
+        continue
+      yield lv.Name, frame.GetLocalVariable(lv.AddressField1)
+    if offset == None: offset = frame.GetIP()[0]
+    for s in scope.GetChildren():
+      if s.StartOffset <= offset and s.EndOffset >= offset:
+        for ret in walk(frame, s, offset): yield ret
+
+  def scope_walk():
+    return [list(walk(frame, root)) for frame in frames]
+
+  def table():
+    symbols.scope_tables.invalidate(module)
+    return [list(ipydbg.get_locals(symbols, frame)) for frame in frames]
+
+  symbols = ipydbg.debuggee_symbols()
+  symbols.update_module(module, fakedbg.FakeSymReader(
+    [fakedbg.FakeSymMethod(0x06000001, [], root)]))
+  walk_time = best_of(scope_walk)
+  trips.count = 0
+  walked = scope_walk()
+  walk_trips = trips.count
+  table_time = best_of(table)
+  trips.count = 0
+  tabled = table()
+  assert walked == tabled
+  return [('scope walk ms', walk_time * 1e3),
+          ('scope walk round trips', walk_trips),
+          ('table ms', table_time * 1e3),
+          ('table round trips', trips.count),
+          ('locals per stop', len(walked[0]))]
+
+#--------------------------------------------
+# headless event stream
+
+@benchmark('event_stream')
+def bench_event_stream(events = 50000):
+  names = ["IronPython.NewTypes.System.Object_%d" % i for i in range(events)]
+  filename = tempfile.mktemp(suffix = '.jsonl')
+
+  def unbuffered():
+    f = open(filename, 'w')
+    writer = event_writer(f, buffer_size = 1)
+    for name in names:
+      writer.emit('OnClassLoad', name = name)
+    f.close()
+
+  def buffered():
+    f = open(filename, 'w')
+    writer = event_writer(f)
+    for name in names:
+      writer.emit('OnClassLoad', name = name)
+    writer.flush()
+    f.close()
+
+  try:
+    unbuffered_time = best_of(unbuffered)
+    buffered_time = best_of(buffered)
+  finally:
+    os.remove(filename)
+  return [('unbuffered events/s', events / unbuffered_time),
+          ('buffered events/s', events / buffered_time)]
+
+#--------------------------------------------
+# debug server
+
+#a loopback client stepping through a fake session. With batching it uses
+#the stack and locals that come in the stopped event; without, it asks for
+#them with a stackTrace and a locals request at every stop
+@benchmark('server')
+def bench_server(stops = 500):
+  events = [dict(event = 'OnStepComplete', line = i,
+                 stack = [dict(function = 'f', line = i)] * 10,
+                 locals = [dict(name = 'x%d' % n, value = str(n), type = 'int')
+                             for n in range(10)])
+              for i in range(stops)]
+
+  def session(batched):
+    backend = fakedbg.FakeBackend(events)
+    backend.server = debug_server(backend, ('127.0.0.1', 0))
+    t = threading.Thread(target = backend.server.serve)
+    t.start()
+    client = socket.create_connection(backend.server.listener.getsockname())
+    state = dict(buf = "", seq = 0, messages = [])
+
+    def receive(done):
+      while True:
+        messages, state['buf'] = decode_messages(state['buf'])
+        state['messages'] += messages
+        while state['messages']:
+          m = state['messages'].pop(0)
+          if done(m):
+            return m
+        state['buf'] += client.recv(65536)
+
+    def request(command):
+      state['seq'] += 1
+      seq = state['seq']
+      client.sendall(encode_message(dict(seq = seq, type = 'request',
+                                         command = command)))
+      return receive(lambda m: m.get('request_seq') == seq)
+
+    stop = receive(lambda m: m.get('event') in ('stopped', 'exited'))
+    while stop['event'] == 'stopped':
+      if not batched:
+        request('stackTrace')
+        request('locals')
+      request('next')
+      stop = receive(lambda m: m.get('event') in ('stopped', 'exited'))
+    client.close()
+    t.join()
+
+  separate_time = best_of(lambda: session(False), repeat = 1)
+  batched_time = best_of(lambda: session(True), repeat = 1)
+  return [('separate stops/s', stops / separate_time),
+          ('batched stops/s', stops / batched_time)]
+
+#--------------------------------------------
+# class loads
+
+_infrastructure_methods = ['TryGetExtraValue', 'TrySetExtraValue', '.cctor',
+  '.ctor', 'CustomSymbolDictionary.GetExtraKeys',
+  'IModuleDictionaryInitialization.InitializeModuleDictionary']
+
+#replays the class loads up to a first breakpoint through the original
+#OnClassLoad logic, which logged every load, and through ipydbg's 
+#OnClassLoad, which doesn't unless asked and batches the JMCStatus updates
+#through the classifier. Round trips are the calls that would go to the
+#debuggee
+@benchmark('class_loads')
+def bench_class_loads(count = 50000):
+  trips = fakedbg.FakeRoundTrips()
+  classes = fakedbg.generate_class_loads(trips, count)
+  out = open(os.devnull, 'w')
+
+  def original():
+    for cls in classes:
+      mt = cls.GetTypeInfo()
+      out.write("OnClassLoad %s\n" % mt.Name)
+      out.flush()
+      if not cls.Module.IsDynamic:
+        cls.JMCStatus = False
+      elif mt.Name.startswith('IronPython.NewTypes'):
+        cls.JMCStatus = False
+      else:
+        cls.JMCStatus = True
+        for mmi in mt.GetMethods():
+          if mmi.Name in _infrastructure_methods:
+            f = cls.Module.GetFunctionFromToken(mmi.MetadataToken)
+            f.JMCStatus = False
+
+  events = [('OnClassLoad', dict(Class = cls)) for cls in classes]
+  def classified():
+    process = fakedbg.FakeProcess(trips)
+    dp = ipydbg.IPyDebugProcess(fakedbg.FakeDebugger(process = process))
+    dp.start("script.py")
+    process.dispatch(events)
+    dp._flush_jmc()
+
+  try:
+    trips.count = 0
+    original_time = best_of(original, repeat = 1)
+    original_trips = trips.count
+    trips.count = 0
+    classified_time = best_of(classified, repeat = 1)
+    classified_trips = trips.count
+  finally:
+    out.close()
+  return [('original ms', original_time * 1e3),
+          ('classified ms', classified_time * 1e3),
+          ('original round trips', original_trips),
+          ('classified round trips', classified_trips)]
+
+#--------------------------------------------
+# attaching
+
+#attaching to a process that already has count classes loaded: each
+#class's JMC status and each dynamic module's symbols worked out as their
+#load events come in, against deferring both and then stopping in one
+#module, which reads just that module's symbols and sets its classes' JMC
+@benchmark('attach')
+def bench_attach(count = 50000, methods = 20):
+  trips = fakedbg.FakeRoundTrips()
+  classes = fakedbg.generate_class_loads(trips, count)
+  modules = []
+  for cls in classes:
+    if cls.Module.IsDynamic and cls.Module not in modules:
+      modules.append(cls.Module)
+  classifier = jmc_classifier(_infrastructure_methods, ['IronPython.NewTypes'])
+
+  def set_jmc(cls, batch):
+    module = cls.Module
+    mt = cls.GetTypeInfo()
+    if not classifier.is_user_type(mt.Name, True):
+      cls.JMCStatus = False
+    else:
+      cls.JMCStatus = True
+      batch.add(module, classifier.infrastructure_tokens(
+        (mmi.Name, mmi.MetadataToken) for mmi in mt.GetMethods()))
+
+  def disable(module, tokens):
+    for token in tokens:
+      module.GetFunctionFromToken(token).JMCStatus = False
+
+  def load_symbols(module):
+    doc = fakedbg.FakeSymDocument(module.Name + ".py")
+    for token in range(methods):
+      trips.count += 1
+      sym = fakedbg.generate_symmethod(token, doc, 1 + 20 * token, 20)
+      sequence_point_table(*sym.read_sequence_points())
+
+  #the load events the runtime replays on attach
+  events = [('OnClassLoad', dict(Class = cls)) for cls in classes] + \
+           [('OnUpdateModuleSymbols', dict(Module = module)) for module in modules]
+
+  def eager():
+    batch = jmc_batch()
+    def on_class_load(sender, e):
+      if e.Class.Module.IsDynamic:
+        set_jmc(e.Class, batch)
+    process = fakedbg.FakeProcess(trips)
+    process.OnClassLoad += on_class_load
+    process.OnUpdateModuleSymbols += lambda sender, e: load_symbols(e.Module)
+    process.dispatch(events)
+    batch.flush(disable)
+
+  def lazy():
+    batch = jmc_batch()
+    jmc = deferred_modules()
+    symbols = deferred_modules()
+    def on_class_load(sender, e):
+      cls = e.Class
+      if cls.Module.IsDynamic:
+        jmc.defer(cls.Module, lambda: set_jmc(cls, batch))
+    def on_update_module_symbols(sender, e):
+      module = e.Module
+      symbols.defer(module, lambda: load_symbols(module), 'symbols')
+    process = fakedbg.FakeProcess(trips)
+    process.OnClassLoad += on_class_load
+    process.OnUpdateModuleSymbols += on_update_module_symbols
+    process.dispatch(events)
+    return jmc, symbols, batch
+
+  trips.count = 0
+  eager_time = best_of(eager, repeat = 1)
+  eager_trips = trips.count
+  trips.count = 0
+  lazy_time = best_of(lazy, repeat = 1)
+  lazy_trips = trips.count
+
+  jmc, symbols, batch = lazy()
+  def first_stop():
+    jmc.realize(modules[0])
+    symbols.realize(modules[0])
+    batch.flush(disable)
+  trips.count = 0
+  first_stop_time = best_of(first_stop, repeat = 1)
+  return [('eager attach ms', eager_time * 1e3),
+          ('eager round trips', eager_trips),
+          ('lazy attach ms', lazy_time * 1e3),
+          ('lazy round trips', lazy_trips),
+          ('first stop ms', first_stop_time * 1e3),
+          ('first stop round trips', trips.count),
+          ('modules waiting', len(symbols))]
+
+#--------------------------------------------
+# console output
+
+#event lines and source listings written the consolecolor way, switching
+#colors around every fragment, against rendering each line to ANSI in one
+#write, and against posting the lines to a background writer, which is all
+#the callback thread pays for. ipydbg's own source listing of a two line 
+#statement is timed rendering to ANSI too
+@benchmark('console')
+def bench_console(lines = 20000):
+  spans = [[("%4d: " % i, 'Cyan'), ("x = ", 'Gray'), ("foo(%d)" % i, 'Yellow'),
+            ("\n", None)] if i % 2 else
+           [("OnClassLoad IronPython.NewTypes.System.Object_%d\n" % i, 'DarkGray')]
+             for i in range(lines)]
+  out = open(os.devnull, 'w')
+  console = fakedbg.FakeConsole(out)
+
+  def switched():
+    for line in spans:
+      for text, color in line:
+        fg, bg = console.ForegroundColor, console.BackgroundColor
+        if color: console.ForegroundColor = color
+        console.Write(text)
+        console.ForegroundColor, console.BackgroundColor = fg, bg
+
+  renderer = console_renderer(console.Write)
+  def rendered():
+    for line in spans:
+      renderer.write(line)
+
+  writer = background_writer(console_renderer(console.Write))
+  def posted():
+    for line in spans:
+      writer.post(line)
+
+  dp = ipydbg.IPyDebugProcess(fakedbg.FakeDebugger())
+  source = source_file("generated.py", 
+    ["    value = compute(%d, 'some generated text')" % i for i in range(50)], 
+    0, 0)
+  sp = sequence_point(0, None, 20, 5, 21, 30)
+  def listed():
+    for i in range(lines // 2):
+      dp._print_source_line(sp, source)
+
+  console_output = ipydbg._console
+  try:
+    console.calls = 0
+    switched_time = best_of(switched, repeat = 1)
+    switched_calls = console.calls
+    console.calls = 0
+    rendered_time = best_of(rendered, repeat = 1)
+    rendered_calls = console.calls
+    ipydbg._console = renderer
+    listed_time = best_of(listed, repeat = 1)
+    writer.start()
+    posted_time = best_of(posted, repeat = 1)
+    start = _clock()
+    writer.close()
+    drain_time = _clock() - start
+  finally:
+    ipydbg._console = console_output
+    out.close()
+  return [('switched lines/s', lines / switched_time),
+          ('switched console calls', switched_calls),
+          ('ansi lines/s', lines / rendered_time),
+          ('ansi console calls', rendered_calls),
+          ('source listing lines/s', lines / listed_time),
+          ('posted lines/s', lines / posted_time),
+          ('background drain ms', drain_time * 1e3),
+          ('writer waits', writer.waits)]
+
+#--------------------------------------------
+# source files
+
+#stops spread over many large generated modules, most of them in a few hot
+#files. Reading every file into a list of lines and keeping them all,
+#against the cache, first with a budget that holds all the files, which
+#only adds a stat per stop, and then with one that only holds a fifth of
+#them, which reads the files that were let go again
+@benchmark('source_cache')
+def bench_source_cache(files = 100, lines = 5000, stops = 2000, budget_files = 20):
+  directory = tempfile.mkdtemp()
+  paths = [os.path.join(directory, "generated%d.py" % i) for i in range(files)]
+  for path in paths:
+    f = open(path, 'w')
+    f.write("".join("value_%d = compute(%d, 'some generated text')\n" % (n, n)
+                      for n in range(lines)))
+    f.close()
+  rnd = random.Random(0)
+  visits = [(rnd.choice(paths[:10]) if rnd.random() < 0.8 else rnd.choice(paths),
+             rnd.randint(1, lines)) for i in range(stops)]
+
+  def eager():
+    loaded = dict()
+    for path, line in visits:
+      if path not in loaded:
+        loaded[path] = read_source_lines(path)
+      loaded[path][line - 1]
+    return sum(source_nbytes(lines) for lines in loaded.values())
+
+  def cached(cache):
+    def f():
+      for path, line in visits:
+        cache.get(path).lines(line, line)
+    return f
+
+  size = source_nbytes(read_source_lines(paths[0]))
+  roomy = source_cache(budget = files * size)
+  tight = source_cache(budget = budget_files * size)
+  try:
+    eager_time = best_of(eager, repeat = 1)
+    eager_bytes = eager()
+    roomy_time = best_of(cached(roomy), repeat = 1)
+    tight_time = best_of(cached(tight), repeat = 1)
+  finally:
+    for path in paths:
+      os.remove(path)
+    os.rmdir(directory)
+  return [('eager ms', eager_time * 1e3),
+          ('eager bytes held', eager_bytes),
+          ('cached ms', roomy_time * 1e3),
+          ('cached bytes held', roomy.bytes),
+          ('tight budget ms', tight_time * 1e3),
+          ('tight bytes held', tight.bytes),
+          ('tight misses', tight.misses),
+          ('tight evictions', tight.evictions)]
+
+#--------------------------------------------
+# expression evaluation
+
+#watches shown after every stop and listed again a few times while stopped.
+#Unmemoized, every display evaluates every watch in a pass of its own; the
+#evaluator evaluates each once per stop, in one pass. Debuggee time is the
+#fake backend's simulated cost per eval, plus the timeout of the watch that
+#hangs
+@benchmark('evaluation')
+def bench_evaluation(stops = 200, displays = 4, cost = 0.002):
+  values = dict(x = 1, y = 2, items = range(10), name = 'ipydbg')
+  watches = ['x', 'items', 'x + y', 'len(items)', 'name.upper()', 'hang()']
+
+  naive_backend = fakedbg.FakeEvalBackend(values, cost)
+  naive = expression_evaluator(naive_backend, timeout = 0.5)
+  def unmemoized():
+    for stop in range(stops):
+      for display in range(displays):
+        for expression in watches:
+          naive.evaluate(expression, stop_snapshot())
+
+  memo_backend = fakedbg.FakeEvalBackend(values, cost)
+  memoized = expression_evaluator(memo_backend, timeout = 0.5)
+  for expression in watches:
+    memoized.add_watch(expression)
+  def batched():
+    for stop in range(stops):
+      snapshot = stop_snapshot()
+      for display in range(displays):
+        memoized.evaluate_watches(snapshot)
+
+  unmemoized_time = best_of(unmemoized, repeat = 1)
+  batched_time = best_of(batched, repeat = 1)
+  return [('unmemoized ms', unmemoized_time * 1e3),
+          ('unmemoized debuggee ms', naive_backend.elapsed * 1e3),
+          ('unmemoized evals', naive_backend.evals),
+          ('unmemoized passes', naive_backend.passes),
+          ('memoized ms', batched_time * 1e3),
+          ('memoized debuggee ms', memo_backend.elapsed * 1e3),
+          ('memoized evals', memo_backend.evals),
+          ('memoized passes', memo_backend.passes),
+          ('timeouts', memoized.timeouts)]
+
+#--------------------------------------------
+# session recording
+
+#records a session with class loads between stops, then seeks to random
+#stops through the index, and through an index rebuilt by scanning the log
+@benchmark('recording')
+def bench_recording(stops = 2000, class_loads = 50, seeks = 1000):
+  directory = tempfile.mkdtemp()
+  path = os.path.join(directory, "session.log")
+  stack = [dict(function = "module::f%d" % i, file = "generated.py", line = i, 
+                offset = 0) for i in range(10)]
+  locals = [dict(name = "x%d" % i, value = str(i), type = 'int') for i in range(10)]
+
+  def record():
+    recorder = session_recorder(path)
+    for stop in range(stops):
+      for i in range(class_loads):
+        recorder.record('OnClassLoad', name = "IronPython.NewTypes.Generated%d" % i)
+      recorder.record('OnBreakpoint', file = "generated.py", line = stop)
+      recorder.record_stop(stack, locals, thread = 1)
+    recorder.record('OnProcessExit')
+    recorder.close()
+
+  rnd = random.Random(0)
+  targets = [rnd.randrange(stops) for i in range(seeks)]
+  def seek(log):
+    for n in targets:
+      log.stop(n)
+
+  try:
+    record_time = best_of(record, repeat = 1)
+    log = session_log(path)
+    index_time = best_of(lambda: len(log), repeat = 1)
+    indexed_time = best_of(lambda: seek(log), repeat = 1)
+    log.close()
+    os.remove(index_path(path))
+    log = session_log(path)
+    rebuild_time = best_of(lambda: len(log), repeat = 1)
+    log.close()
+    size = os.path.getsize(path)
+  finally:
+    for p in (path, index_path(path)):
+      if os.path.exists(p):
+        os.remove(p)
+    os.rmdir(directory)
+  events = stops * (class_loads + 2) + 1
+  return [('recorded events/s', events / record_time),
+          ('log bytes', size),
+          ('open with index ms', index_time * 1e3),
+          ('seek us', indexed_time / seeks * 1e6),
+          ('rebuild index ms', rebuild_time * 1e3)]
+
+#--------------------------------------------
+# symbol store
+
+#startup up to the first breakpoint being bound: index the module's
+#documents and resolve a line. Without the store that's all there is, over
+#the reader CorDebug builds (which this doesn't measure). A cold run also
+#scans and encodes every method's symbols in the callback, and queues the 
+#file to be written on the store's own thread; the write is timed 
+#separately. A warm run loads the store's index, and then only the method
+#the breakpoint is in
+@benchmark('symbol_store')
+def bench_symbol_store(docs = 20, methods = 100, lines = 20):
+  documents = [fakedbg.FakeSymDocument("generated%d.py" % d) for d in range(docs)]
+  symmethods = [fakedbg.generate_symmethod(d * methods + m, doc, m * lines + 1, lines)
+                  for d, doc in enumerate(documents) for m in range(methods)]
+  reader = fakedbg.FakeSymReader(symmethods)
+  directory = tempfile.mkdtemp()
+  store = symbol_store(directory)
+  read = lambda m: m.read_sequence_points()
+
+  def first_breakpoint(reader):
+    index = symbol_index(sequence_point_cache(), read)
+    index.update_module('module', reader)
+    module, doc = index.find_documents("generated%d.py" % (docs // 2))[0]
+    return index.resolve_line(module, doc, methods * lines // 2)
+
+  def read_symbols():
+    return ([(m.Token.GetToken(), m.read_sequence_points(), None)
+               for m in symmethods],
+            lambda doc, line: 
+              reader.GetMethodFromDocumentPosition(doc, line, 0).Token.GetToken())
+
+  def cold():
+    store.save_in_background('key', encode_symbols(*read_symbols()))
+    return first_breakpoint(reader)
+
+  encoded = encode_symbols(*read_symbols())
+  def write():
+    store.write('key', encoded)
+
+  def warm():
+    return first_breakpoint(store.load('key'))
+
+  try:
+    uncached_time = best_of(lambda: first_breakpoint(reader))
+    cold_time = best_of(cold)
+    store.join()
+    write_time = best_of(write)
+    warm_time = best_of(warm)
+    cached = store.load('key')
+    first_breakpoint(cached)
+    size = os.path.getsize(store.path('key'))
+  finally:
+    for name in os.listdir(directory):
+      os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+  return [('methods', len(symmethods)),
+          ('uncached ms', uncached_time * 1e3),
+          ('cold ms', cold_time * 1e3),
+          ('background write ms', write_time * 1e3),
+          ('warm ms', warm_time * 1e3),
+          ('warm methods loaded', cached.loads),
+          ('store bytes', size)]
+
+#--------------------------------------------
+# stepping
+
+#steps through a long function a few times, as stepping through a loop
+#body does. Some statements make calls, which the step stops on and has to
+#step over again. Stepping a line at a time from the console is a round
+#trip per line and works out a step range per step; stepping the lines in
+#one request is one round trip, with the ranges cached by offset
+@benchmark('stepping')
+def bench_stepping(lines = 200, passes = 20, call_ratio = 0.3):
+  doc = fakedbg.FakeSymDocument("generated.py")
+  sym = fakedbg.generate_symmethod(1, doc, 1, lines)
+  table = sequence_point_table(*sym.read_sequence_points())
+  rnd = random.Random(0)
+  calls = set(i for i in range(len(table)) if rnd.random() < call_ratio)
+
+  def step_range(offset):
+    next_offset = table.next_offset(offset)
+    return (offset, next_offset if next_offset != None else 1 << 16)
+
+  #the stops a step over each line makes: a call stop, then the line
+  def stops():
+    for p in range(passes):
+      for i in range(len(table)):
+        if i in calls:
+          yield True, table.offsets[i]
+        yield False, table.offsets[i]
+
+  def single_steps():
+    round_trips = ranges = 0
+    for into_call, offset in stops():
+      step_range(offset)
+      ranges += 1
+      if not into_call:
+        round_trips += 1
+    return round_trips, ranges
+
+  cache = step_range_cache()
+  def step_requests():
+    round_trips = 0
+    request = step_request('over', len(table))
+    for into_call, offset in stops():
+      cache.lookup(None, 1, offset, lambda: step_range(offset))
+      if not request.step_again(into_call, True):
+        round_trips += 1
+        request = step_request('over', len(table))
+    return round_trips, request
+
+  single_time = best_of(single_steps, repeat = 1)
+  single_round_trips, single_ranges = single_steps()
+  requests_time = best_of(step_requests, repeat = 1)
+  cache = step_range_cache()
+  request_round_trips, request = step_requests()
+  return [('single round trips', single_round_trips),
+          ('single ranges', single_ranges),
+          ('single ms', single_time * 1e3),
+          ('request round trips', request_round_trips),
+          ('request ranges', cache.misses),
+          ('request ms', requests_time * 1e3)]
+
+#--------------------------------------------
+# line coverage
+
+#a run that keeps executing a small hot set of lines, as loops do. Every
+#execution of an instrumented line costs a breakpoint callback while its
+#breakpoints are active; one shot breakpoints stop costing anything once
+#their line has run
+@benchmark('coverage')
+def bench_coverage(docs = 20, methods = 20, lines = 25, executions = 500000):
+  coverage = line_coverage()
+  tables = []
+  for d in range(docs):
+    doc = fakedbg.FakeSymDocument("generated%d.py" % d)
+    for m in range(methods):
+      sym = fakedbg.generate_symmethod(m, doc, m * lines + 1, lines)
+      tables.append((d, sequence_point_table(*sym.read_sequence_points())))
+
+  active = set()
+  def instrument():
+    for d, table in tables:
+      for i in range(len(table)):
+        bp = (d, table.offsets[i], table.start_lines[i])
+        if coverage.add_breakpoint(bp, table.docs[i].URL, table.start_lines[i]):
+          active.add(bp)
+
+  rnd = random.Random(0)
+  hot = [rnd.choice(tables) for i in range(20)]
+  cold = [rnd.choice(tables) for i in range(200)]
+  trace = []
+  for i in range(executions):
+    d, table = rnd.choice(hot) if rnd.random() < 0.95 else rnd.choice(cold)
+    i = rnd.randrange(len(table))
+    trace.append((d, table.offsets[i], table.start_lines[i]))
+
+  def run():
+    callbacks = 0
+    for bp in trace:
+      if bp in active:
+        callbacks += 1
+        for done in coverage.hit(bp):
+          active.discard(done)
+    return callbacks
+
+  instrument_time = best_of(instrument, repeat = 1)
+  breakpoints = len(active)
+  run_time = best_of(run, repeat = 1)
+  found, hit = coverage.totals()
+  return [('breakpoints', breakpoints),
+          ('instrument ms', instrument_time * 1e3),
+          ('line executions', executions),
+          ('persistent callbacks', executions),
+          ('one shot callbacks', coverage.hits),
+          ('run ms', run_time * 1e3),
+          ('lines covered', hit),
+          ('lines found', found),
+          ('bitmap bytes', coverage.nbytes())]
+
+#--------------------------------------------
+# instrumentation
+
+#the cost of timing a call, against the same call unwrapped, which is what
+#everything costs with instrumentation off
+@benchmark('instrumentation')
+def bench_instrumentation(calls = 200000):
+  def helper(x):
+    return x + 1
+  def generator(n):
+    for i in range(n):
+      yield i
+
+  stats = instrumentation()
+  timed = stats.wrap(helper, 'helper')
+  timed_generator = stats.wrap_generator(generator, 'generator')
+
+  def plain_calls():
+    for i in xrange(calls):
+      helper(i)
+  def timed_calls():
+    for i in xrange(calls):
+      timed(i)
+  def timed_generators():
+    for i in xrange(calls // 10):
+      for x in timed_generator(10):
+        pass
+
+  plain_time = best_of(plain_calls)
+  timed_time = best_of(timed_calls)
+  generator_time = best_of(timed_generators)
+  summary = dict(stats.summary())['helper']
+  return [('plain call ns', plain_time / calls * 1e9),
+          ('timed call ns', timed_time / calls * 1e9),
+          ('timed generator ns', generator_time / (calls // 10) * 1e9),
+          ('histogram buckets', len(stats.histograms['helper'].counts)),
+          ('p50 us', summary['p50_us']),
+          ('p99 us', summary['p99_us'])]
+
+#--------------------------------------------
+# sampling profiler
+
+@benchmark('profiler')
+def bench_profiler(samples = 20000, threads = 4):
+  stacks = list(fakedbg.generate_stacks(samples * threads))
+  profile = sample_profile()
+
+  def aggregate():
+    for i in range(0, len(stacks), threads):
+      profile.add_sample(stacks[i:i + threads], 0.0)
+
+  aggregate_time = best_of(aggregate, repeat = 1)
+  collapsed_time = best_of(profile.collapsed, repeat = 1)
+  return [('samples/s', samples / aggregate_time),
+          ('collapsed stacks', len(profile.collapsed_counts)),
+          ('collapse ms', collapsed_time * 1e3)]
+
+#--------------------------------------------
+# heap summaries
+
+#walking a heap from a stop's roots, once to the end and once within the
+#default object budget, then a second stop after the heap has grown. Every
+#value read is a round trip; the visited set keeps that to the values the
+#reachable objects refer to
+@benchmark('heap_walk')
+def bench_heap_walk(objects = 100000, roots = 20):
+  trips = fakedbg.FakeRoundTrips()
+  heap = fakedbg.generate_heap(objects)
+  inspect = fakedbg.fake_heap_inspect(trips)
+
+  full = heap_walker(inspect, max_objects = objects * 2, max_seconds = 600)
+  full_time = best_of(lambda: full.walk(heap[:roots]), repeat = 1)
+  trips.count = 0
+  first = full.walk(heap[:roots])
+  full_trips = trips.count
+
+  budgeted = heap_walker(inspect)
+  budgeted_time = best_of(lambda: budgeted.walk(heap[:roots]), repeat = 1)
+  partial = budgeted.walk(heap[:roots])
+
+  grown = heap + fakedbg.generate_heap(objects // 10, seed = 1)
+  for obj in grown[objects:]:
+    obj.address += 64 * objects
+    heap[0].references.append(obj)
+  second = full.walk(grown[:roots])
+  diff_time = best_of(lambda: second.diff(first))
+  return [('reachable objects', first.objects),
+          ('values read', full_trips),
+          ('full walk ms', full_time * 1e3),
+          ('objects/s', first.objects / full_time),
+          ('budgeted objects', partial.objects),
+          ('budgeted walk ms', budgeted_time * 1e3),
+          ('types changed', len(second.diff(first))),
+          ('diff us', diff_time * 1e6)]
+
+#--------------------------------------------
+# thread stacks
+
+#a dump of a service's threads, mostly parked in the same few stacks. Each
+#thread resolving its own frames describes every frame on every thread;
+#a resolver shared by all of them describes each distinct frame once
+@benchmark('thread_dump')
+def bench_thread_dump(threads = 500):
+  trips = fakedbg.FakeRoundTrips()
+  process = fakedbg.FakeProcess(trips, fakedbg.generate_threads(trips, threads))
+  process_threads = process.Threads
+  describe = fakedbg.fake_describe_frame(trips)
+  def frames(thread):
+    for chain in thread.Chains:
+      for f in chain.Frames:
+        yield f
+
+  def per_thread():
+    dump = []
+    for thread in process_threads:
+      resolver = frame_resolver(ipydbg.get_frame_key, describe)
+      dump.append((thread.Id, resolver.stack(frames(thread))))
+    return group_stacks(dump)
+
+  def shared():
+    resolver = frame_resolver(ipydbg.get_frame_key, describe)
+    return group_stacks(dump_threads(process_threads, frames, resolver))
+
+  per_thread_time = best_of(per_thread)
+  trips.count = 0
+  per_thread()
+  per_thread_trips = trips.count
+  shared_time = best_of(shared)
+  trips.count = 0
+  groups = shared()
+  return [('per thread round trips', per_thread_trips),
+          ('per thread ms', per_thread_time * 1e3),
+          ('shared round trips', trips.count),
+          ('shared ms', shared_time * 1e3),
+          ('stack groups', len(groups)),
+          ('largest group', len(groups[0][1]))]
+
+#--------------------------------------------
+
+#results are saved as JSON with where they were run, so runs on different
+#days or machines can be compared
+def save_results(filename, results):
+  f = open(filename, 'w')
+  try:
+    json.dump(dict(time = time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   python = sys.version, platform = platform.platform(),
+                   results = results), f, indent = 2, sort_keys = True)
+    f.write("\n")
+  finally:
+    f.close()
+
+#{benchmark: {key: value}}
+def load_results(filename):
+  f = open(filename)
+  try:
+    results = json.load(f)['results']
+  finally:
+    f.close()
+  return dict((name, dict(values)) for name, values in results.items())
+
+#runs the named benchmarks, or all of them, printing each value and how it
+#changed from the baseline's. Returns {benchmark: [[key, value], ...]}
+def run(names = None, baseline = None):
+  results = dict()
+  for name, f in _benchmarks:
+    if names and name not in names:
+      continue
+    print name
+    values = results[name] = []
+    before = baseline.get(name, dict()) if baseline != None else dict()
+    for key, value in f():
+      values.append([key, value])
+      fmt = "  %-24s %12.3f" if isinstance(value, float) else "  %-24s %12d"
+      line = fmt % (key, value)
+      if before.get(key):
+        line += " %+8.1f%%" % ((value - before[key]) * 100.0 / before[key])
+      print line
+  return results
+
+if __name__ == "__main__":
+  from optparse import OptionParser
+  parser = OptionParser(usage = "%prog [options] [benchmark names]")
+  parser.add_option("-o", "--output", dest = "output_file",
+    help = "save the results to this file as JSON")
+  parser.add_option("-c", "--compare", dest = "baseline_file",
+    help = "show how each value changed from the results saved in this file")
+  parser.add_option("-l", "--list", dest = "list", action = "store_true",
+    default = False, help = "list the benchmarks")
+  options, args = parser.parse_args()
+  if options.list:
+    for name, f in _benchmarks:
+      print name
+    sys.exit(0)
+  baseline = load_results(options.baseline_file) \
+    if options.baseline_file != None else None
+  results = run(args, baseline)
+  if options.output_file != None:
+    save_results(options.output_file, results)
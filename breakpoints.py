@@ -0,0 +1,162 @@
+import os.path
+import re
+
+from symcache import normalize_path
+
+#--------------------------------------------
+# breakpoint specs
+
+class breakpoint_spec(object):
+  def __init__(self, filename, line, condition = None):
+    self.filename = filename
+    self.line = line
+    self.condition = condition
+
+  def __str__(self):
+    if self.condition == None:
+      return "%s:%d" % (self.filename, self.line)
+    return "%s:%d %s" % (self.filename, self.line, self.condition)
+
+#file:line, optionally followed by a condition. The file name ends at the
+#first colon followed by a line number, so drive letters and colons inside
+#the condition don't get in the way
+_spec_re = re.compile(r"^(.+?):(\d+)(?:\s+(.*))?$")
+
+def parse_breakpoint_spec(text):
+  m = _spec_re.match(text.strip())
+  if m == None: raise Exception, "Expected file:line [condition]"
+  filename, line, condition = m.groups()
+  if condition:
+    condition = tracepoint(condition) if condition.startswith('log ') \
+      else breakpoint_condition(condition)
+  return breakpoint_spec(filename.strip(), int(line), condition or None)
+
+#reads one file:line [condition|log format] spec per line, skipping blank lines and # comments
+def load_breakpoint_specs(filename):
+  specs = []
+  f = open(filename)
+  try:
+    for n, text in enumerate(f):
+      text = text.strip()
+      if not text or text.startswith('#'):
+        continue
+      try:
+        specs.append(parse_breakpoint_spec(text))
+      except Exception, msg:
+        raise Exception, "%s(%d): %s" % (filename, n + 1, msg)
+  finally:
+    f.close()
+  return specs
+
+#--------------------------------------------
+# breakpoint conditions
+
+#  every N      - break on every Nth hit
+#  if <expr>    - break when the python expression is true. It can use
+#                 hit_count and the frame's locals and arguments
+class breakpoint_condition(object):
+  def __init__(self, text):
+    self.text = text.strip()
+    self.every = None
+    self.code = None
+    self.names = ()
+
+    if self.text.startswith('every '):
+      self.every = int(self.text[6:])
+      if self.every < 1: raise Exception, "every needs a positive hit count"
+    elif self.text.startswith('if '):
+      self.code = compile(self.text[3:].strip(), "<condition>", "eval")
+      #only the names the expression mentions get fetched from the frame,
+      #so a pure hit_count test never touches the debuggee
+      self.names = frozenset(self.code.co_names) - frozenset(['hit_count'])
+    else:
+      raise Exception, "Conditions start with 'if' or 'every'"
+
+  #get_values(names) returns a dict of the frame values with those names
+  def __call__(self, hit_count, get_values):
+    if self.every != None:
+      return hit_count % self.every == 0
+    values = get_values(self.names) if self.names else dict()
+    values['hit_count'] = hit_count
+    return bool(eval(self.code, dict(), values))
+
+  def __str__(self):
+    return self.text
+
+#  log <format> - never break, record the format string filled in with
+#                 %(name)s references to hit_count, locals and arguments
+class tracepoint(object):
+  def __init__(self, text):
+    self.text = text.strip()
+    self.format = self.text[4:].strip()
+    self.names = frozenset(re.findall(r"%\((\w+)\)", self.format)) \
+      - frozenset(['hit_count'])
+
+  def __call__(self, hit_count, get_values):
+    values = get_values(self.names) if self.names else dict()
+    values['hit_count'] = hit_count
+    for name in self.names:
+      values.setdefault(name, '<undefined>')
+    return self.format % values
+
+  def __str__(self):
+    return self.text
+
+#per breakpoint bookkeeping: hits are counted whether or not the
+#condition lets the breakpoint stop the process
+class breakpoint_state(object):
+  def __init__(self, condition = None, location = None, trace_log = None):
+    self.condition = condition
+    self.location = location
+    self.trace_log = trace_log
+    self.hit_count = 0
+
+  #counts the hit and returns whether the debugger should stop for it
+  def hit(self, get_values):
+    self.hit_count += 1
+    if self.condition == None:
+      return True
+    if isinstance(self.condition, tracepoint):
+      self.trace_log.append(self.location, self.hit_count,
+                            self.condition(self.hit_count, get_values))
+      return False
+    return self.condition(self.hit_count, get_values)
+
+#--------------------------------------------
+# pending breakpoints
+
+#breakpoints whose file hasn't been loaded yet, keyed by normalized full
+#path, or by base name for specs that don't name a directory
+class pending_breakpoints(object):
+  def __init__(self):
+    self._paths = dict()
+    self._names = dict()
+
+  def add(self, spec):
+    if os.path.dirname(spec.filename):
+      d, key = self._paths, normalize_path(spec.filename)
+    else:
+      d, key = self._names, os.path.normcase(spec.filename)
+    d.setdefault(key, []).append(spec)
+
+  #removes and returns the (spec, document) pairs for the specs that name
+  #one of the module's documents
+  def take_module_matches(self, index, module):
+    matches = []
+    if not (self._paths or self._names):
+      return matches
+    for path, doc in index.module_documents(module):
+      for spec in self._paths.pop(path, []):
+        matches.append((spec, doc))
+      for spec in self._names.pop(os.path.basename(path), []):
+        matches.append((spec, doc))
+    return matches
+
+  def __iter__(self):
+    for d in (self._paths, self._names):
+      for specs in d.values():
+        for spec in specs:
+          yield spec
+
+  def __len__(self):
+    return sum(len(specs) for d in (self._paths, self._names) for specs in d.values())
@@ -0,0 +1,56 @@
+#--------------------------------------------
+# .NET and CorDebug names
+
+#the names ipydbg and consolecolor use from System and the CorDebug
+#wrapper. Under IronPython they're the real ones. Anywhere else, or with
+#IPYDBG_FAKES set, they're fakedbg's stand-ins, so ipydbg's own functions
+#can be run against the fakes by the tests
+import os
+import sys
+
+if sys.platform == 'cli' and not os.environ.get('IPYDBG_FAKES'):
+  import clr
+  clr.AddReference('CorDebug')
+
+  from System import Array, Console, ConsoleKey, ConsoleModifiers, ConsoleColor
+  from System import Enum, Byte, UInt32, IntPtr, BitConverter
+  from System.IO import Path, File
+  from System.Reflection import Assembly, BindingFlags
+  from System.Threading import WaitHandle, AutoResetEvent
+  from System.Threading import Thread, ApartmentState, ThreadStart
+  from System.Diagnostics import Stopwatch
+  from System.Diagnostics.SymbolStore import ISymbolDocument, SymbolToken
+  from System.Security.Cryptography import SHA1
+  from Microsoft.Samples.Debugging.CorDebug import (CorDebugger, CorFrameType,
+    CorValue, CorObjectValue, CorArrayValue)
+  from Microsoft.Samples.Debugging.CorDebug.NativeApi import \
+    CorDebugUnmappedStop, COR_DEBUG_STEP_RANGE, CorDebugStepReason, \
+    CorDebugExceptionCallbackType, CorDebugHandleType
+  from Microsoft.Samples.Debugging.CorMetadata import CorMetadataImport
+  from Microsoft.Samples.Debugging.CorDebug.NativeApi.CorElementType import *
+
+  #the .NET type name of a value extract_value returned
+  def clr_type_name(value):
+    return value.GetType().FullName
+else:
+  from fakedbg import Array, Console, ConsoleKey, ConsoleModifiers, ConsoleColor
+  from fakedbg import Enum, Byte, UInt32, IntPtr, BitConverter
+  from fakedbg import Path, File
+  from fakedbg import Assembly, BindingFlags
+  from fakedbg import WaitHandle, AutoResetEvent
+  from fakedbg import Thread, ApartmentState, ThreadStart
+  from fakedbg import Stopwatch
+  from fakedbg import ISymbolDocument, SymbolToken
+  from fakedbg import SHA1
+  from fakedbg import (CorDebugger, CorFrameType, CorValue, CorObjectValue,
+    CorArrayValue)
+  from fakedbg import CorDebugUnmappedStop, COR_DEBUG_STEP_RANGE, \
+    CorDebugStepReason, CorDebugExceptionCallbackType, CorDebugHandleType
+  from fakedbg import CorMetadataImport
+  from fakedbg import ELEMENT_TYPE_ARRAY, ELEMENT_TYPE_BOOLEAN, \
+    ELEMENT_TYPE_CHAR, ELEMENT_TYPE_CLASS, ELEMENT_TYPE_I, ELEMENT_TYPE_I1, \
+    ELEMENT_TYPE_I2, ELEMENT_TYPE_I4, ELEMENT_TYPE_I8, ELEMENT_TYPE_OBJECT, \
+    ELEMENT_TYPE_R4, ELEMENT_TYPE_R8, ELEMENT_TYPE_STRING, \
+    ELEMENT_TYPE_SZARRAY, ELEMENT_TYPE_U, ELEMENT_TYPE_U1, ELEMENT_TYPE_U2, \
+    ELEMENT_TYPE_U4, ELEMENT_TYPE_U8, ELEMENT_TYPE_VALUETYPE
+  from fakedbg import clr_type_name
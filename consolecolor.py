@@ -1,4 +1,10 @@
-from System import Console as _Console
+import threading
+from clrnames import Console as _Console
+
+#the console's colors are shared by every thread writing to it, so 
+#whatever sets them holds this until it puts them back. Anything written 
+#uncolored while another thread has a color set should hold it too
+console_lock = threading.RLock()
 
 class ConsoleColorMgr(object):
   def __init__(self, foreground = None, background = None):
@@ -6,6 +12,7 @@ class ConsoleColorMgr(object):
     self.background = background
 
   def __enter__(self):  
+    console_lock.acquire()
     self._tempFG = _Console.ForegroundColor  
     self._tempBG = _Console.BackgroundColor
     
@@ -13,13 +20,16 @@ class ConsoleColorMgr(object):
     if self.background: _Console.BackgroundColor = self.background
       
   def __exit__(self, t, v, tr):  
-    _Console.ForegroundColor = self._tempFG 
-    _Console.BackgroundColor = self._tempBG 
+    try:
+      _Console.ForegroundColor = self._tempFG 
+      _Console.BackgroundColor = self._tempBG 
+    finally:
+      console_lock.release()
 
 import sys    
 _curmodule = sys.modules[__name__]
 
-from System import ConsoleColor, Enum
+from clrnames import ConsoleColor, Enum
 for n in Enum.GetNames(ConsoleColor):
   setattr(_curmodule, n, ConsoleColorMgr(Enum.Parse(ConsoleColor, n)))
   
@@ -0,0 +1,339 @@
+from __future__ import with_statement
+
+from collections import deque
+import json
+import os
+import select
+import socket
+import threading
+
+#--------------------------------------------
+# message framing
+
+#messages are framed like the debug adapter protocol: a Content-Length
+#header, a blank line and a JSON body
+def encode_message(msg):
+  body = json.dumps(msg)
+  return "Content-Length: %d\r\n\r\n%s" % (len(body), body)
+
+#splits the complete messages off the front of buf, returning them and
+#whatever is left over
+def decode_messages(buf):
+  messages = []
+  while True:
+    header_end = buf.find("\r\n\r\n")
+    if header_end < 0:
+      break
+    length = None
+    for line in buf[:header_end].split("\r\n"):
+      name, sep, value = line.partition(":")
+      if name.strip().lower() == "content-length":
+        length = int(value)
+    if length == None:
+      raise Exception, "Message without a Content-Length header"
+    start = header_end + 4
+    if len(buf) < start + length:
+      break
+    messages.append(json.loads(buf[start:start + length]))
+    buf = buf[start + length:]
+  return messages, buf
+
+#host:port, :port or port for TCP on the loopback interface by default,
+#anything else is the path of a unix socket
+def parse_address(text):
+  host, sep, port = text.rpartition(":")
+  if port.isdigit():
+    return (host or "127.0.0.1", int(port))
+  return text
+
+def _listen(address):
+  if isinstance(address, tuple):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  else:
+    if os.path.exists(address):
+      os.remove(address)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  sock.bind(address)
+  sock.listen(5)
+  sock.setblocking(0)
+  return sock
+
+#a connected pair of sockets, for waking the event loop up from other
+#threads. socket.socketpair doesn't exist everywhere, so use loopback TCP
+def _socket_pair():
+  listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  listener.bind(("127.0.0.1", 0))
+  listener.listen(1)
+  writer = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  writer.connect(listener.getsockname())
+  reader, address = listener.accept()
+  listener.close()
+  reader.setblocking(0)
+  return reader, writer
+
+class _client(object):
+  def __init__(self, sock):
+    self.sock = sock
+    self.inbuf = ""
+    self.outbuf = ""
+    self.closing = False
+
+  def fileno(self):
+    return self.sock.fileno()
+
+#--------------------------------------------
+# debug server
+
+def _request(cmddict, name):
+  def deco(f):
+    cmddict[name] = f
+    return f
+  return deco
+
+#serves one debug session to any number of clients. All the socket I/O
+#and every call into the backend happens on the thread running serve();
+#the CorDebug callback threads only queue events with post, post_stop and
+#post_exit, which wake the loop up. Every client sees every event, and
+#any client can drive the session.
+#
+#When the debuggee stops, the stack and locals are read once and sent to
+#all clients inside the stopped event, so nobody needs a round trip for
+#them. A client that connects while the debuggee is stopped is sent the
+#stopped event straight away
+class debug_server(object):
+  def __init__(self, backend, address):
+    self.backend = backend
+    self.address = address
+    self.listener = _listen(address)
+    self.clients = []
+    self.stopped = False
+    self.exited = False
+    self._seq = 0
+    self._last_stop = None
+    self._events = deque()
+    self._lock = threading.Lock()
+    self._wakeup_reader, self._wakeup_writer = _socket_pair()
+
+  #called from the callback threads
+  def post(self, event, **body):
+    self._post(('event', event, body))
+
+  def post_stop(self, **body):
+    self._post(('stop', None, body))
+
+  def post_exit(self):
+    self._post(('exit', None, None))
+
+  def _post(self, item):
+    with self._lock:
+      self._events.append(item)
+    try:
+      self._wakeup_writer.send("x")
+    except socket.error:
+      pass
+
+  def serve(self):
+    self._resume()
+    while not self.exited or [c for c in self.clients if c.outbuf]:
+      readers = [self.listener, self._wakeup_reader] + self.clients
+      writers = [c for c in self.clients if c.outbuf]
+      readable, writable, errors = select.select(readers, writers, [])
+
+      for r in readable:
+        if r is self.listener:
+          self._accept()
+        elif r is self._wakeup_reader:
+          try:
+            self._wakeup_reader.recv(4096)
+          except socket.error:
+            pass
+        else:
+          self._read(r)
+      self._dispatch_events()
+      for c in writable:
+        self._write(c)
+    self.close()
+
+  def close(self):
+    for c in list(self.clients):
+      self._close_client(c)
+    self.listener.close()
+    self._wakeup_reader.close()
+    self._wakeup_writer.close()
+    if not isinstance(self.address, tuple) and os.path.exists(self.address):
+      os.remove(self.address)
+
+  def _accept(self):
+    try:
+      sock, address = self.listener.accept()
+    except socket.error:
+      return
+    sock.setblocking(0)
+    c = _client(sock)
+    self.clients.append(c)
+    if self._last_stop != None:
+      c.outbuf += self._last_stop
+
+  def _read(self, c):
+    try:
+      data = c.sock.recv(65536)
+    except socket.error:
+      data = ""
+    if not data:
+      self._close_client(c)
+      return
+    try:
+      messages, c.inbuf = decode_messages(c.inbuf + data)
+    except Exception, ex:
+      self._send(c, self._event('error', message = str(ex)))
+      c.inbuf = ""
+      return
+    for msg in messages:
+      self._handle_request(c, msg)
+
+  def _write(self, c):
+    if c not in self.clients:
+      return
+    try:
+      sent = c.sock.send(c.outbuf)
+    except socket.error:
+      self._close_client(c)
+      return
+    c.outbuf = c.outbuf[sent:]
+    if c.closing and not c.outbuf:
+      self._close_client(c)
+
+  def _close_client(self, c):
+    if c in self.clients:
+      self.clients.remove(c)
+    try:
+      c.sock.close()
+    except socket.error:
+      pass
+
+  def _next_seq(self):
+    self._seq += 1
+    return self._seq
+
+  def _event(self, event, **body):
+    return encode_message(dict(seq = self._next_seq(), type = 'event',
+                               event = event, body = body))
+
+  def _send(self, c, data):
+    c.outbuf += data
+
+  def _broadcast(self, data):
+    for c in self.clients:
+      c.outbuf += data
+
+  def _dispatch_events(self):
+    with self._lock:
+      items = list(self._events)
+      self._events.clear()
+
+    for kind, event, body in items:
+      if kind == 'event':
+        self._broadcast(self._event(event, **body))
+      elif kind == 'stop':
+        self.stopped = True
+        body['stack'] = self.backend.get_stack()
+        body['locals'] = self.backend.get_locals()
+        self._last_stop = self._event('stopped', **body)
+        self._broadcast(self._last_stop)
+      elif kind == 'exit':
+        self.exited = True
+        self.stopped = False
+        self._last_stop = None
+        self._broadcast(self._event('exited'))
+
+  def _resume(self):
+    self.stopped = False
+    self._last_stop = None
+    self.backend.resume()
+
+  def _handle_request(self, c, msg):
+    command = msg.get('command')
+    response = dict(seq = self._next_seq(), type = 'response',
+                    request_seq = msg.get('seq'), command = command)
+    try:
+      if command not in debug_server._requests:
+        raise Exception, "Unknown command %s" % command
+      body = debug_server._requests[command](self, c, msg.get('arguments') or dict())
+      response.update(success = True, body = body or dict())
+    except Exception, ex:
+      response.update(success = False, message = str(ex))
+    self._send(c, encode_message(response))
+
+  def _check_stopped(self):
+    if not self.stopped:
+      raise Exception, "The debuggee is not stopped"
+
+  _requests = dict()
+
+  @_request(_requests, 'initialize')
+  def _initialize_req(self, c, args):
+    return dict(stopped = self.stopped, clients = len(self.clients))
+
+  @_request(_requests, 'continue')
+  def _continue_req(self, c, args):
+    self._check_stopped()
+    self._resume()
+
+  @_request(_requests, 'next')
+  def _next_req(self, c, args):
+    self._check_stopped()
+    self.backend.step('over')
+    self._resume()
+
+  @_request(_requests, 'stepIn')
+  def _step_in_req(self, c, args):
+    self._check_stopped()
+    self.backend.step('in')
+    self._resume()
+
+  @_request(_requests, 'stepOut')
+  def _step_out_req(self, c, args):
+    self._check_stopped()
+    self.backend.step('out')
+    self._resume()
+
+  @_request(_requests, 'setBreakpoint')
+  def _set_breakpoint_req(self, c, args):
+    self._check_stopped()
+    return dict(result = self.backend.add_breakpoint(args['spec']))
+
+  @_request(_requests, 'stackTrace')
+  def _stack_trace_req(self, c, args):
+    self._check_stopped()
+    return dict(frames = self.backend.get_stack())
+
+  @_request(_requests, 'locals')
+  def _locals_req(self, c, args):
+    self._check_stopped()
+    return dict(locals = self.backend.get_locals())
+
+  #stack and locals in one reply
+  @_request(_requests, 'snapshot')
+  def _snapshot_req(self, c, args):
+    self._check_stopped()
+    return dict(stack = self.backend.get_stack(), locals = self.backend.get_locals())
+
+  @_request(_requests, 'threads')
+  def _threads_req(self, c, args):
+    self._check_stopped()
+    return dict(threads = self.backend.get_threads())
+
+  @_request(_requests, 'stats')
+  def _stats_req(self, c, args):
+    return dict(stats = self.backend.get_stats())
+
+  @_request(_requests, 'terminate')
+  def _terminate_req(self, c, args):
+    self._check_stopped()
+    self.backend.quit()
+    self._resume()
+
+  @_request(_requests, 'disconnect')
+  def _disconnect_req(self, c, args):
+    c.closing = True
@@ -0,0 +1,119 @@
+from StringIO import StringIO
+import keyword
+import tokenize
+
+#--------------------------------------------
+# expression evaluation
+
+class eval_error(Exception):
+  pass
+
+class eval_timeout(eval_error):
+  pass
+
+#how expressions get evaluated in a stopped debuggee. ipydbg implements it
+#over CorEval, fakedbg over a dict of values
+class eval_backend(object):
+  #the (display, type name) of an expression that can be answered without
+  #running the debuggee, like a path to a local's field, otherwise None.
+  #Raises eval_error if the expression can't be evaluated at all
+  def lookup(self, expression):
+    raise NotImplementedError
+
+  #(display, type name) of the expression, running the debuggee to get it.
+  #Raises eval_timeout if it takes longer than timeout seconds, and
+  #eval_error if it fails
+  def evaluate(self, expression, timeout):
+    raise NotImplementedError
+
+  #called after a pass that ran the debuggee, which throws away everything
+  #read from the stopped thread before it
+  def end_pass(self):
+    raise NotImplementedError
+
+#the names an expression reads, leaving out attributes and keywords.
+#Expressions that don't tokenize give the names up to where they stop
+def expression_names(expression):
+  names = set()
+  previous = None
+  try:
+    for token in tokenize.generate_tokens(StringIO(expression).readline):
+      kind, text = token[0], token[1]
+      if kind == tokenize.NAME and previous != '.' \
+          and not keyword.iskeyword(text):
+        names.add(text)
+      previous = text
+  except tokenize.TokenError:
+    pass
+  return names
+
+#evaluates expressions and watches at a stop. Results, failures included,
+#are memoized in the stop's snapshot, so a watch is evaluated at most once
+#per stop. Everything a pass needs is looked up before the first eval, since
+#running the debuggee invalidates what was read from the stopped thread
+class expression_evaluator(object):
+  def __init__(self, backend, timeout = 5.0):
+    self.backend = backend
+    self.timeout = timeout
+    self.watches = []
+    self.evals = 0
+    self.timeouts = 0
+    self.passes = 0
+
+  def add_watch(self, expression):
+    expression = expression.strip()
+    if not expression:
+      raise Exception, "Nothing to watch"
+    if expression not in self.watches:
+      self.watches.append(expression)
+
+  #watches are numbered from one
+  def remove_watch(self, number):
+    if number < 1 or number > len(self.watches):
+      raise Exception, "Watch %d not found" % number
+    del self.watches[number - 1]
+
+  #each result is ('value', display, type name) or ('error', message)
+  def evaluate_all(self, expressions, snapshot):
+    pending = [e for e in expressions if not snapshot.has('eval', e)]
+    needs_eval = []
+    for expression in pending:
+      try:
+        value = self.backend.lookup(expression)
+      except eval_error, msg:
+        snapshot.memo('eval', expression, lambda: ('error', str(msg)))
+        continue
+      if value != None:
+        snapshot.memo('eval', expression, lambda: ('value',) + tuple(value))
+      else:
+        needs_eval.append(expression)
+
+    if needs_eval:
+      self.passes += 1
+      try:
+        for expression in needs_eval:
+          snapshot.memo('eval', expression, lambda: self._evaluate(expression))
+      finally:
+        self.backend.end_pass()
+
+    return [snapshot.memo('eval', e, None) for e in expressions]
+
+  def evaluate(self, expression, snapshot):
+    return self.evaluate_all([expression], snapshot)[0]
+
+  def evaluate_watches(self, snapshot):
+    return zip(self.watches, self.evaluate_all(self.watches, snapshot))
+
+  def _evaluate(self, expression):
+    self.evals += 1
+    try:
+      return ('value',) + tuple(self.backend.evaluate(expression, self.timeout))
+    except eval_timeout, msg:
+      self.timeouts += 1
+      return ('error', str(msg))
+    except eval_error, msg:
+      return ('error', str(msg))
+
+  def stats(self):
+    return dict(watches = len(self.watches), evals = self.evals,
+                timeouts = self.timeouts, passes = self.passes)
@@ -0,0 +1,89 @@
+#--------------------------------------------
+# exception filters
+
+#the kinds of exception event CorDebug reports. user_first_chance is a
+#first chance exception reaching a frame in just my code, so it only fires
+#for the python code OnClassLoad marks as JMC
+exception_kinds = ('first_chance', 'user_first_chance', 'catch_handler_found',
+                   'unhandled')
+
+_filter_keywords = {
+  'first': 'first_chance',
+  'user': 'user_first_chance',
+  'unhandled': 'unhandled',
+}
+
+#decides which exceptions stop the debuggee. IronPython throws and catches
+#thousands of exceptions internally, so this runs in the CorDebug callback
+#and has to be cheap: the kinds and types are compiled into sets up front,
+#stops_on checks the kind alone so the caller can skip reading the
+#exception's type for kinds that never stop, and the answer for each type
+#is remembered
+class exception_filter(object):
+  def __init__(self, kinds = (), types = ()):
+    for kind in kinds:
+      if kind not in exception_kinds:
+        raise Exception, "Unknown exception kind %s" % kind
+    self.kinds = frozenset(kinds)
+    self.types = frozenset(types)
+    self._type_matches = dict()
+
+  def stops_on(self, kind):
+    return kind in self.kinds
+
+  #types match on their full name or just their name, so both
+  #System.ArgumentException and ArgumentException work
+  def matches_type(self, type_name):
+    if type_name not in self._type_matches:
+      short_name = type_name.rsplit('.', 1)[-1]
+      self._type_matches[type_name] = len(self.types) == 0 \
+        or type_name in self.types or short_name in self.types
+    return self._type_matches[type_name]
+
+  def should_stop(self, kind, type_name):
+    return kind in self.kinds and self.matches_type(type_name)
+
+  def __str__(self):
+    if len(self.kinds) == 0:
+      return "never"
+    kinds = ", ".join(k for k in exception_kinds if k in self.kinds)
+    return kinds if len(self.types) == 0 \
+      else "%s of %s" % (kinds, ", ".join(sorted(self.types)))
+
+#a comma separated list of when to stop - first, user or unhandled - and
+#the exception types to stop on. Just types means unhandled ones
+def parse_exception_filter(text):
+  kinds = []
+  types = []
+  for word in text.split(','):
+    word = word.strip()
+    if not word:
+      continue
+    if word.lower() in _filter_keywords:
+      kinds.append(_filter_keywords[word.lower()])
+    else:
+      types.append(word)
+  if len(kinds) == 0:
+    kinds.append('unhandled')
+  return exception_filter(kinds, types)
+
+#--------------------------------------------
+# exception counters
+
+#how many exceptions of each type were reported, by kind
+class exception_counters(object):
+  def __init__(self):
+    self.counts = dict()
+    self.total = 0
+
+  def count(self, type_name, kind):
+    self.total += 1
+    kinds = self.counts.get(type_name)
+    if kinds == None:
+      kinds = self.counts[type_name] = dict()
+    kinds[kind] = kinds.get(kind, 0) + 1
+
+  #(type name, {kind: count}), most frequent first
+  def summary(self):
+    return sorted(self.counts.items(),
+                  key = lambda x: (-sum(x[1].values()), x[0]))
@@ -0,0 +1,1047 @@
+#--------------------------------------------
+# in-memory stand-ins for the CorDebug / symbol store objects ipydbg uses,
+# for exercising ipydbg's helpers on machines without the CLR debugger
+
+from __future__ import with_statement
+
+from bisect import bisect_left
+import hashlib
+import os.path
+import random
+import sys
+import threading
+import time
+
+from symcache import HIDDEN_LINE
+from headless import debugger_backend, batch_commands
+from dbgserver import debug_server
+from evaluator import eval_backend, eval_error, eval_timeout
+from sourcecache import read_source_lines
+
+class FakeSymDocument(object):
+  def __init__(self, url):
+    self.URL = url
+    self.lines = []
+
+  #the first line at or after line that has a sequence point
+  def FindClosestLine(self, line):
+    i = bisect_left(self.lines, line)
+    if i == len(self.lines):
+      raise Exception, "No sequence point at or after line %d" % line
+    return self.lines[i]
+
+class FakeSymbolToken(object):
+  def __init__(self, token):
+    self.token = token
+
+  def GetToken(self):
+    return self.token
+
+class FakeSymMethod(object):
+  #points is a list of (offset, doc, start_line, start_col, end_line, end_col)
+  def __init__(self, token, points, root_scope = None):
+    self.Token = FakeSymbolToken(token)
+    self.points = points
+    self.RootScope = root_scope
+
+  @property
+  def SequencePointCount(self):
+    return len(self.points)
+
+  #fills the caller supplied arrays, like ISymbolMethod.GetSequencePoints
+  def GetSequencePoints(self, offsets, docs, start_lines, start_cols,
+                        end_lines, end_cols):
+    for i, p in enumerate(self.points):
+      offsets[i], docs[i], start_lines[i], start_cols[i], end_lines[i], \
+        end_cols[i] = p
+
+  def read_sequence_points(self):
+    count = self.SequencePointCount
+    arrays = [[None] * count for i in range(6)]
+    self.GetSequencePoints(*arrays)
+    return arrays
+
+class FakeSymReader(object):
+  def __init__(self, methods):
+    self.methods = methods
+    self._tokens = dict((m.Token.GetToken(), m) for m in methods)
+    self.docs = []
+    self._positions = dict()
+    for m in methods:
+      for offset, doc, start_line, sc, el, ec in m.points:
+        if start_line == HIDDEN_LINE:
+          continue
+        if doc not in self.docs:
+          self.docs.append(doc)
+        self._positions.setdefault((doc, start_line), m)
+    for doc in self.docs:
+      doc.lines = sorted(set(line for d, line in self._positions if d is doc))
+
+  def GetDocuments(self):
+    return list(self.docs)
+
+  def GetMethod(self, token):
+    if token.GetToken() not in self._tokens:
+      raise Exception, "No symbols for method %x" % token.GetToken()
+    return self._tokens[token.GetToken()]
+
+  def GetMethodFromDocumentPosition(self, doc, line, column):
+    return self._positions[(doc, line)]
+
+#a method spanning line_count lines of doc, one statement per line, with a
+#hidden sequence point between every few statements like the IronPython
+#compiler emits around call sites
+def generate_symmethod(token, doc, first_line, line_count, il_per_line = 12):
+  points = []
+  offset = 0
+  for i in range(line_count):
+    line = first_line + i
+    points.append((offset, doc, line, 5, line, 40))
+    offset += il_per_line
+    if i % 4 == 3:
+      points.append((offset, doc, HIDDEN_LINE, 0, HIDDEN_LINE, 0))
+      offset += 2
+  return FakeSymMethod(token, points)
+
+#--------------------------------------------
+# local scopes
+
+#every property read and call on the symbol reader's locals and scopes is
+#a COM call, which trips counts like a round trip
+class FakeLocal(object):
+  def __init__(self, trips, name, address):
+    self.trips = trips
+    self.name = name
+    self.address = address
+
+  @property
+  def Name(self):
+    self.trips.count += 1
+    return self.name
+
+  @property
+  def AddressField1(self):
+    self.trips.count += 1
+    return self.address
+
+class FakeScope(object):
+  def __init__(self, trips, start, end, locals, children):
+    self.trips = trips
+    self.start = start
+    self.end = end
+    self.locals = locals
+    self.children = children
+
+  @property
+  def StartOffset(self):
+    self.trips.count += 1
+    return self.start
+
+  @property
+  def EndOffset(self):
+    self.trips.count += 1
+    return self.end
+
+  def GetLocals(self):
+    self.trips.count += 1
+    return list(self.locals)
+
+  def GetChildren(self):
+    self.trips.count += 1
+    return list(self.children)
+
+#a frame of function stopped at an IL offset, with local values by address.
+#Its method takes no arguments
+class FakeLocalsFrame(object):
+  def __init__(self, trips, offset, values, function = None):
+    self.trips = trips
+    self.offset = offset
+    self.values = values
+    self.Function = function
+
+  @property
+  def FrameType(self):
+    return CorFrameType.ILFrame
+
+  def GetMethodInfo(self):
+    self.trips.count += 1
+    token = self.Function.Token if self.Function != None else 0
+    return FakeMethodInfo("method%x" % token, token)
+
+  def GetIP(self):
+    self.trips.count += 1
+    return self.offset, None
+
+  def GetLocalVariable(self, address):
+    self.trips.count += 1
+    return self.values[address]
+
+#a method's scopes, depth levels of them nested under the root, each
+#splitting its IL range between width children. Every scope has a few
+#locals and a $site local, like the IronPython compiler emits. Returns the
+#root scope and the number of locals
+def generate_scope_tree(trips, depth = 6, width = 3, locals = 3, length = 1 << 16):
+  count = [0]
+  def scope(level, start, end):
+    names = [FakeLocal(trips, "v%d_%d" % (level, i), count[0] + i) 
+               for i in range(locals)]
+    count[0] += locals
+    names.append(FakeLocal(trips, "$site", count[0]))
+    count[0] += 1
+    children = []
+    if level < depth:
+      step = (end - start) // width
+      children = [scope(level + 1, start + i * step, start + (i + 1) * step - 1)
+                    for i in range(width)]
+    return FakeScope(trips, start, end, names, children)
+  root = scope(0, 0, length)
+  return root, count[0]
+
+#--------------------------------------------
+# values
+
+#CorElementType, by their metadata values
+ELEMENT_TYPE_BOOLEAN = 0x2
+ELEMENT_TYPE_CHAR = 0x3
+ELEMENT_TYPE_I1 = 0x4
+ELEMENT_TYPE_U1 = 0x5
+ELEMENT_TYPE_I2 = 0x6
+ELEMENT_TYPE_U2 = 0x7
+ELEMENT_TYPE_I4 = 0x8
+ELEMENT_TYPE_U4 = 0x9
+ELEMENT_TYPE_I8 = 0xa
+ELEMENT_TYPE_U8 = 0xb
+ELEMENT_TYPE_R4 = 0xc
+ELEMENT_TYPE_R8 = 0xd
+ELEMENT_TYPE_STRING = 0xe
+ELEMENT_TYPE_VALUETYPE = 0x11
+ELEMENT_TYPE_CLASS = 0x12
+ELEMENT_TYPE_ARRAY = 0x14
+ELEMENT_TYPE_I = 0x18
+ELEMENT_TYPE_U = 0x19
+ELEMENT_TYPE_OBJECT = 0x1c
+ELEMENT_TYPE_SZARRAY = 0x1d
+
+class FakeFieldInfo(object):
+  def __init__(self, name, token):
+    self.Name = name
+    self.MetadataToken = token
+    self.IsStatic = False
+
+#a value's exact type: its class, the type it derives from, and for arrays
+#the element type
+class FakeType(object):
+  def __init__(self, cls, base = None, element_type = None):
+    self.Class = cls
+    self.Base = base
+    self.FirstTypeParameter = element_type
+
+#the CorValue casts, all of which come back empty unless a value is that
+#kind of value
+class FakeValue(object):
+  Type = None
+
+  def CastToReferenceValue(self):
+    return None
+
+  def CastToBoxValue(self):
+    return None
+
+class FakeGenericValue(FakeValue):
+  def __init__(self, value, element_type):
+    self.value = value
+    self.Type = element_type
+
+  def CastToGenericValue(self):
+    return self
+
+  def GetValue(self):
+    return self.value
+
+class FakeStringValue(FakeValue):
+  Type = ELEMENT_TYPE_STRING
+
+  def __init__(self, string):
+    self.String = string
+
+  def CastToStringValue(self):
+    return self
+
+#a reference to target, or a null reference of class cls
+class FakeReferenceValue(FakeValue):
+  Type = ELEMENT_TYPE_CLASS
+
+  def __init__(self, target, cls = None):
+    self.target = target
+    self.ExactType = FakeType(cls)
+
+  def CastToReferenceValue(self):
+    return self
+
+  @property
+  def IsNull(self):
+    return self.target == None
+
+  def Dereference(self):
+    return self.target
+
+#an object of class cls, its fields' values in the order of cls's fields
+class FakeObjectValue(FakeValue):
+  Type = ELEMENT_TYPE_CLASS
+
+  def __init__(self, cls, values):
+    self.ExactType = FakeType(cls)
+    self.values = values
+    self.reads = 0
+
+  def CastToObjectValue(self):
+    return self
+
+  def GetFieldValue(self, cls, token):
+    self.reads += 1
+    return self.values[token]
+
+#a single dimensional array of elements of class element_class
+class FakeArrayValue(FakeValue):
+  Type = ELEMENT_TYPE_SZARRAY
+  ElementType = ELEMENT_TYPE_CLASS
+
+  def __init__(self, element_class, elements):
+    self.ExactType = FakeType(None, element_type = FakeType(element_class))
+    self.elements = elements
+    self.reads = 0
+
+  def CastToArrayValue(self):
+    return self
+
+  @property
+  def Count(self):
+    return len(self.elements)
+
+  def GetElementAtPosition(self, position):
+    self.reads += 1
+    return self.elements[position]
+
+#the .NET type names of the python values extract_value returns
+_clr_type_names = {bool: 'System.Boolean', int: 'System.Int32', 
+                   long: 'System.Int64', float: 'System.Double', 
+                   str: 'System.String'}
+
+def clr_type_name(value):
+  return _clr_type_names[type(value)]
+
+#an IronPython list of count ints, laid out the way IronPython.Runtime.List
+#stores it: an over-allocated object[] plus a size field
+def generate_list(trips, count):
+  object_class = FakeClass(trips, None, 'System.Object', [])
+  null = FakeReferenceValue(None, object_class)
+  data = FakeArrayValue(object_class, 
+    [FakeGenericValue(i, ELEMENT_TYPE_I4) for i in range(count)] + 
+    [null] * (count // 2))
+  list_class = FakeClass(trips, None, 'IronPython.Runtime.List', [], 
+                         ['_data', '_size'])
+  return FakeObjectValue(list_class, [data, FakeGenericValue(count, ELEMENT_TYPE_I4)])
+
+#--------------------------------------------
+# class loads
+
+#counts the calls that would each be a round trip to the debuggee
+class FakeRoundTrips(object):
+  def __init__(self):
+    self.count = 0
+
+class FakeMethodInfo(object):
+  def __init__(self, name, token, type_name = "module"):
+    self.Name = name
+    self.MetadataToken = token
+    self.DeclaringType = FakeTypeInfo(None, type_name, [])
+
+  def GetParameters(self):
+    return []
+
+#a class's metadata. Its fields' tokens are their positions
+class FakeTypeInfo(object):
+  def __init__(self, trips, name, methods, fields = ()):
+    self.trips = trips
+    self.Name = name
+    self.FullName = name
+    self.methods = methods
+    self.fields = fields
+
+  def GetMethods(self):
+    self.trips.count += 1
+    return [FakeMethodInfo(name, token) for name, token in self.methods]
+
+  def GetFields(self, flags):
+    self.trips.count += 1
+    return [FakeFieldInfo(name, token) for token, name in enumerate(self.fields)]
+
+class FakeBreakpoint(object):
+  def __init__(self, function, offset):
+    self.function = function
+    self.offset = offset
+    self.active = False
+
+  def Activate(self, active):
+    self.active = active
+
+  def IsActive(self):
+    return self.active
+
+#a function, which is also its own IL code
+class FakeFunction(object):
+  def __init__(self, trips, module = None, token = None):
+    self.trips = trips
+    self.Module = module
+    self.Token = token
+
+  def _set_jmc_status(self, value):
+    self.trips.count += 1
+  JMCStatus = property(None, _set_jmc_status)
+
+  @property
+  def ILCode(self):
+    return self
+
+  def CreateBreakpoint(self, offset = 0):
+    self.trips.count += 1
+    return FakeBreakpoint(self, offset)
+
+  def GetMethodInfo(self):
+    self.trips.count += 1
+    return FakeMethodInfo("method%x" % self.Token, self.Token)
+
+#a module whose symbol stream is the symbol reader it stands for
+class FakeModule(object):
+  def __init__(self, trips, name, dynamic):
+    self.trips = trips
+    self.Name = name
+    self.IsDynamic = dynamic
+    self.SymbolReader = None
+
+  def UpdateSymbolReaderFromStream(self, stream):
+    self.trips.count += 1
+    self.SymbolReader = stream
+
+  def SetJmcStatus(self, value, tokens):
+    self.trips.count += 1
+
+  def GetFunctionFromToken(self, token):
+    self.trips.count += 1
+    return FakeFunction(self.trips, self, token)
+
+class FakeClass(object):
+  def __init__(self, trips, module, name, methods, fields = ()):
+    self.trips = trips
+    self.Module = module
+    self.name = name
+    self.methods = methods
+    self.fields = fields
+
+  def GetTypeInfo(self):
+    self.trips.count += 1
+    return FakeTypeInfo(self.trips, self.name, self.methods, self.fields)
+
+  def _set_jmc_status(self, value):
+    self.trips.count += 1
+  JMCStatus = property(None, _set_jmc_status)
+
+_python_methods = ['.ctor', '.cctor', 'TryGetExtraValue', 'TrySetExtraValue',
+                   'CustomSymbolDictionary.GetExtraKeys', 'Initialize']
+
+#the classes loaded on the way to a script's first breakpoint, in the mix
+#IronPython produces: mostly framework and IronPython classes from a handful
+#of static modules, generated IronPython.NewTypes and DLR classes in dynamic
+#modules, and a few python modules
+def generate_class_loads(trips, count, seed = 0):
+  rnd = random.Random(seed)
+  static_modules = [FakeModule(trips, "static%d.dll" % i, False) for i in range(8)]
+  dynamic_modules = [FakeModule(trips, "dynamic%d" % i, True) for i in range(4)]
+  classes = []
+  for i in range(count):
+    r = rnd.random()
+    if r < 0.6:
+      classes.append(FakeClass(trips, rnd.choice(static_modules),
+                               "System.Type%d" % i, []))
+    elif r < 0.9:
+      classes.append(FakeClass(trips, rnd.choice(dynamic_modules),
+                               "IronPython.NewTypes.System.Object_%d" % (i % 50), []))
+    else:
+      methods = [(name, 0x06000000 + i * 16 + n)
+                   for n, name in enumerate(_python_methods + ["f%d" % n for n in range(10)])]
+      classes.append(FakeClass(trips, rnd.choice(dynamic_modules),
+                               "module%d$%d" % (i % 20, i), methods))
+  return classes
+
+#--------------------------------------------
+# console
+
+#a key press, as ReadKey returns it
+class FakeKeyInfo(object):
+  def __init__(self, key, modifiers = 0):
+    self.Key = key
+    self.Modifiers = modifiers
+
+#System.Console as consolecolor drives it: every color read or write and
+#every Write is a call, and the output goes to an unbuffered stream the way
+#it would reach a terminal. ReadLine and ReadKey take what's typed from 
+#input, lines as strings and keys as FakeKeyInfos, in order. ReadLine 
+#returns None, like at the end of input, once there's nothing left
+class FakeConsole(object):
+  def __init__(self, stream, input = ()):
+    self.stream = stream
+    self.input = list(input)
+    self.calls = 0
+    self._foreground = 'Gray'
+    self._background = 'Black'
+
+  def _get_foreground(self):
+    self.calls += 1
+    return self._foreground
+  def _set_foreground(self, value):
+    self.calls += 1
+    self._foreground = value
+  ForegroundColor = property(_get_foreground, _set_foreground)
+
+  def _get_background(self):
+    self.calls += 1
+    return self._background
+  def _set_background(self, value):
+    self.calls += 1
+    self._background = value
+  BackgroundColor = property(_get_background, _set_background)
+
+  def Write(self, text):
+    self.calls += 1
+    self.stream.write(text)
+    self.stream.flush()
+
+  def WriteLine(self, text = ""):
+    self.Write("%s\n" % text)
+
+  def ReadLine(self):
+    self.calls += 1
+    return self.input.pop(0) if self.input else None
+
+  def ReadKey(self):
+    self.calls += 1
+    if not self.input:
+      raise Exception, "No keys left to read"
+    return self.input.pop(0)
+
+#--------------------------------------------
+# sampled stacks
+
+#a stream of stacks like the profiler samples: each one is a random walk
+#from the last, calling into or returning from functions spread over a few
+#files, innermost frame first
+def generate_stacks(count, functions = 50, max_depth = 30, seed = 0):
+  rnd = random.Random(seed)
+  names = [("module%d::f%d" % (i % 5, i), "module%d.py" % (i % 5), 10 * i)
+             for i in range(functions)]
+  stack = []
+  for i in range(count):
+    if len(stack) > 1 and (len(stack) >= max_depth or rnd.random() < 0.45):
+      stack.pop(0)
+    else:
+      stack.insert(0, rnd.choice(names))
+    function, file, line = stack[0]
+    stack[0] = (function, file, line - line % 10 + rnd.randint(0, 9))
+    yield list(stack)
+
+#--------------------------------------------
+# processes
+
+#the handlers for one of a FakeProcess's callbacks, added with += like the
+#CorDebug wrapper's events
+class FakeCallback(object):
+  def __init__(self):
+    self.handlers = []
+
+  def __iadd__(self, handler):
+    self.handlers.append(handler)
+    return self
+
+  def __isub__(self, handler):
+    self.handlers.remove(handler)
+    return self
+
+class FakeEventArgs(object):
+  def __init__(self, **fields):
+    self.Continue = True
+    self.__dict__.update(fields)
+
+#a debuggee with threads, raising a scripted stream of callbacks. Stop and
+#Continue are a round trip each
+class FakeProcess(object):
+  callbacks = ['OnCreateAppDomain', 'OnProcessExit', 'OnUpdateModuleSymbols',
+               'OnBreakpoint', 'OnStepComplete', 'OnClassLoad', 'OnException2',
+               'OnEvalComplete', 'OnEvalException']
+
+  def __init__(self, trips, threads = ()):
+    self.trips = trips
+    self.Threads = list(threads)
+    self.stops = 0
+    for name in self.callbacks:
+      setattr(self, name, FakeCallback())
+
+  def Stop(self, timeout):
+    self.trips.count += 1
+    self.stops += 1
+
+  def Continue(self, out_of_band):
+    self.trips.count += 1
+    self.stops = max(0, self.stops - 1)
+
+  #raises each (callback name, event fields) in order, the way the CorDebug
+  #callback thread does. fields can be a function returning them, for 
+  #events about things the handlers only create as they run. Returns how 
+  #many events a handler stopped at
+  def dispatch(self, events):
+    stopped = 0
+    for name, fields in events:
+      if callable(fields):
+        fields = fields()
+      e = FakeEventArgs(**fields)
+      for handler in getattr(self, name).handlers:
+        handler(self, e)
+      if not e.Continue:
+        stopped += 1
+    return stopped
+
+#a debuggee that runs a script of callbacks. Each Continue raises the next
+#ones until a handler stops at one, and once they run out the process exits
+class FakeScriptedProcess(FakeProcess):
+  def __init__(self, trips, events, threads = ()):
+    FakeProcess.__init__(self, trips, threads)
+    self.script = list(events)
+
+  def Continue(self, out_of_band):
+    FakeProcess.Continue(self, out_of_band)
+    while self.script:
+      if self.dispatch([self.script.pop(0)]):
+        return
+    self.dispatch([('OnProcessExit', dict())])
+
+#--------------------------------------------
+# threads
+
+#a frame a thread is stopped in. function is anything hashable, offset the
+#IL offset. Frames that aren't IL frames have no offset
+class FakeFrame(object):
+  def __init__(self, function, offset = None):
+    self.Function = function
+    self.offset = offset
+
+  @property
+  def FrameType(self):
+    return CorFrameType.ILFrame if self.offset != None else CorFrameType.NativeFrame
+
+  def GetIP(self):
+    return self.offset, None
+
+class FakeChain(object):
+  def __init__(self, frames):
+    self.Frames = frames
+
+#reading Chains counts a round trip for each frame, as walking them does.
+#The active chain is the first, and the active frame its first frame
+class FakeThread(object):
+  def __init__(self, trips, id, chains):
+    self.trips = trips
+    self.Id = id
+    self.chains = chains
+
+  @property
+  def ActiveChain(self):
+    self.trips.count += 1
+    return self.chains[0]
+
+  @property
+  def ActiveFrame(self):
+    self.trips.count += 1
+    return self.chains[0].Frames[0]
+
+  @property
+  def Chains(self):
+    for chain in self.chains:
+      self.trips.count += len(chain.Frames)
+    return self.chains
+
+#describes frames as (function, file, line), counting a round trip for
+#each, as reading the method info and sequence points does
+def fake_describe_frame(trips):
+  def describe(function, offset):
+    trips.count += 1
+    return ("module%d::%s" % (hash(function) % 5, function), 
+            "module%d.py" % (hash(function) % 5), offset // 10)
+  return describe
+
+#the threads of a service: most of them parked in a few identical stacks
+#waiting for work, the rest each somewhere of their own, in a chain of
+#python frames below a chain of native frames
+def generate_threads(trips, count, shapes = 4, depth = 20, busy = 0.1, seed = 0):
+  rnd = random.Random(seed)
+  def stack(n):
+    return [FakeFrame("f%d" % rnd.randint(0, 100), 10 * rnd.randint(0, 50))
+              for i in range(n)]
+  parked = [stack(depth) for i in range(shapes)]
+  threads = []
+  for i in range(count):
+    if rnd.random() < busy:
+      frames = stack(rnd.randint(1, depth))
+    else:
+      frames = list(rnd.choice(parked))
+    chains = [FakeChain(frames), FakeChain([FakeFrame("native")])]
+    threads.append(FakeThread(trips, i + 1, chains))
+  return threads
+
+#--------------------------------------------
+# heap
+
+#an object on the debuggee's heap, referring to other objects and to
+#numbers, which aren't heap objects
+class FakeHeapObject(object):
+  def __init__(self, address, typename, size):
+    self.address = address
+    self.typename = typename
+    self.size = size
+    self.references = []
+
+#what ipydbg's get_heap_object returns for a value, counting a round trip
+#for each value read
+def fake_heap_inspect(trips):
+  def inspect(value):
+    trips.count += 1
+    if not isinstance(value, FakeHeapObject):
+      return None
+    return value.address, value.typename, value.size, value.references
+  return inspect
+
+_heap_types = [('IronPython.Runtime.PythonDictionary', 32), 
+               ('IronPython.Runtime.List', 24), ('System.String', 40),
+               ('System.Object[]', 96), ('IronPython.NewTypes.System.Object_1', 40),
+               ('Microsoft.Scripting.Runtime.Scope', 24)]
+
+#count objects of a few types, each referring to a few others and some
+#numbers, with plenty of shared references and cycles. Returns the objects;
+#the first few are the roots a stop would have
+def generate_heap(count, references = 3, seed = 0):
+  rnd = random.Random(seed)
+  objects = []
+  for i in range(count):
+    typename, size = rnd.choice(_heap_types)
+    objects.append(FakeHeapObject(0x10000 + 64 * i, typename, size))
+  for obj in objects:
+    for r in range(rnd.randint(0, 2 * references)):
+      obj.references.append(rnd.choice(objects) if rnd.random() < 0.7 
+                               else rnd.randint(0, 100))
+  return objects
+
+#--------------------------------------------
+# evaluation
+
+#what display_value shows for a python value
+def _display(value):
+  return (repr(value), type(value).__name__)
+
+#evaluates python expressions against a dict of the stopped frame's values.
+#Plain local names are looked up without running the debuggee; anything
+#else counts as a CorEval round trip, costing cost seconds of simulated
+#time each. Expressions calling hang() never finish, so they time out and
+#are aborted
+class FakeEvalBackend(eval_backend):
+  def __init__(self, values, cost = 0.001):
+    self.values = values
+    self.cost = cost
+    self.evals = 0
+    self.aborts = 0
+    self.passes = 0
+    self.elapsed = 0.0
+
+  def lookup(self, expression):
+    if expression in self.values:
+      return _display(self.values[expression])
+    return None
+
+  def evaluate(self, expression, timeout):
+    self.evals += 1
+    if 'hang(' in expression:
+      self.elapsed += timeout
+      self.aborts += 1
+      raise eval_timeout, "%s timed out after %gs and was aborted" % (expression, timeout)
+    self.elapsed += self.cost
+    try:
+      return _display(eval(expression, dict(), dict(self.values)))
+    except Exception, ex:
+      raise eval_error, "%s threw %s" % (expression, type(ex).__name__)
+
+  def end_pass(self):
+    self.passes += 1
+
+#--------------------------------------------
+# debugger backend
+
+#replays a scripted list of events through batch_commands or a debug_server.
+#Events are dicts with an 'event' name and their fields; the ones with a
+#'stack' are stops and also carry the 'locals' the backend reports while
+#stopped there
+class FakeBackend(debugger_backend):
+  def __init__(self, events):
+    self.events = events
+    self.current = None
+    self.breakpoints = []
+    self.steps = []
+    self.quit_requested = False
+    self.server = None
+    self._position = 0
+
+  def get_locals(self):
+    return self.current.get('locals', [])
+
+  def get_stack(self):
+    return self.current['stack']
+
+  def get_threads(self):
+    if 'threads' in self.current:
+      return self.current['threads']
+    return [dict(threads = [1], frames = self.current['stack'])]
+
+  def add_breakpoint(self, spec):
+    self.breakpoints.append(spec)
+    return "Breakpoint set"
+
+  def step(self, kind):
+    self.steps.append(kind)
+
+  def quit(self):
+    self.quit_requested = True
+
+  def get_stats(self):
+    return dict()
+
+  #posts the scripted events up to the next stop to the server
+  def resume(self):
+    while self._position < len(self.events) and not self.quit_requested:
+      event = self.events[self._position]
+      self._position += 1
+      fields = dict((k, v) for k, v in event.items()
+                      if k not in ('event', 'locals', 'stack'))
+      self.server.post(event['event'], **fields)
+      if 'stack' in event:
+        self.current = event
+        self.server.post_stop()
+        return
+    self.server.post('OnProcessExit')
+    self.server.post_exit()
+
+  def serve(self, address):
+    self.server = debug_server(self, address)
+    self.server.serve()
+
+  def run(self, commands, writer):
+    batch = batch_commands(self, commands, writer)
+    for event in self.events:
+      if self.quit_requested:
+        break
+      fields = dict((k, v) for k, v in event.items()
+                      if k not in ('event', 'locals', 'stack'))
+      writer.emit(event['event'], **fields)
+      if 'stack' in event:
+        self.current = event
+        batch.on_stop()
+    writer.emit('OnProcessExit')
+    writer.flush()
+
+#--------------------------------------------
+# .NET and CorDebug names
+
+#a .NET enum. Its members are attributes named after themselves, or bits
+#for flags enums, and Enum is the class itself
+class FakeEnum(object):
+  def __init__(self, names, flags = False):
+    self.names = names.split()
+    for i, name in enumerate(self.names):
+      setattr(self, name, 1 << i if flags else name)
+
+  @staticmethod
+  def GetNames(enum):
+    return list(enum.names)
+
+  @staticmethod
+  def Parse(enum, name):
+    return getattr(enum, name)
+
+#System.Array: CreateInstance makes a list of the length asked for
+class FakeArrayType(object):
+  def CreateInstance(self, type, length):
+    return [None] * length
+
+class FakeIntPtr(object):
+  Zero = 0
+
+class FakeBitConverter(object):
+  @staticmethod
+  def ToString(data):
+    return "-".join("%02X" % b for b in bytearray(data))
+
+class FakeSHA1(object):
+  @staticmethod
+  def Create():
+    return FakeSHA1()
+
+  def ComputeHash(self, data):
+    return hashlib.sha1(str(bytearray(data))).digest()
+
+class FakePath(object):
+  GetFileName = staticmethod(os.path.basename)
+  GetFullPath = staticmethod(os.path.abspath)
+
+class FakeFile(object):
+  ReadAllLines = staticmethod(read_source_lines)
+
+class FakeAssembly(object):
+  Location = sys.executable
+
+  @staticmethod
+  def GetEntryAssembly():
+    return FakeAssembly()
+
+class FakeAutoResetEvent(object):
+  def __init__(self, signaled):
+    self._cond = threading.Condition()
+    self._signaled = signaled
+
+  def Set(self):
+    with self._cond:
+      self._signaled = True
+      self._cond.notify()
+
+  def Reset(self):
+    with self._cond:
+      self._signaled = False
+
+  #timeout is in milliseconds, -1 for no timeout. Only one waiter gets
+  #each signal
+  def WaitOne(self, timeout = -1):
+    deadline = time.time() + timeout / 1000.0 if timeout >= 0 else None
+    with self._cond:
+      while not self._signaled:
+        if deadline == None:
+          self._cond.wait(1.0)
+        elif time.time() >= deadline:
+          return False
+        else:
+          self._cond.wait(deadline - time.time())
+      self._signaled = False
+      return True
+
+class FakeWaitHandle(object):
+  @staticmethod
+  def WaitAny(handles):
+    while True:
+      for i, handle in enumerate(handles):
+        if handle.WaitOne(0):
+          return i
+      time.sleep(0.001)
+
+class FakeCurrentThread(object):
+  def GetApartmentState(self):
+    return ApartmentState.MTA
+
+class FakeThreadType(object):
+  CurrentThread = FakeCurrentThread()
+
+class FakeTimeSpan(object):
+  def __init__(self, seconds):
+    self.TotalSeconds = seconds
+    self.TotalMilliseconds = seconds * 1e3
+
+class FakeStopwatch(object):
+  def __init__(self):
+    self._start = time.time()
+    self._stop = None
+
+  @staticmethod
+  def StartNew():
+    return FakeStopwatch()
+
+  def Stop(self):
+    self._stop = time.time()
+
+  @property
+  def Elapsed(self):
+    end = self._stop if self._stop != None else time.time()
+    return FakeTimeSpan(end - self._start)
+
+class FakeStepRange(object):
+  def __init__(self, startOffset, endOffset):
+    self.startOffset = startOffset
+    self.endOffset = endOffset
+
+class FakeMetadataImport(object):
+  TokenNotFound = 0
+
+  def __init__(self, module):
+    self.DefinedTypes = getattr(module, 'types', [])
+
+  def GetTypeTokenFromName(self, name):
+    return self.TokenNotFound
+
+#launching or attaching hands out the process it was made with
+class FakeDebugger(object):
+  def __init__(self, version = None, process = None):
+    self.process = process if process != None \
+        else FakeProcess(FakeRoundTrips())
+
+  @staticmethod
+  def GetDefaultDebuggerVersion():
+    return "v2.0.50727"
+
+  def CreateProcess(self, application, command_line):
+    return self.process
+
+  def DebugActiveProcess(self, pid, win32_attach):
+    return self.process
+
+#the names ipydbg imports from System and the CorDebug wrapper, which 
+#clrnames hands out when there's no CLR
+Array = FakeArrayType()
+Console = FakeConsole(sys.stdout)
+ConsoleKey = FakeEnum(" ".join(chr(c) for c in range(ord('A'), ord('Z') + 1)) +
+                      " Enter Escape Spacebar")
+ConsoleModifiers = FakeEnum("Alt Shift Control", flags = True)
+ConsoleColor = FakeEnum("Black DarkBlue DarkGreen DarkCyan DarkRed DarkMagenta "
+  "DarkYellow Gray DarkGray Blue Green Cyan Red Magenta Yellow White")
+Enum = FakeEnum
+Byte = int
+UInt32 = int
+IntPtr = FakeIntPtr
+BitConverter = FakeBitConverter
+Path = FakePath
+File = FakeFile
+Assembly = FakeAssembly
+BindingFlags = FakeEnum("Instance Static Public NonPublic", flags = True)
+WaitHandle = FakeWaitHandle
+AutoResetEvent = FakeAutoResetEvent
+Thread = FakeThreadType
+ApartmentState = FakeEnum("STA MTA Unknown")
+ThreadStart = lambda f: f
+Stopwatch = FakeStopwatch
+ISymbolDocument = FakeSymDocument
+SymbolToken = FakeSymbolToken
+SHA1 = FakeSHA1
+CorDebugger = FakeDebugger
+CorFrameType = FakeEnum("ILFrame NativeFrame InternalFrame")
+CorValue = FakeValue
+CorObjectValue = FakeObjectValue
+CorArrayValue = FakeArrayValue
+CorDebugUnmappedStop = FakeEnum("STOP_NONE STOP_ALL")
+COR_DEBUG_STEP_RANGE = FakeStepRange
+CorDebugStepReason = FakeEnum("STEP_NORMAL STEP_RETURN STEP_CALL "
+  "STEP_EXCEPTION_FILTER STEP_EXCEPTION_HANDLER STEP_INTERCEPT STEP_EXIT")
+CorDebugExceptionCallbackType = FakeEnum("DEBUG_EXCEPTION_FIRST_CHANCE "
+  "DEBUG_EXCEPTION_USER_FIRST_CHANCE DEBUG_EXCEPTION_CATCH_HANDLER_FOUND "
+  "DEBUG_EXCEPTION_UNHANDLED")
+CorDebugHandleType = FakeEnum("HANDLE_STRONG HANDLE_WEAK_TRACK_RESURRECTION")
+CorMetadataImport = FakeMetadataImport
@@ -0,0 +1,180 @@
+from __future__ import with_statement
+
+import json
+import threading
+
+#--------------------------------------------
+# event stream
+
+#writes events as JSON lines. Events are buffered and written in batches,
+#since the CorDebug callbacks can produce thousands of them a second.
+#emit can be called from any thread
+class event_writer(object):
+  def __init__(self, stream, buffer_size = 256):
+    self.stream = stream
+    self.buffer_size = buffer_size
+    self.count = 0
+    self._buffer = []
+    self._lock = threading.Lock()
+
+  def emit(self, event, **fields):
+    fields['event'] = event
+    line = json.dumps(fields)
+    with self._lock:
+      self._buffer.append(line)
+      self.count += 1
+      if len(self._buffer) >= self.buffer_size:
+        self._write()
+
+  def flush(self):
+    with self._lock:
+      self._write()
+
+  def _write(self):
+    if self._buffer:
+      self.stream.write("\n".join(self._buffer) + "\n")
+      self._buffer = []
+    self.stream.flush()
+
+#--------------------------------------------
+# debugger backend
+
+#what batch mode and the debug server need from a stopped debuggee. IPyDebugProcess implements
+#it over CorDebug, fakedbg implements it over a scripted event stream
+class debugger_backend(object):
+  #list of dicts with name, value and type
+  def get_locals(self):
+    raise NotImplementedError
+
+  #list of dicts with function, file, line and offset, innermost first
+  def get_stack(self):
+    raise NotImplementedError
+
+  #every thread's stack, with threads whose stacks are the same grouped: list
+  #of dicts with the thread ids and their frames, most threads first
+  def get_threads(self):
+    raise NotImplementedError
+
+  #a file:line [condition] spec. Returns a description of what was set
+  def add_breakpoint(self, spec):
+    raise NotImplementedError
+
+  #kind is 'over', 'in' or 'out'. Takes effect when the stop handler returns
+  def step(self, kind):
+    raise NotImplementedError
+
+  def quit(self):
+    raise NotImplementedError
+
+  #lets the debuggee run until the next stop. Only the debug server calls
+  #this, batch mode resumes by returning from on_stop
+  def resume(self):
+    raise NotImplementedError
+
+  #latency stats by name, empty when instrumentation is off
+  def get_stats(self):
+    raise NotImplementedError
+
+#--------------------------------------------
+# batch commands
+
+def _batchcmd(cmddict, *names):
+  def deco(f):
+    for name in names:
+      cmddict[name] = f
+    return f
+  return deco
+
+#runs debugger commands from a script or a line protocol on stdin, one
+#line per command, and reports their results as events. on_stop is called
+#each time the debuggee stops, and reads commands until one of them lets
+#the debuggee run again. Once the commands run out the debuggee just runs
+#to completion
+class batch_commands(object):
+  def __init__(self, backend, commands, writer):
+    self.backend = backend
+    self.commands = iter(commands)
+    self.writer = writer
+    self.done = False
+
+  _cmds = dict()
+
+  @_batchcmd(_cmds, 'continue', 'c')
+  def _continue_cmd(self, args):
+    return True
+
+  @_batchcmd(_cmds, 'step', 's')
+  def _step_cmd(self, args):
+    self.backend.step('over')
+    return True
+
+  @_batchcmd(_cmds, 'stepin', 'i')
+  def _step_in_cmd(self, args):
+    self.backend.step('in')
+    return True
+
+  @_batchcmd(_cmds, 'stepout', 'o')
+  def _step_out_cmd(self, args):
+    self.backend.step('out')
+    return True
+
+  @_batchcmd(_cmds, 'break', 'b')
+  def _break_cmd(self, args):
+    self.writer.emit('breakpoint_added', result = self.backend.add_breakpoint(args))
+    return False
+
+  @_batchcmd(_cmds, 'locals', 'l')
+  def _locals_cmd(self, args):
+    self.writer.emit('locals', locals = self.backend.get_locals())
+    return False
+
+  @_batchcmd(_cmds, 'stack', 't')
+  def _stack_cmd(self, args):
+    self.writer.emit('stack', frames = self.backend.get_stack())
+    return False
+
+  @_batchcmd(_cmds, 'threads')
+  def _threads_cmd(self, args):
+    self.writer.emit('threads', threads = self.backend.get_threads())
+    return False
+
+  @_batchcmd(_cmds, 'stats')
+  def _stats_cmd(self, args):
+    self.writer.emit('stats', stats = self.backend.get_stats())
+    return False
+
+  @_batchcmd(_cmds, 'quit', 'q')
+  def _quit_cmd(self, args):
+    self.backend.quit()
+    return True
+
+  #runs one command line, returning True if the debuggee should resume
+  def execute(self, line):
+    line = line.strip()
+    if not line or line.startswith('#'):
+      return False
+    parts = line.split(None, 1)
+    cmd = parts[0].lower()
+    args = parts[1] if len(parts) > 1 else ""
+    if cmd not in batch_commands._cmds:
+      self.writer.emit('error', command = line, message = "Unknown command")
+      return False
+    try:
+      return batch_commands._cmds[cmd](self, args)
+    except Exception, ex:
+      self.writer.emit('error', command = line, message = str(ex))
+      return False
+
+  def on_stop(self):
+    #whoever is driving us over stdin needs to see the stop event before
+    #it can decide on the next command
+    self.writer.flush()
+    while not self.done:
+      try:
+        line = self.commands.next()
+      except StopIteration:
+        self.done = True
+        break
+      if self.execute(line):
+        break
+      self.writer.flush()
@@ -0,0 +1,108 @@
+from timeit import default_timer as _clock
+
+#--------------------------------------------
+# heap summaries
+
+#instance counts and shallow sizes by type, for the objects a heap walk
+#reached. truncated says why the walk stopped early, if it did, and errors
+#counts the values that couldn't be read
+class heap_summary(object):
+  def __init__(self):
+    self.types = dict()
+    self.objects = 0
+    self.bytes = 0
+    self.errors = 0
+    self.elapsed = 0.0
+    self.truncated = None
+
+  def add(self, typename, size):
+    entry = self.types.get(typename)
+    if entry == None:
+      entry = self.types[typename] = [0, 0]
+    entry[0] += 1
+    entry[1] += size
+    self.objects += 1
+    self.bytes += size
+
+  #(type, count, bytes), most bytes first
+  def top(self, count = None):
+    result = [(name, c, b) for name, (c, b) in self.types.items()]
+    result.sort(key = lambda t: (-t[2], t[0]))
+    return result[:count] if count != None else result
+
+  #(type, count change, bytes change) for the types that changed since the
+  #previous summary, biggest change in bytes first
+  def diff(self, previous):
+    result = []
+    for name in set(self.types) | set(previous.types):
+      count, size = self.types.get(name, (0, 0))
+      old_count, old_size = previous.types.get(name, (0, 0))
+      if count != old_count or size != old_size:
+        result.append((name, count - old_count, size - old_size))
+    result.sort(key = lambda t: (-abs(t[2]), t[0]))
+    return result
+
+#--------------------------------------------
+# heap walks
+
+#walks the objects reachable from a set of roots, depth first, counting
+#each once by its address. inspect(value) returns (address, type name,
+#shallow size, references) for a value, or None for values that aren't or
+#don't lead to heap objects, like nulls and numbers. Values with no address,
+#like value types held in a field, aren't counted but their references are
+#still followed. references can be a generator, so big arrays are only read
+#as far as the budget goes. The walk stops after max_objects objects or
+#max_seconds, whichever comes first. A value that can't be read is counted
+#as an error and skipped, along with the rest of the references it was
+#read from
+class heap_walker(object):
+  def __init__(self, inspect, max_objects = 50000, max_seconds = 5.0,
+               clock = _clock):
+    self.inspect = inspect
+    self.max_objects = max_objects
+    self.max_seconds = max_seconds
+    self.clock = clock
+
+  def walk(self, roots):
+    summary = heap_summary()
+    visited = set()
+    start = self.clock()
+    deadline = start + self.max_seconds
+    inspect = self.inspect
+    pending = [iter(roots)]
+    steps = 0
+    while pending:
+      try:
+        value = pending[-1].next()
+      except StopIteration:
+        pending.pop()
+        continue
+      except Exception:
+        summary.errors += 1
+        pending.pop()
+        continue
+      #reading the clock on every value costs more than a few extra values
+      steps += 1
+      if steps & 0xff == 0 and self.clock() > deadline:
+        summary.truncated = "time"
+        break
+      try:
+        obj = inspect(value)
+      except Exception:
+        summary.errors += 1
+        continue
+      if obj == None:
+        continue
+      address, typename, size, references = obj
+      if address != None:
+        if address in visited:
+          continue
+        if summary.objects >= self.max_objects:
+          summary.truncated = "objects"
+          break
+        visited.add(address)
+        summary.add(typename, size)
+      if references:
+        pending.append(iter(references))
+    summary.elapsed = self.clock() - start
+    return summary
@@ -0,0 +1,183 @@
+import re
+
+#--------------------------------------------
+# value inspector
+
+#collection types whose elements are more interesting than their fields:
+#type name -> (field holding the element array, field holding the count)
+collection_types = {
+  'IronPython.Runtime.List': ('_data', '_size'),
+  'IronPython.Runtime.PythonTuple': ('_data', None),
+}
+
+def _is_array(v):
+  return hasattr(v, 'GetElementAtPosition')
+
+def _is_object(v):
+  return hasattr(v, 'GetFieldValue')
+
+#a value in the inspector tree. The value is only extracted and the
+#children only fetched from the debuggee when they are asked for, and both
+#are kept until the inspector is cleared
+class inspector_node(object):
+  def __init__(self, inspector, name, value, depth):
+    self.inspector = inspector
+    self.name = name
+    self.value = value
+    self.depth = depth
+    self._extracted = None
+    self._has_extracted = False
+    self._display = None
+    self._fields = None
+    self._collection = None
+    self._pages = dict()
+
+  @property
+  def extracted(self):
+    if not self._has_extracted:
+      self._extracted = self.inspector.extract(self.value)
+      self._has_extracted = True
+    return self._extracted
+
+  def display(self):
+    if self._display == None:
+      self._display = self.inspector.display(self.extracted)
+    return self._display
+
+  @property
+  def expandable(self):
+    v = self.extracted
+    return self.depth < self.inspector.max_depth and (_is_array(v) or _is_object(v))
+
+  #(element array, element count) for arrays and known collection objects,
+  #(None, 0) for plain objects. A collection without the fields expected 
+  #of it, like one from another IronPython version, is shown field by field
+  def _get_collection(self):
+    if self._collection == None:
+      v = self.extracted
+      if _is_array(v):
+        self._collection = (v, v.Count)
+      else:
+        self._collection = (None, 0)
+        type_name = self.display()[1]
+        if type_name in collection_types:
+          data_field, size_field = collection_types[type_name]
+          data = self.field(data_field)
+          size = self.field(size_field) if size_field else None
+          if data != None and _is_array(data.extracted) and \
+             (size_field == None or size != None):
+            self._collection = (data.extracted, 
+              size.extracted if size != None else data.extracted.Count)
+    return self._collection
+
+  def _get_fields(self):
+    if self._fields == None:
+      self._fields = [inspector_node(self.inspector, name, value, self.depth + 1)
+                        for name, value in self.inspector.get_fields(self.extracted)]
+    return self._fields
+
+  def field(self, name):
+    for node in self._get_fields():
+      if node.name == name:
+        return node
+    return None
+
+  @property
+  def count(self):
+    if not self.expandable:
+      return 0
+    array, size = self._get_collection()
+    return size if array != None else len(self._get_fields())
+
+  @property
+  def page_count(self):
+    page_size = self.inspector.page_size
+    return (self.count + page_size - 1) // page_size
+
+  def children(self, page = 0):
+    if not self.expandable:
+      return []
+    if page in self._pages:
+      return self._pages[page]
+
+    page_size = self.inspector.page_size
+    start = page * page_size
+    array, size = self._get_collection()
+    if array != None:
+      count = max(0, min(page_size, size - start))
+      children = [inspector_node(self.inspector, name, value, self.depth + 1)
+                    for name, value in self.inspector.get_elements(array, start, count)]
+    else:
+      children = self._get_fields()[start:start + page_size]
+    self._pages[page] = children
+    return children
+
+  #the child with a field name, or an element index for arrays and
+  #collections. Only the page holding the element is fetched
+  def child(self, key):
+    if isinstance(key, int):
+      if not self.expandable or self._get_collection()[0] == None:
+        return None
+      page_size = self.inspector.page_size
+      children = self.children(key // page_size)
+      i = key % page_size
+      return children[i] if i < len(children) else None
+    return self.field(key) if self.expandable else None
+
+_path_re = re.compile(r"\.?([^.\[\]]+)|\[(\d+)\]")
+
+#splits a path like items[3].name into ['items', 3, 'name']
+def parse_path(path):
+  keys = []
+  pos = 0
+  path = path.strip()
+  while pos < len(path):
+    m = _path_re.match(path, pos)
+    if m == None:
+      raise Exception, "Invalid path %s" % path
+    name, index = m.groups()
+    keys.append(int(index) if index != None else name)
+    pos = m.end()
+  return keys
+
+#lazily expanded view of the debuggee's values for one stop.
+#  extract(value) and display(extracted) are extract_value/display_value,
+#  get_fields(object) yields the (name, value) of an object's fields and
+#  get_elements(array, start, count) yields (name, value) for a slice of
+#  an array. clear() must be called whenever the process continues, since
+#  the values are only valid while it is stopped
+class value_inspector(object):
+  def __init__(self, extract, display, get_fields, get_elements,
+               page_size = 20, max_depth = 8):
+    self.extract = extract
+    self.display = display
+    self.get_fields = get_fields
+    self.get_elements = get_elements
+    self.page_size = page_size
+    self.max_depth = max_depth
+    self._roots = dict()
+
+  #get_root_value(name) returns the CorValue for a root name, or None.
+  #It's only called the first time a root is used in a stop
+  def root(self, name, get_root_value):
+    if name not in self._roots:
+      value = get_root_value(name)
+      self._roots[name] = inspector_node(self, name, value, 0) \
+        if value != None else None
+    return self._roots[name]
+
+  def find(self, path, get_root_value):
+    keys = parse_path(path)
+    if len(keys) == 0 or not isinstance(keys[0], str):
+      raise Exception, "Paths start with a local or argument name"
+    node = self.root(keys[0], get_root_value)
+    for key in keys[1:]:
+      if node == None:
+        break
+      node = node.child(key)
+    if node == None:
+      raise Exception, "%s not found" % path
+    return node
+
+  def clear(self):
+    self._roots.clear()
@@ -0,0 +1,160 @@
+from __future__ import with_statement
+
+import json
+from math import frexp
+import threading
+from timeit import default_timer as _clock
+
+#--------------------------------------------
+# latency histograms
+
+#counts of values in buckets that are exact up to 2**(sub_bucket_bits+1)
+#and then split every power of two into 2**sub_bucket_bits buckets, like
+#HdrHistogram, so any value is off by at most 1 part in 2**sub_bucket_bits
+#however big it is. Values are whole microseconds
+class latency_histogram(object):
+  def __init__(self, sub_bucket_bits = 4):
+    self.sub_bucket_bits = sub_bucket_bits
+    self._exact = 2 << sub_bucket_bits
+    self.counts = dict()
+    self.count = 0
+    self.total = 0
+    self.min = None
+    self.max = 0
+
+  def _index(self, value):
+    if value < self._exact:
+      return value
+    shift = frexp(value)[1] - self.sub_bucket_bits - 1
+    return (shift << self.sub_bucket_bits) + (value >> shift)
+
+  #the highest value that goes in the bucket
+  def _value(self, index):
+    if index < self._exact:
+      return index
+    shift = (index >> self.sub_bucket_bits) - 1
+    return ((index - (shift << self.sub_bucket_bits) + 1) << shift) - 1
+
+  #_index inlined, since this is on every timed call
+  def record(self, value):
+    value = int(value)
+    if value < self._exact:
+      i = value
+    else:
+      shift = frexp(value)[1] - self.sub_bucket_bits - 1
+      i = (shift << self.sub_bucket_bits) + (value >> shift)
+    counts = self.counts
+    counts[i] = counts.get(i, 0) + 1
+    self.count += 1
+    self.total += value
+    if self.min == None or value < self.min:
+      self.min = value
+    if value > self.max:
+      self.max = value
+
+  #the value percent of the recorded values are at or below
+  def percentile(self, percent):
+    if self.count == 0:
+      return 0
+    target = max(1, int(round(self.count * percent / 100.0)))
+    seen = 0
+    for i in sorted(self.counts):
+      seen += self.counts[i]
+      if seen >= target:
+        return min(self._value(i), self.max)
+    return self.max
+
+  @property
+  def mean(self):
+    return float(self.total) / self.count if self.count else 0.0
+
+  def summary(self):
+    return dict(count = self.count, total_us = self.total, mean_us = self.mean,
+                min_us = self.min or 0, max_us = self.max,
+                p50_us = self.percentile(50), p90_us = self.percentile(90),
+                p99_us = self.percentile(99), p999_us = self.percentile(99.9))
+
+#--------------------------------------------
+# instrumentation
+
+#latency histograms by name, for functions and methods wrapped with wrap or
+#instrument. Nothing is timed unless it's wrapped, so code that isn't
+#instrumented pays nothing for it. Wrapped functions can be called from
+#any thread
+class instrumentation(object):
+  def __init__(self, clock = _clock):
+    self.clock = clock
+    self.histograms = dict()
+    self._lock = threading.Lock()
+
+  def histogram(self, name):
+    with self._lock:
+      h = self.histograms.get(name)
+      if h == None:
+        h = self.histograms[name] = latency_histogram()
+      return h
+
+  def record(self, name, seconds):
+    self._recorder(name)(seconds)
+
+  #a function recording seconds in the histogram for name
+  def _recorder(self, name):
+    h = self.histogram(name)
+    lock = self._lock
+    def record(seconds):
+      with lock:
+        h.record(seconds * 1e6)
+    return record
+
+  #f, timed under name
+  def wrap(self, f, name):
+    clock = self.clock
+    record = self._recorder(name)
+    def timed(*args, **kwargs):
+      start = clock()
+      try:
+        return f(*args, **kwargs)
+      finally:
+        record(clock() - start)
+    timed.__name__ = getattr(f, '__name__', name)
+    timed.__doc__ = getattr(f, '__doc__', None)
+    return timed
+
+  #generator function f, timed under name until the generator is used up
+  #or thrown away
+  def wrap_generator(self, f, name):
+    clock = self.clock
+    record = self._recorder(name)
+    def timed(*args, **kwargs):
+      start = clock()
+      try:
+        for item in f(*args, **kwargs):
+          yield item
+      finally:
+        record(clock() - start)
+    timed.__name__ = getattr(f, '__name__', name)
+    return timed
+
+  #replaces the named attributes of obj - an instance, class or module's
+  #globals dict - with timed versions
+  def instrument(self, obj, names, generators = ()):
+    for name in names:
+      wrap = self.wrap_generator if name in generators else self.wrap
+      if isinstance(obj, dict):
+        obj[name] = wrap(obj[name], name)
+      else:
+        setattr(obj, name, wrap(getattr(obj, name), name))
+
+  #(name, summary), by name
+  def summary(self):
+    with self._lock:
+      return [(name, self.histograms[name].summary())
+                for name in sorted(self.histograms)]
+
+  def dump(self, filename):
+    f = open(filename, 'w')
+    try:
+      json.dump(dict(self.summary()), f, indent = 2, sort_keys = True)
+      f.write("\n")
+    finally:
+      f.close()
@@ -1,42 +1,52 @@
+# -*- coding: latin-1 -*-
 from __future__ import with_statement
 
-import clr
-clr.AddReference('CorDebug')
-
+import os
 import sys
-
-from System import Array, Console, ConsoleKey, ConsoleModifiers, ConsoleColor
-from System.IO import Path, File
-from System.Reflection import Assembly
-from System.Threading import WaitHandle, AutoResetEvent
-from System.Threading import Thread, ApartmentState, ParameterizedThreadStart
-from System.Diagnostics.SymbolStore import ISymbolDocument
-
-from Microsoft.Samples.Debugging.CorDebug import (CorDebugger, CorFrameType, 
-  CorValue, CorReferenceValue, CorObjectValue, CorAppDomain, CorModule)
-from Microsoft.Samples.Debugging.CorDebug.NativeApi import \
-  CorDebugUnmappedStop, COR_DEBUG_STEP_RANGE, CorDebugStepReason
-from Microsoft.Samples.Debugging.CorDebug.NativeApi.CorElementType import *
+import threading
+from clrnames import *
 
 import consolecolor as CC
+from symcache import sequence_point_table, sequence_point_cache, method_cache, \
+  symbol_index, normalize_path, scope_table
+from breakpoints import parse_breakpoint_spec, load_breakpoint_specs, \
+  pending_breakpoints, breakpoint_state
+from tracelog import trace_log
+from inspector import value_inspector
+from snapshot import stop_snapshot
+from headless import event_writer, debugger_backend, batch_commands
+from dbgserver import debug_server, parse_address
+from sessions import session_manager
+from profiler import sample_profile
+from excfilter import exception_filter, exception_counters, \
+  parse_exception_filter
+from jmc import jmc_classifier, jmc_batch
+from renderer import console_renderer, background_writer, supports_ansi
+from sourcecache import source_cache
+from recording import session_recorder
+from linecoverage import line_coverage
+from stepping import step_range_cache, step_request, step_stats
+from instrumentation import instrumentation
+from symstore import symbol_store, encode_symbols
+from heapwalk import heap_walker
+from lazymodules import deferred_modules
+from threadstacks import frame_resolver, dump_threads, group_stacks
+from evaluator import eval_backend, eval_error, eval_timeout, \
+  expression_evaluator, expression_names
+
+#the caches every session shares - class field lists, class and exception
+#type names, eval functions and source files - are only read or changed 
+#holding this, since each session's callbacks come in on a thread of their
+#own
+_shared_lock = threading.RLock()
 
 #--------------------------------------------
 # sequence point functions
 
-class sequence_point(object):
-  def __init__(self, offset, doc, start_line, start_col, end_line, end_col):
-    self.offset = offset
-    self.doc = doc
-    self.start_line = start_line
-    self.start_col = start_col
-    self.end_line = end_line
-    self.end_col = end_col
-    
-  def __str__(self):
-    return "%s %d:%d-%d:%d (offset:%d)" % (Path.GetFileName(self.doc.URL), 
-      self.start_line, self.start_col, self.end_line, self.end_col, self.offset)
-    
-def get_sequence_points(symmethod, include_hidden_lines = False):
+def read_sequence_points(symmethod):
+  #cached symbols have them as lists already
+  if hasattr(symmethod, 'read_sequence_points'):
+    return symmethod.read_sequence_points()
   sp_count     = symmethod.SequencePointCount
   spOffsets    = Array.CreateInstance(int, sp_count)
   spDocs       = Array.CreateInstance(ISymbolDocument, sp_count)
@@ -47,80 +57,295 @@ def get_sequence_points(symmethod, include_hidden_lines = False):
   
   symmethod.GetSequencePoints(spOffsets, spDocs, spStartLines, spStartCol, 
                               spEndLines, spEndCol)
+  return spOffsets, spDocs, spStartLines, spStartCol, spEndLines, spEndCol
 
-  for i in range(sp_count):
-    if spStartLines[i] != 0xfeefee or include_hidden_lines:
-      yield sequence_point(spOffsets[i], spDocs[i], spStartLines[i], 
-                           spStartCol[i], spEndLines[i], spEndCol[i])
+def get_sequence_point_table(symbols, function):
+  def load():
+    symmethod = get_symbol_method(symbols, function)
+    if symmethod == None:
+      return None
+    return sequence_point_table(*read_sequence_points(symmethod))
+  with symbols.lock:
+    return symbols.sequence_point_tables.lookup(function.Module, function.Token, 
+                                                load)
 
+def get_scope_table(symbols, function):
+  def load():
+    symmethod = get_symbol_method(symbols, function)
+    if symmethod == None:
+      return None
+    return scope_table(symmethod.RootScope)
+  with symbols.lock:
+    return symbols.scope_tables.lookup(function.Module, function.Token, load)
   
 #--------------------------------------------
-# breakpoint funcitons
+# symbol readers
 
-def create_breakpoint(module, filename, linenum):
-    reader = module.SymbolReader
+#module symbols saved on disk by a hash of their symbol stream, so later 
+#runs of the same script don't have to build a symbol reader or scan the 
+#symbols again. None when it's off. It's shared by every session
+_symbol_store = None
+
+#everything read from one process's module symbols. Each debugged process
+#has its own, so a breakpoint or a run to line in one session only binds 
+#in that session's modules. The process's callbacks and its input loop 
+#both use them, so they're only read or changed holding lock
+class debuggee_symbols(object):
+    def __init__(self):
+        #sequence point tables are built once per method and reused for 
+        #every location lookup until the module's symbols are updated
+        self.sequence_point_tables = sequence_point_cache()
+        #local scope tables, kept and invalidated the same way
+        self.scope_tables = method_cache()
+        #source documents of every module with symbols loaded, so binding a
+        #breakpoint to a file is a single lookup instead of a scan of all 
+        #modules. read_sequence_points is looked up when it's called, so 
+        #it's timed when instrumentation wraps it
+        self.index = symbol_index(self.sequence_point_tables, 
+                                  lambda symmethod: read_sequence_points(symmethod))
+        #step ranges by method and offset, so stepping through a function 
+        #only works out each statement's range once
+        self.step_ranges = step_range_cache()
+        #each module's symbols: the reader CorDebug built from the module's
+        #symbol stream, or the cached symbols standing in for it
+        self.readers = dict()
+        #modules whose symbols haven't been read yet, when attached to a 
+        #process. They're read the first time something asks for the 
+        #module's reader
+        self.deferred = deferred_modules()
+        self.lock = threading.RLock()
+
+    #the module's new symbols, replacing everything read from its old ones
+    def update_module(self, module, reader):
+        with self.lock:
+          self.readers[module] = reader
+          self.index.update_module(module, reader)
+          self.step_ranges.invalidate(module)
+          self.scope_tables.invalidate(module)
+
+def get_symbol_reader(symbols, module):
+    with symbols.lock:
+      if module in symbols.deferred:
+        symbols.deferred.realize(module)
+      return symbols.readers.get(module)
+
+def get_symbol_method(symbols, function):
+    reader = get_symbol_reader(symbols, function.Module)
     if reader == None:
       return None
-    
-    # currently, I'm only comparing filenames. This algorithm may need to get more
-    # sophisticated to support differntiating files with the same name in different paths
-    filename = Path.GetFileName(filename)
-    for doc in reader.GetDocuments():
-      if str.Compare(filename, Path.GetFileName(doc.URL), True) == 0:
-        linenum = doc.FindClosestLine(linenum)
-        method = reader.GetMethodFromDocumentPosition(doc, linenum, 0)
-        function = module.GetFunctionFromToken(method.Token.GetToken())
-        
-        for sp in get_sequence_points(method):
-          if sp.doc.URL == doc.URL and sp.start_line == linenum:
-            return function.ILCode.CreateBreakpoint(sp.offset)
-        
-        return function.CreateBreakpoint()
+    return reader.GetMethod(SymbolToken(function.Token))
+
+#(token, symbol method) for the methods in a module that have symbols
+def get_symbol_methods(module, reader):
+    if reader == None:
+      return
+    for t in CorMetadataImport(module).DefinedTypes:
+      for mi in t.GetMethods():
+        try:
+          symmethod = reader.GetMethod(SymbolToken(mi.MetadataToken))
+        except Exception:
+          #no symbols for this method
+          continue
+        if symmethod != None:
+          yield mi.MetadataToken, symmethod
+
+def hash_symbol_stream(stream):
+    stream.Seek(0, 0, IntPtr.Zero)
+    size = stream.Stat(1).cbSize
+    data = Array.CreateInstance(Byte, size)
+    stream.Read(data, size, IntPtr.Zero)
+    stream.Seek(0, 0, IntPtr.Zero)
+    return BitConverter.ToString(SHA1.Create().ComputeHash(data)).replace("-", "")
+
+#the module's symbols, from the symbol store if this symbol stream has been
+#seen before. Otherwise CorDebug reads them, and they're saved to the store
+#for next time. The reader is only used here, on the callback thread, and 
+#the store writes the file on its own. The store is only a cache, so 
+#anything going wrong with it falls back to CorDebug's reader
+def load_module_symbols(module, stream):
+    key = None
+    if _symbol_store != None:
+      try:
+        key = hash_symbol_stream(stream)
+        reader = _symbol_store.load(key)
+      except Exception:
+        key = reader = None
+      if reader != None:
+        return reader
+
+    module.UpdateSymbolReaderFromStream(stream)
+    reader = module.SymbolReader
+    if key != None and reader != None:
+      try:
+        _symbol_store.save_in_background(key, 
+          encode_symbols(*read_module_symbols(module, reader)))
+      except Exception:
+        pass
+    return reader
+
+#what the symbol store saves for a module: its methods' sequence points and
+#scopes, and the method the reader says each line is in
+def read_module_symbols(module, reader):
+    methods = [(token, read_sequence_points(m), m.RootScope) 
+                 for token, m in get_symbol_methods(module, reader)]
+    def containing_method(doc, line):
+      return reader.GetMethodFromDocumentPosition(doc, line, 0).Token.GetToken()
+    return methods, containing_method
+
+#--------------------------------------------
+# breakpoint funcitons
+
+#the (module, document) pairs for a file. Symbols that are still deferred
+#are read first, since any of their modules might have it
+def find_documents(symbols, filename):
+    with symbols.lock:
+      symbols.deferred.realize_all()
+      return symbols.index.find_documents(filename)
+
+def create_breakpoint(symbols, module, filename, linenum):
+    with symbols.lock:
+      doc = symbols.index.find_module_document(module, filename)
+    if doc == None:
+      return None
+    return create_document_breakpoint(symbols, module, doc, linenum)
+
+def create_document_breakpoint(symbols, module, doc, linenum):
+    with symbols.lock:
+      token, offset = symbols.index.resolve_line(module, doc, linenum)
+    function = module.GetFunctionFromToken(token)
+    if offset != None:
+      return function.ILCode.CreateBreakpoint(offset)
+    return function.CreateBreakpoint()
 
 #--------------------------------------------
 # frame functions
 
+#the DLR and IronPython's own frames, hidden unless asked for
+def is_hosting_type(typename):
+    return typename.startswith("Microsoft.Scripting.") \
+      or typename.startswith("IronPython.") \
+      or typename == "PythonConsoleHost"
+
 def get_dynamic_frames(chain):
   for f in chain.Frames:
     method_info = f.GetMethodInfo()
     if method_info == None:
       continue
-    typename = method_info.DeclaringType.Name
-    if typename.startswith("Microsoft.Scripting.") \
-      or typename.startswith("IronPython.") \
-      or typename == "PythonConsoleHost":
+    if is_hosting_type(method_info.DeclaringType.Name):
         continue
     yield f
 
-def get_location(function, offset):
-    symmethod = function.GetSymbolMethod()
-    if symmethod == None:
+def get_location(symbols, function, offset):
+    table = get_sequence_point_table(symbols, function)
+    if table == None:
       return None
+    return table.find(offset)
 
-    prev_sp = None
-    for sp in get_sequence_points(symmethod):
-        if sp.offset > offset: 
-            break
-        prev_sp = sp
-    return prev_sp
+#a location as plain fields, for the machine readable event streams
+def location_fields(offset, sp):
+    if sp == None:
+      return dict(offset = offset)
+    return dict(offset = offset, file = sp.doc.URL, line = sp.start_line, 
+                column = sp.start_col)
 
-def get_frame_location(frame):
+def get_frame_location(symbols, frame):
     offset, mapping_result = frame.GetIP()
 
     if frame.FrameType != CorFrameType.ILFrame:
         return offset, None
-    return offset, get_location(frame.Function, offset)
+    return offset, get_location(symbols, frame.Function, offset)
+
+#--------------------------------------------
+# thread stacks
+
+#what a frame_resolver memoizes frames by. Only IL frames have a function
+#and offset to resolve
+def get_frame_key(frame):
+    if frame.FrameType != CorFrameType.ILFrame:
+      return None
+    return frame.Function, frame.GetIP()[0]
+
+#a frame as (function, file, line), or None if it's one of the DLR's and
+#only the python frames are wanted
+def describe_frame(symbols, function, offset, dynamic_only = True):
+    method_info = function.GetMethodInfo()
+    if method_info == None:
+      return None
+    typename = method_info.DeclaringType.Name
+    if dynamic_only and is_hosting_type(typename):
+      return None
+    sp = get_location(symbols, function, offset)
+    name = "%s::%s" % (typename, method_info.Name)
+    if sp == None:
+      return (name, None, None)
+    return (name, sp.doc.URL, sp.start_line)
+
+def create_frame_resolver(symbols, dynamic_only = True):
+    return frame_resolver(get_frame_key, lambda function, offset: 
+      describe_frame(symbols, function, offset, dynamic_only))
+
+#all of a thread's frames, innermost chain first
+def get_thread_frames(thread):
+    for chain in thread.Chains:
+      for f in chain.Frames:
+        yield f
+
+#the stacks of all the process's threads with identical stacks grouped, 
+#as (stack, thread ids) with the most threads first. Frames are resolved 
+#once each however many threads they're on
+def get_thread_stacks(symbols, process, dynamic_only = True):
+    resolver = create_frame_resolver(symbols, dynamic_only)
+    return group_stacks(dump_threads(process.Threads, get_thread_frames, 
+                                     resolver)), resolver
+
+#the grouped stacks as plain fields, for the machine readable front ends
+def thread_stack_fields(groups):
+    result = []
+    for stack, ids in groups:
+      frames = None
+      if stack != None:
+        frames = [dict(function = function, file = file, line = line)
+                    for function, file, line in stack]
+      result.append(dict(threads = ids, frames = frames))
+    return result
     
+#--------------------------------------------
+# exception functions
+
+_exception_kinds = {
+  CorDebugExceptionCallbackType.DEBUG_EXCEPTION_FIRST_CHANCE: 'first_chance',
+  CorDebugExceptionCallbackType.DEBUG_EXCEPTION_USER_FIRST_CHANCE: 'user_first_chance',
+  CorDebugExceptionCallbackType.DEBUG_EXCEPTION_CATCH_HANDLER_FOUND: 'catch_handler_found',
+  CorDebugExceptionCallbackType.DEBUG_EXCEPTION_UNHANDLED: 'unhandled',
+}
+
+#exception type names, by class
+_exception_types = dict()
+
+def get_exception_type(thread):
+    value = thread.CurrentException
+    if value == None:
+      return None
+    rv = value.CastToReferenceValue()
+    if rv != None:
+      value = rv.Dereference()
+    cls = value.ExactType.Class
+    with _shared_lock:
+      if cls not in _exception_types:
+        _exception_types[cls] = cls.GetTypeInfo().FullName
+      return _exception_types[cls]
+
 #--------------------------------------------
 # stepper functions
 
-def create_stepper(thread, JMC = True):
-  stepper = thread.ActiveFrame.CreateStepper()
+def create_stepper(thread, JMC = True, frame = None):
+  if frame == None:
+    frame = thread.ActiveFrame
+  stepper = frame.CreateStepper()
   stepper.SetUnmappedStopMask(CorDebugUnmappedStop.STOP_NONE)
   stepper.SetJmcStatus(JMC)
   return stepper
   
-from System import UInt32
 def create_step_range(start, end):
   range = Array.CreateInstance(COR_DEBUG_STEP_RANGE, 1)
   range[0] = COR_DEBUG_STEP_RANGE( 
@@ -128,56 +353,52 @@ def create_step_range(start, end):
                 endOffset = UInt32(end))
   return range
   
-def get_step_ranges(thread, reader):
-    frame = thread.ActiveFrame
-    offset, mapResult = frame.GetIP()
-    symmethod = frame.Function.GetSymbolMethod()
-    for sp in get_sequence_points(symmethod):
-        if sp.offset > offset:
-            return create_step_range(offset, sp.offset)
-    return create_step_range(offset, frame.Function.ILCode.Size)
+def get_step_ranges(symbols, function, offset):
+    def load():
+      table = get_sequence_point_table(symbols, function)
+      next_offset = table.next_offset(offset) if table != None else None
+      if next_offset != None:
+          return create_step_range(offset, next_offset)
+      return create_step_range(offset, function.ILCode.Size)
+    with symbols.lock:
+      return symbols.step_ranges.lookup(function.Module, function.Token, 
+                                        offset, load)
   
-def do_step(thread, step_in):
-    stepper = create_stepper(thread)
-    reader = thread.ActiveFrame.Function.Module.SymbolReader
-    if reader == None:
-        stepper.Step(step_in)
+#kind is 'over', 'in' or 'out'. The frame and its location come from the 
+#stop's snapshot, so a step from a stop that has already been shown or 
+#stepped from costs no more debuggee queries. Returns the stepper
+def do_step(symbols, thread, kind, snapshot = None):
+    if snapshot == None:
+      snapshot = thread_snapshot(symbols, thread)
+    frame = snapshot.active_frame
+    stepper = create_stepper(thread, frame = frame)
+    if kind == 'out':
+      stepper.StepOut()
+      return stepper
+    function = frame.Function
+    offset, sp = snapshot.location(frame)
+    with symbols.lock:
+      has_symbols = function.Module in symbols.index
+    if not has_symbols:
+        stepper.Step(kind == 'in')
     else:
-      range = get_step_ranges(thread, reader)
-      stepper.StepRange(step_in, range)      
+      stepper.StepRange(kind == 'in', get_step_ranges(symbols, function, offset))
+    return stepper
       
 #--------------------------------------------
 # value functions
 
-def get_locals(frame, scope=None, offset = None):
-    #if the scope is unspecified, try and get it from the frame
-    if scope == None:
-        symmethod = frame.Function.GetSymbolMethod()
-        if symmethod != None:
-            scope = symmethod.RootScope
-        #if scope still not available, yield the local variables
-        #from the frame, with auto-gen'ed names (local_1, etc)
-        else:
-          for i in range(frame.GetLocalVariablesCount()):
-            yield "local_%d" % i, frame.GetLocalVariable(i)
-          return
-
-    #if we have a scope, get the locals from the scope 
-    #and their values from the frame
-    for lv in scope.GetLocals():
-        #always skip $site locals - they are cached callsites and 
-        #not relevant to the ironpython developer
-        if lv.Name == "$site": 
-          continue
-        v = frame.GetLocalVariable(lv.AddressField1)
-        yield lv.Name, v
-
-    if offset == None: offset = frame.GetIP()[0]
+def get_locals(symbols, frame):
+    table = get_scope_table(symbols, frame.Function)
+    #without symbols, yield the local variables from the frame, with 
+    #auto-gen'ed names (local_1, etc)
+    if table == None:
+      for i in range(frame.GetLocalVariablesCount()):
+        yield "local_%d" % i, frame.GetLocalVariable(i)
+      return
 
-    #recusively call get_locals for all the child scopes
-    for s in scope.GetChildren():
-      if s.StartOffset <= offset and s.EndOffset >= offset:
-        for ret in get_locals(frame, s, offset): yield ret
+    for name, address in table.locals_at(frame.GetIP()[0]):
+      yield name, frame.GetLocalVariable(address)
 
 def get_arguments(frame):
     mi = frame.GetMethodInfo()
@@ -234,19 +455,341 @@ def extract_value(value):
         return value.CastToObjectValue()
     elif value.Type in [ELEMENT_TYPE_CLASS, ELEMENT_TYPE_OBJECT]:
       return value.CastToObjectValue()
+    elif value.Type in [ELEMENT_TYPE_SZARRAY, ELEMENT_TYPE_ARRAY]:
+      return value.CastToArrayValue()
     else:
       raise (Exception,
         "<processing CorValue of type: %s not implemented>" % str(value.Type))
 
+#instance field (name, token) lists, by class. Reading them means a 
+#metadata import, and a class's fields never change once it's loaded
+_class_fields = dict()
+
+def get_class_fields(cls):
+    with _shared_lock:
+      if cls not in _class_fields:
+        flags = BindingFlags.Instance | BindingFlags.Public | BindingFlags.NonPublic
+        _class_fields[cls] = [(fi.Name, fi.MetadataToken) 
+          for fi in cls.GetTypeInfo().GetFields(flags) if not fi.IsStatic]
+      return _class_fields[cls]
+
+#the instance fields of an object, including the ones it inherits
+def get_fields(objvalue):
+    t = objvalue.ExactType
+    while t != None and t.Class != None:
+      for name, token in get_class_fields(t.Class):
+        yield name, objvalue.GetFieldValue(t.Class, token)
+      t = t.Base
+
+def get_elements(arrvalue, start, count):
+    for i in range(start, min(start + count, arrvalue.Count)):
+      yield "[%d]" % i, arrvalue.GetElementAtPosition(i)
+
+#the extracted values of the named locals and arguments, for evaluating
+#breakpoint conditions. Values are only extracted for names that are asked for
+def get_frame_values(symbols, frame, names):
+    values = dict()
+    for frame_values in (get_locals(symbols, frame), get_arguments(frame)):
+      for name, value in frame_values:
+        if name in names and name not in values:
+          v = extract_value(value)
+          values[name] = None if type(v) == NullCorValue else v
+    return values
+
 def display_value(value):
   if type(value) == str:
     return (('"%s"' % value), 'System.String')
   elif type(value) == CorObjectValue:
     return ("<...>", value.ExactType.Class.GetTypeInfo().FullName)
+  elif type(value) == CorArrayValue:
+    element_type = value.ExactType.FirstTypeParameter
+    typename = element_type.Class.GetTypeInfo().FullName \
+      if element_type.Class != None else str(value.ElementType)
+    return ("<%d items>" % value.Count, typename + "[]")
   elif type(value) == NullCorValue:
     return ("<None>", value.typename)
   else:
-    return (str(value), value.GetType().FullName)
+    return (str(value), clr_type_name(value))
+
+#--------------------------------------------
+# heap walks
+
+#type names by class, since each GetTypeInfo is a metadata import
+_class_names = dict()
+
+def get_class_name(cls):
+    with _shared_lock:
+      if cls not in _class_names:
+        _class_names[cls] = cls.GetTypeInfo().FullName
+      return _class_names[cls]
+
+_array_types = [ELEMENT_TYPE_SZARRAY, ELEMENT_TYPE_ARRAY]
+_object_types = [ELEMENT_TYPE_CLASS, ELEMENT_TYPE_OBJECT, ELEMENT_TYPE_VALUETYPE]
+#element types that can lead to other objects. Arrays of anything else are
+#counted without reading their elements
+_reference_types = _array_types + _object_types + [ELEMENT_TYPE_STRING]
+
+def get_heap_type_name(value):
+    if value.Type == ELEMENT_TYPE_STRING:
+      return 'System.String'
+    if value.Type in _array_types:
+      element_type = value.ExactType.FirstTypeParameter
+      if element_type.Class != None:
+        return get_class_name(element_type.Class) + "[]"
+      return str(value.CastToArrayValue().ElementType) + "[]"
+    cls = value.ExactType.Class
+    return get_class_name(cls) if cls != None else str(value.Type)
+
+#the values a heap object refers to, read as the walk gets to them
+def get_heap_references(value):
+    if value.Type in _array_types:
+      av = value.CastToArrayValue()
+      if av.ElementType not in _reference_types:
+        return None
+      return (v for name, v in get_elements(av, 0, av.Count))
+    if value.Type in _object_types:
+      return (v for name, v in get_fields(value.CastToObjectValue()))
+    return None
+
+#a value as heap_walker sees it: (address, type name, size, references).
+#A value type held in a local or field is part of whatever holds it, so it
+#has no address of its own
+def get_heap_object(value):
+    rv = value.CastToReferenceValue()
+    if rv == None:
+      if value.Type == ELEMENT_TYPE_VALUETYPE:
+        return None, None, 0, get_heap_references(value)
+      return None
+    if rv.IsNull:
+      return None
+    target = rv.Dereference()
+    bv = target.CastToBoxValue()
+    if bv != None:
+      return target.Address, get_heap_type_name(bv.GetObject()), target.Size, None
+    return (target.Address, get_heap_type_name(target), target.Size, 
+            get_heap_references(target))
+
+#--------------------------------------------
+# stop snapshot
+
+#everything the console commands read from a stopped thread, memoized
+#until the process continues
+class thread_snapshot(stop_snapshot):
+  def __init__(self, symbols, thread):
+    stop_snapshot.__init__(self)
+    self.symbols = symbols
+    self.thread = thread
+
+  @property
+  def active_frame(self):
+    return self.memo('active_frame', None, lambda: self.thread.ActiveFrame)
+
+  def frames(self, dynamic_only = True):
+    chain = self.memo('chain', None, lambda: self.thread.ActiveChain)
+    if dynamic_only:
+      return self.memo('dynamic_frames', None, lambda: list(get_dynamic_frames(chain)))
+    return self.memo('frames', None, lambda: list(chain.Frames))
+
+  def location(self, frame):
+    return self.memo('location', frame, 
+                     lambda: get_frame_location(self.symbols, frame))
+
+  def method_info(self, frame):
+    return self.memo('method_info', frame, lambda: frame.GetMethodInfo())
+
+  def locals(self, frame):
+    return self.memo('locals', frame, 
+                     lambda: list(get_locals(self.symbols, frame)))
+
+  def arguments(self, frame):
+    return self.memo('arguments', frame, lambda: list(get_arguments(frame)))
+
+  def frame_value(self, frame, name):
+    for n, value in self.locals(frame) + self.arguments(frame):
+      if n == name:
+        return value
+    return None
+
+  def value(self, value):
+    return self.memo('value', value, lambda: extract_value(value))
+
+#--------------------------------------------
+# expression evaluation
+
+#IronPython's builtin eval(context, expression), by appdomain. It evaluates
+#an expression against the globals of the code context it's passed
+_eval_functions = dict()
+
+def get_eval_function(appdomain):
+    with _shared_lock:
+      if appdomain not in _eval_functions:
+        _eval_functions[appdomain] = find_eval_function(appdomain)
+      return _eval_functions[appdomain]
+
+def find_eval_function(appdomain):
+    for assembly in appdomain.Assemblies:
+      for module in assembly.Modules:
+        if Path.GetFileName(module.Name) != "IronPython.dll":
+          continue
+        metadata = CorMetadataImport(module)
+        token = metadata.GetTypeTokenFromName("IronPython.Modules.Builtin")
+        if token == CorMetadataImport.TokenNotFound:
+          continue
+        for mi in metadata.GetType(token).GetMethods():
+          names = [p.Name for p in mi.GetParameters() if p.Position > 0]
+          if mi.Name == 'eval' and names == ['context', 'expression']:
+            return module.GetFunctionFromToken(mi.MetadataToken)
+    return None
+
+#evaluates expressions with CorEval on the stopped thread. Each eval runs 
+#the debuggee until OnEvalComplete or OnEvalException, which throws away 
+#every value and frame read from it before, so the frame's code context and
+#the expression strings are held in strong handles for the whole pass, and 
+#results are displayed as soon as each eval completes
+class CorEvalBackend(eval_backend):
+    #how long an aborted eval gets to unwind before it's abandoned
+    abort_timeout = 1.0
+
+    def __init__(self, debug_process):
+        self.debug_process = debug_process
+        self.context = None
+        self.handles = []
+
+    #paths to locals and their fields are read straight from the frame. 
+    #Anything else is evaluated against the module's globals, which can't
+    #see the frame's locals, so expressions using them are refused rather 
+    #than quietly reading a global of the same name
+    def lookup(self, expression):
+        dp = self.debug_process
+        frame = dp.snapshot.active_frame
+        frame_value = lambda name: dp.snapshot.frame_value(frame, name)
+        try:
+          node = dp.inspector.find(expression, frame_value)
+        except Exception:
+          local_names = sorted(name for name in expression_names(expression) 
+                                 if frame_value(name) != None)
+          if local_names:
+            raise eval_error, "%s uses the locals %s, only paths to locals " \
+              "can be evaluated" % (expression, ", ".join(local_names))
+          return None
+        return node.display()
+
+    def evaluate(self, expression, timeout):
+        dp = self.debug_process
+        function = get_eval_function(dp.active_appdomain)
+        if function == None:
+          raise eval_error, "IronPython's eval function wasn't found"
+        if self.context == None:
+          self.context = self._get_context()
+
+        string = self._strong_handle(
+          self._run(lambda e: e.NewString(expression), expression, timeout))
+        args = Array[CorValue]([self.context, string])
+        result = self._run(lambda e: e.CallFunction(function, args), expression, timeout)
+        return display_value(extract_value(result))
+
+    def _get_context(self):
+        dp = self.debug_process
+        frame = dp.snapshot.active_frame
+        for name, value in dp.snapshot.locals(frame) + dp.snapshot.arguments(frame):
+          if not name.startswith("$"):
+            continue
+          rv = value.CastToReferenceValue()
+          if rv == None or rv.IsNull:
+            continue
+          target = rv.Dereference()
+          if target.ExactType.Class.GetTypeInfo().Name.endswith("CodeContext"):
+            return self._strong_handle(value)
+        raise eval_error, "No code context in the current frame"
+
+    def _strong_handle(self, value):
+        heap = value.CastToReferenceValue().Dereference().CastToHeapValue()
+        handle = heap.CreateHandle(CorDebugHandleType.HANDLE_STRONG)
+        self.handles.append(handle)
+        return handle
+
+    def _run(self, start, expression, timeout):
+        dp = self.debug_process
+        eval = dp.active_thread.CreateEval()
+        start(eval)
+        dp.eval_done.Reset()
+        dp.evaluating = eval
+        try:
+          dp.process.Continue(False)
+          if not dp.eval_done.WaitOne(int(timeout * 1000)):
+            eval.Abort()
+            if dp.eval_done.WaitOne(int(self.abort_timeout * 1000)):
+              raise eval_timeout, "%s timed out after %gs and was aborted" % (
+                expression, timeout)
+            #stuck where an abort can't reach it, like in native code. The 
+            #process is stopped again and the eval left to finish on its own
+            dp.process.Stop(-1)
+            raise eval_timeout, "%s timed out after %gs and couldn't be " \
+              "aborted, it was abandoned" % (expression, timeout)
+        finally:
+          dp.evaluating = None
+        if dp.eval_exception:
+          display, type_name = display_value(extract_value(eval.Result))
+          raise eval_error, "%s threw %s" % (expression, type_name)
+        return eval.Result
+
+    def end_pass(self):
+        dp = self.debug_process
+        for handle in self.handles:
+          handle.Dispose()
+        self.handles = []
+        self.context = None
+        dp.snapshot = thread_snapshot(dp.symbols, dp.active_thread)
+        dp.inspector.clear()
+
+#--------------------------------------------
+# source files
+
+#shared by every session, since they're usually debugging the same files.
+#File.ReadAllLines picks the encoding from the byte order mark
+_source_files = source_cache(read = lambda path: File.ReadAllLines(path))
+
+#--------------------------------------------
+# console output
+
+#the fallback for consoles without ANSI support: one color switch per run 
+#of a color rather than per fragment. The background writer and the input
+#loop's colored prints both change the console's colors, so the whole 
+#span list is written holding the console lock
+def _write_colored_spans(spans):
+    with CC.console_lock:
+      for text, color in spans:
+        if color == None:
+          Console.Write(text)
+        else:
+          with getattr(CC, color): 
+            Console.Write(text)
+
+_console = console_renderer(Console.Write, _write_colored_spans, 
+                            supports_ansi(os.environ))
+
+#the diagnostic output from the CorDebug callbacks, written on a thread 
+#of its own so the callbacks never wait on the console
+_event_output = background_writer(_console)
+
+#--------------------------------------------
+# instrumentation
+
+#what gets timed when instrumentation is on. Nothing is wrapped when it's 
+#off, so it costs nothing. _input mostly waits on the user, so at a stop 
+#only showing where it is and the watches is timed
+_instrumented_helpers = ['read_sequence_points', 'get_sequence_point_table', 
+  'create_breakpoint', 'create_document_breakpoint', 'extract_value', 
+  'load_module_symbols']
+_instrumented_generators = ['get_locals']
+_instrumented_methods = ['OnBreakpoint', 'OnStepComplete', 'OnClassLoad', 
+  'OnException2', 'OnUpdateModuleSymbols', '_print_location', 
+  '_print_watches', '_resume']
+
+#the helpers are module globals, so they're wrapped once for every session
+def instrument_helpers(stats):
+    stats.instrument(globals(), _instrumented_helpers + _instrumented_generators,
+                     _instrumented_generators)
 
 #--------------------------------------------
 # main IPyDebugProcess class
@@ -258,16 +801,68 @@ def inputcmd(cmddict, key):
   return deco
    
 class IPyDebugProcess(object):
+    #the instrumentation timing the callbacks and helpers, or None when 
+    #it's off, and the file its stats are dumped to when the process exits
+    instrumentation = None
+    stats_file = None
+    heap_max_objects = 50000
+    heap_max_seconds = 5.0
+
     def __init__(self, debugger=None):
         self.debugger = debugger if debugger != None \
             else CorDebugger(CorDebugger.GetDefaultDebuggerVersion())
+        if self.instrumentation != None:
+          self.instrumentation.instrument(self, _instrumented_methods)
             
-    def run(self, py_file):
+    def run(self, py_file, breakpoint_file = None, trace_file = None, 
+            exceptions = None):
+        self.start(py_file, breakpoint_file, trace_file, exceptions)
+
+        handles = Array.CreateInstance(WaitHandle, 2)
+        handles[0] = self.terminate_event
+        handles[1] = self.break_event
+
+        while True:
+            self._resume()
+            i = WaitHandle.WaitAny(handles)
+            if i == 0:
+                break
+            self._input()
+
+        self._finish()
+
+    #launches py_file under the debugger. The new process doesn't run
+    #until the first _resume
+    #exceptions is the exception_filter saying which exceptions to stop on
+    def start(self, py_file, breakpoint_file = None, trace_file = None, 
+              exceptions = None):
         self.py_file = py_file
+
         #use the current executing version of IPY to launch the debug process
         ipy = Assembly.GetEntryAssembly().Location
         cmd_line = "\"%s\" -D \"%s\"" % (ipy, py_file)
-        self.process = self.debugger.CreateProcess(ipy, cmd_line)
+        self._setup(self.debugger.CreateProcess(ipy, cmd_line), breakpoint_file,
+                    trace_file, exceptions)
+
+    #attaches to a running process. What it has already loaded is reported 
+    #as load events like anything it loads later
+    def attach(self, pid, breakpoint_file = None, trace_file = None, 
+               exceptions = None):
+        self.py_file = None
+        self._setup(self.debugger.DebugActiveProcess(pid, False), breakpoint_file,
+                    trace_file, exceptions)
+
+    #module symbols and the JMC status of python classes are only worked 
+    #out once a module is needed when this is set. JMC can't wait when 
+    #stopping on exceptions in user code, since that's what CorDebug 
+    #decides those by
+    lazy_modules = False
+
+    def _setup(self, process, breakpoint_file, trace_file, exceptions):
+        specs = load_breakpoint_specs(breakpoint_file) \
+            if breakpoint_file != None else []
+        self.process = process
+        self.symbols = debuggee_symbols()
         
         self.process.OnCreateAppDomain += self.OnCreateAppDomain
         self.process.OnProcessExit += self.OnProcessExit
@@ -275,47 +870,91 @@ class IPyDebugProcess(object):
         self.process.OnBreakpoint += self.OnBreakpoint
         self.process.OnStepComplete += self.OnStepComplete
         self.process.OnClassLoad += self.OnClassLoad
+        self.process.OnException2 += self.OnException2
+        self.process.OnEvalComplete += self.OnEvalComplete
+        self.process.OnEvalException += self.OnEvalException
         
         self.terminate_event = AutoResetEvent(False)
         self.break_event = AutoResetEvent(False)
 
         self.initial_breakpoint = None
         self.breakpoints = []
-        self.source_files = dict()
+        self.breakpoint_states = dict()
+        self.pending_breakpoints = pending_breakpoints()
+        for spec in specs:
+          self.pending_breakpoints.add(spec)
+        self.trace_log = trace_log(trace_file)
+        self.trace_log.start()
+        _event_output.start()
+        self.exception_filter = exceptions if exceptions != None \
+            else exception_filter()
+        self.lazy_jmc = self.lazy_modules and \
+            not self.exception_filter.stops_on('user_first_chance')
+        self.deferred_jmc = deferred_modules()
+        self.detached = False
+        self.exception_counters = exception_counters()
+        self.jmc_batch = jmc_batch()
+        self.eval_done = AutoResetEvent(False)
+        self.eval_exception = False
+        self.evaluating = None
+        self.evaluator = expression_evaluator(CorEvalBackend(self))
+        self.eval_results = stop_snapshot()
+        self.non_user_modules = set()
+        self.class_loads = []
+        self.step_request = None
+        self.stepper = None
+        self.step_stats = step_stats()
+        self.heap_summary = None
+        self.run_to_breakpoints = []
+        self.inspector = value_inspector(extract_value, display_value, 
+                                         get_fields, get_elements)
 
-        handles = Array.CreateInstance(WaitHandle, 2)
-        handles[0] = self.terminate_event
-        handles[1] = self.break_event
+    #everything known about the current stop is only valid until the 
+    #process runs again
+    def _resume(self):
+        if hasattr(self, 'active_thread'): delattr(self, 'active_thread')
+        if hasattr(self, 'active_appdomain'): delattr(self, 'active_appdomain')
+        self.snapshot = None
+        self.inspector.clear()
+        self.eval_results = stop_snapshot()
+        self.process.Continue(False)
 
-        while True:
-            if hasattr(self, 'active_thread'): delattr(self, 'active_thread')
-            if hasattr(self, 'active_appdomain'): delattr(self, 'active_appdomain')
-            self.process.Continue(False)
-            i = WaitHandle.WaitAny(handles)
-            if i == 0:
-                break
-            self._input()
+    def _finish(self):
+        self._flush_class_loads()
+        for type_name, kinds in self.exception_counters.summary():
+          self._log_event("Exceptions", "%s %s" % (type_name, ", ".join(
+              "%s: %d" % (kind, count) for kind, count in sorted(kinds.items()))),
+            type = type_name, **kinds)
+        self.trace_log.close()
+        if self.trace_log.count > 0:
+          self._log_event("TraceLog", "%d records, %d written, %d waits for the writer" % (
+              self.trace_log.count, self.trace_log.written, self.trace_log.waits),
+            count = self.trace_log.count, written = self.trace_log.written, 
+            waits = self.trace_log.waits)
+        _event_output.flush()
 
-    def _print_source_line(self, sp, lines):
-      linecount = len(lines)
+    #source is the source_file the sequence point is in. Only the lines 
+    #shown are taken from it
+    def _print_source_line(self, sp, source):
+      linecount = len(source)
       linecount_fmt = "%%%dd: " % len(str(linecount))
+      lines = source.lines(sp.start_line, sp.end_line)
 
+      spans = []
       for i in range(sp.start_line, sp.end_line+1):
-        with CC.Cyan:
-          Console.Write(linecount_fmt % i)
-        line = lines[i-1] if i <= linecount else ""
+        spans.append((linecount_fmt % i, 'Cyan'))
+        line = lines[i-sp.start_line] if i <= linecount else ""
         start = sp.start_col if i==sp.start_line else 1
         end = sp.end_col if i == sp.end_line else len(line)+1
         
-        with CC.Gray:
-          Console.Write(line.Substring(0, start-1))
-          with CC.Yellow:
-            Console.Write(line.Substring(start-1, end-start))
-          Console.Write(line.Substring(end-1))
+        spans.append((line[:start-1], 'Gray'))
+        spans.append((line[start-1:end-1], 'Yellow'))
+        spans.append((line[end-1:], 'Gray'))
 
         if sp.start_line == sp.end_line == i and sp.start_col == sp.end_col:
-          with CC.Yellow: Console.Write(" ^^^")
-        Console.WriteLine()
+          spans.append((" ^^^", 'Yellow'))
+        spans.append(("\n", None))
+      _console.write(spans)
 
     _inputcmds = dict()
     _breakpointcmds = dict()
@@ -359,14 +998,14 @@ class IPyDebugProcess(object):
     @inputcmd(_inputcmds, ConsoleKey.L)
     def _input_locals_cmd(self, keyinfo):
       def print_value(name, value):
-        display, type_name = display_value(extract_value(value))
+        display, type_name = display_value(self.snapshot.value(value))
         with CC.Magenta: print "  ", name, 
         print display,
         with CC.Green: print type_name
         
       def print_all_values(f, show_hidden):
           count = 0
-          for name,value in f(self.active_thread.ActiveFrame):
+          for name,value in f(self.snapshot.active_frame):
             if name.startswith("$") and not show_hidden:
               continue
             print_value(name, value)
@@ -375,62 +1014,242 @@ class IPyDebugProcess(object):
           
       print "\nLocals"
       show_hidden = (keyinfo.Modifiers & ConsoleModifiers.Alt) == ConsoleModifiers.Alt
-      count = print_all_values(get_locals, show_hidden)
-      count += print_all_values(get_arguments, show_hidden)
+      count = print_all_values(self.snapshot.locals, show_hidden)
+      count += print_all_values(self.snapshot.arguments, show_hidden)
 
       if count == 0:
           with CC.Magenta: print "  No Locals Found" 
 
+    @inputcmd(_inputcmds, ConsoleKey.X)
+    def _input_examine_cmd(self, keyinfo):
+      try:
+        args = Console.ReadLine().strip().split()
+        if len(args) not in (1, 2): raise Exception, "Pass a path and an optional page"
+        page = int(args[1]) - 1 if len(args) == 2 else 0
+        frame = self.snapshot.active_frame
+        node = self.inspector.find(args[0], 
+          lambda name: self.snapshot.frame_value(frame, name))
+
+        display, type_name = node.display()
+        with CC.Magenta: print "  ", args[0],
+        print display,
+        with CC.Green: print type_name
+        for child in node.children(page):
+          display, type_name = child.display()
+          with CC.Magenta: print "    ", child.name,
+          print display,
+          with CC.Green: print type_name
+        if node.page_count > 1:
+          with CC.Cyan:
+            print "  page %d of %d (%d items)" % (page + 1, node.page_count, node.count)
+      except Exception, msg:
+        with CC.Red: print "Examine failed", msg
+      return False
+
     @inputcmd(_inputcmds, ConsoleKey.T)
     def _input_stack_trace_cmd(self, keyinfo):
       print "\nStack Trace"
-      get_frames = get_dynamic_frames(self.active_thread.ActiveChain) \
-          if (keyinfo.Modifiers & ConsoleModifiers.Alt) != ConsoleModifiers.Alt \
-          else self.active_thread.ActiveChain.Frames
-      for f in get_frames:
-          offset, sp = get_frame_location(f)
-          method_info = f.GetMethodInfo()
+      dynamic_only = (keyinfo.Modifiers & ConsoleModifiers.Alt) != ConsoleModifiers.Alt
+      for f in self.snapshot.frames(dynamic_only):
+          offset, sp = self.snapshot.location(f)
+          method_info = self.snapshot.method_info(f)
           print "  ",
           if method_info != None:
             print "%s::%s --" % (method_info.DeclaringType.Name, method_info.Name),
           print sp if sp != None else "(offset %d)" % offset, f.FrameType
       return False
       
+    @inputcmd(_inputcmds, ConsoleKey.A)
+    def _input_all_threads_cmd(self, keyinfo):
+      dynamic_only = (keyinfo.Modifiers & ConsoleModifiers.Alt) != ConsoleModifiers.Alt
+      groups, resolver = get_thread_stacks(self.symbols, self.process, 
+                                           dynamic_only)
+      print "\nAll Threads (%d frames resolved, %d memo hits)" % (resolver.misses,
+        resolver.hits)
+      for stack, ids in groups:
+        with CC.Cyan: 
+          print "  %d thread%s:" % (len(ids), "" if len(ids) == 1 else "s"),
+          print ", ".join(str(id) for id in ids)
+        if stack == None:
+          with CC.Red: print "    stack unavailable"
+          continue
+        if len(stack) == 0:
+          print "    (no frames)"
+        for function, file, line in stack:
+          with CC.Magenta: print "   ", function,
+          print "--", "%s:%d" % (file, line) if file != None else "(no source)"
+      return False
+
+    #the locals and arguments of the stopped thread's python frames. The code
+    #context each frame has leads to its module's globals
+    def _heap_roots(self):
+      for f in self.snapshot.frames():
+        for name, value in self.snapshot.locals(f) + self.snapshot.arguments(f):
+          yield value
+
+    @inputcmd(_inputcmds, ConsoleKey.H)
+    def _input_heap_cmd(self, keyinfo):
+      show_all = (keyinfo.Modifiers & ConsoleModifiers.Alt) == ConsoleModifiers.Alt
+      walker = heap_walker(get_heap_object, self.heap_max_objects, 
+                           self.heap_max_seconds)
+      summary = walker.walk(self._heap_roots())
+      print "\nHeap (%d objects, %d bytes reachable, %.0fms)" % (summary.objects,
+        summary.bytes, summary.elapsed * 1e3)
+      if summary.truncated != None:
+        with CC.Red: print "  stopped early, out of %s budget" % summary.truncated
+      if summary.errors:
+        with CC.Red: print "  %d values couldn't be read" % summary.errors
+      print "  %-48s %8s %10s" % ("type", "count", "bytes")
+      for name, count, size in summary.top(None if show_all else 20):
+        with CC.Magenta: print "  %-48s" % name,
+        print "%8d %10d" % (count, size)
+
+      if self.heap_summary != None:
+        changes = summary.diff(self.heap_summary)
+        print "\nChanges since the last heap summary"
+        if len(changes) == 0:
+          print "  none"
+        for name, count, size in changes[:None if show_all else 20]:
+          with CC.Magenta: print "  %-48s" % name,
+          print "%+8d %+10d" % (count, size)
+      self.heap_summary = summary
+      return False
+
+    @inputcmd(_inputcmds, ConsoleKey.C)
+    def _input_cache_stats_cmd(self, keyinfo):
+      stats = self.snapshot.stats()
+      print "\nStop Cache"
+      with CC.Magenta: print "   hits", 
+      print stats['hits']
+      with CC.Magenta: print "   misses", 
+      print stats['misses']
+      for kind, count in sorted(stats['misses_by_kind'].items()):
+        with CC.Green: print "     ", kind, 
+        print count
+
+      with _shared_lock:
+        stats = _source_files.stats()
+      print "Source Cache"
+      for name in ['files', 'bytes', 'hits', 'misses', 'reloads', 'evictions']:
+        with CC.Magenta: print "  ", name,
+        print stats[name]
+
+      if _symbol_store != None:
+        stats = _symbol_store.stats()
+        print "Symbol Store"
+        for name in ['hits', 'misses', 'saves', 'failures']:
+          with CC.Magenta: print "  ", name,
+          print stats[name]
+
+      if self.lazy_modules:
+        print "Deferred Modules"
+        for name, deferred in [('symbols', self.symbols.deferred), 
+                               ('jmc', self.deferred_jmc)]:
+          stats = deferred.stats()
+          with CC.Magenta: print "  ", name,
+          print "%d read, %d waiting" % (stats['realized'], stats['waiting'])
+
+      print "Steps"
+      with CC.Magenta: print "   range cache hits",
+      step_ranges = self.symbols.step_ranges
+      print step_ranges.hits, "of", step_ranges.hits + step_ranges.misses
+      for kind, steps, lines, intermediate, most in self.step_stats.summary():
+        with CC.Green: print "     ", kind,
+        print "%d steps, %d lines, %d intermediate stops (at most %d)" % (steps,
+          lines, intermediate, most)
+      if self.step_stats.interrupted:
+        with CC.Magenta: print "   interrupted",
+        print self.step_stats.interrupted
+      return False
+
+    @inputcmd(_inputcmds, ConsoleKey.M)
+    def _input_stats_cmd(self, keyinfo):
+      print "\nStats"
+      if self.instrumentation == None:
+        with CC.Magenta: print "  Instrumentation is off, run with -S to turn it on"
+        return False
+      print "  %-24s %8s %10s %8s %8s %8s %8s" % ("us", "count", "total", "mean",
+        "p50", "p99", "max")
+      for name, s in self.instrumentation.summary():
+        with CC.Magenta: print "  %-24s" % name,
+        print "%8d %10d %8.1f %8d %8d %8d" % (s['count'], s['total_us'], 
+          s['mean_us'], s['p50_us'], s['p99_us'], s['max_us'])
+      return False
+
     @inputcmd(_inputcmds, ConsoleKey.S)
     def _input_step_over_cmd(self, keyinfo):
       print "\nStepping"
-      do_step(self.active_thread, False)
+      self._step('over')
       return True
       
     @inputcmd(_inputcmds, ConsoleKey.I)
     def _input_step_in_cmd(self, keyinfo):
       print "\nStepping In"
-      do_step(self.active_thread, True)
+      self._step('in')
       return True
       
     @inputcmd(_inputcmds, ConsoleKey.O)
     def _input_step_out_cmd(self, keyinfo):
       print "\nStepping Out"
-      stepper = create_stepper(self.active_thread)
-      stepper.StepOut()
+      self._step('out')
       return True
+
+    @inputcmd(_inputcmds, ConsoleKey.N)
+    def _input_step_lines_cmd(self, keyinfo):
+      try:
+        count = int(Console.ReadLine())
+        self._step('over', count)
+        print "Stepping %d lines" % count
+        return True
+      except Exception, msg:
+        with CC.Red: print "Step failed", msg
+        return False
+
+    #the line, or file:line, to run to
+    @inputcmd(_inputcmds, ConsoleKey.U)
+    def _input_run_to_line_cmd(self, keyinfo):
+      try:
+        target = Console.ReadLine().strip()
+        if ':' in target:
+          filename, line = target.rsplit(':', 1)
+        else:
+          offset, sp = self.snapshot.location(self.snapshot.active_frame)
+          if sp == None:
+            raise Exception, "there's no source here, pass file:line"
+          filename, line = sp.doc.URL, target
+        self._run_to_line(filename, int(line))
+        print "Running to %s:%s" % (filename, line)
+        return True
+      except Exception, msg:
+        with CC.Red: print "Run to line failed", msg
+        return False
+
+    #a JMC step can end up in any python module, so none of them can wait
+    def _step(self, kind, count = 1):
+        if len(self.deferred_jmc):
+          self.deferred_jmc.realize_all()
+          self._flush_jmc()
+        request = step_request(kind, count)
+        self.stepper = do_step(self.symbols, self.active_thread, kind, self.snapshot)
+        self.step_request = request
+
+    #one shot breakpoints on the line in every module the file is loaded
+    #in. Whatever stops next clears them
+    def _run_to_line(self, filename, line):
+        docs = find_documents(self.symbols, filename)
+        if len(docs) == 0:
+          raise Exception, "%s isn't loaded" % filename
+        for mod, doc in docs:
+          bp = create_document_breakpoint(self.symbols, mod, doc, line)
+          bp.Activate(True)
+          self.run_to_breakpoints.append(bp)
       
     @inputcmd(_breakpointcmds, ConsoleKey.A)
     def _bp_add(self, keyinfo):
       try:
-        args = Console.ReadLine().Trim().split(':')
-        if len(args) != 2: raise Exception, "Only pass two arguments" 
-        linenum = int(args[1])
-        
-        for assm in self.active_appdomain.Assemblies:
-          for mod in assm.Modules:
-              bp = create_breakpoint(mod, args[0], linenum)
-              if bp != None:
-                self.breakpoints.append(bp)
-                bp.Activate(True)
-                Console.WriteLine( "Breakpoint set")
-                return False
-        raise Exception, "Couldn't find %s:%d" % (args[0], linenum)    
+        spec = parse_breakpoint_spec(Console.ReadLine())
+        Console.WriteLine(self._set_breakpoint(spec))
+        return False
 
       except Exception, msg:
         with CC.Red:
@@ -440,11 +1259,88 @@ class IPyDebugProcess(object):
     def _bp_list(self, keyinfo):
       print "\nList Breakpoints"   
       for i, bp in enumerate(self.breakpoints): 
-        sp = get_location(bp.Function, bp.Offset)
+        sp = get_location(self.symbols, bp.Function, bp.Offset)
         state = "Active" if bp.IsActive else "Inactive"
-        print "  %d. %s:%d %s" % (i+1, sp.doc.URL, sp.start_line, state)
+        bp_state = self.breakpoint_states[bp]
+        condition = " %s" % bp_state.condition if bp_state.condition != None else ""
+        print "  %d. %s:%d%s %s (hits: %d)" % (i+1, sp.doc.URL, sp.start_line, 
+          condition, state, bp_state.hit_count)
+      for spec in self.pending_breakpoints:
+        print "  -. %s Pending" % spec
       return False
       
+    @inputcmd(_breakpointcmds, ConsoleKey.T)
+    def _bp_trace_log(self, keyinfo):
+      print "\nTracepoint Log"
+      records = self.trace_log.recent(20)
+      for t, location, hit_count, message in records:
+        with CC.Cyan: print "  %s #%d:" % (location, hit_count),
+        print message
+      if len(records) == 0:
+        with CC.Magenta: print "  No Tracepoint Records"
+      return False
+
+    def _print_eval_result(self, indent, expression, result):
+      with CC.Magenta: print indent, expression,
+      if result[0] == 'value':
+        print result[1],
+        with CC.Green: print result[2]
+      else:
+        with CC.Red: print result[1]
+
+    def _print_watches(self):
+      if len(self.evaluator.watches) == 0:
+        return
+      print "Watches"
+      for i, (expression, result) in enumerate(
+          self.evaluator.evaluate_watches(self.eval_results)):
+        self._print_eval_result("  %d:" % (i+1), expression, result)
+
+    @inputcmd(_inputcmds, ConsoleKey.E)
+    def _input_evaluate_cmd(self, keyinfo):
+      expression = Console.ReadLine().strip()
+      if not expression:
+        with CC.Red: print "Nothing to evaluate"
+        return False
+      result = self.evaluator.evaluate(expression, self.eval_results)
+      self._print_eval_result("  ", expression, result)
+      return False
+
+    _watchcmds = dict()
+
+    @inputcmd(_watchcmds, ConsoleKey.A)
+    def _watch_add(self, keyinfo):
+      try:
+        self.evaluator.add_watch(Console.ReadLine())
+        self._print_watches()
+      except Exception, msg:
+        with CC.Red: print "Add watch failed", msg
+
+    @inputcmd(_watchcmds, ConsoleKey.D)
+    def _watch_delete(self, keyinfo):
+      try:
+        number = int(Console.ReadLine())
+        self.evaluator.remove_watch(number)
+        print "\nWatch %d deleted" % number
+      except Exception, msg:
+        with CC.Red: print "Delete watch failed", msg
+
+    @inputcmd(_watchcmds, ConsoleKey.L)
+    def _watch_list(self, keyinfo):
+      print
+      self._print_watches()
+      if len(self.evaluator.watches) == 0:
+        with CC.Magenta: print "  No Watches"
+
+    @inputcmd(_inputcmds, ConsoleKey.W)
+    def _input_watch(self, keyinfo):
+        keyinfo2 = Console.ReadKey()
+        if keyinfo2.Key in IPyDebugProcess._watchcmds:
+            return IPyDebugProcess._watchcmds[keyinfo2.Key](self, keyinfo2)
+        else:
+            print "\nInvalid watch command", str(keyinfo2.Key)
+            return False
+
     @inputcmd(_breakpointcmds, ConsoleKey.E)
     def _bp_enable(self, keyinfo):
       self._set_bp_status(True)
@@ -476,28 +1372,53 @@ class IPyDebugProcess(object):
             print "\nInvalid breakpoint command", str(keyinfo2.Key)
             return False
             
+    #frames without symbols, like library code an exception was thrown in,
+    #have no source to show, so the method and IL offset stand in for it
+    def _print_location(self):
+        frame = self.snapshot.active_frame
+        offset, sp = self.snapshot.location(frame)
+        if sp != None:
+          self._print_source_line(sp, self._get_file(sp.doc.URL))
+          return
+        method_info = self.snapshot.method_info(frame)
+        name = "%s::%s" % (method_info.DeclaringType.Name, method_info.Name) \
+            if method_info != None else "unknown method"
+        _console.write([(name, 'Cyan'), 
+                        (" -- offset %d, no source\n" % offset, 'Gray')])
+
     def _input(self):
-        offset, sp = get_frame_location(self.active_thread.ActiveFrame)
-        lines = self._get_file(sp.doc.URL)
-        self._print_source_line(sp, lines)
+        _event_output.flush()
+        self._print_location()
+        self._print_watches()
 
         while True:
             print "ipydbg ",
             keyinfo = Console.ReadKey()
-            if keyinfo.Key in IPyDebugProcess._inputcmds:
-              if IPyDebugProcess._inputcmds[keyinfo.Key](self, keyinfo):
+            if keyinfo.Key in self._inputcmds:
+              if self._inputcmds[keyinfo.Key](self, keyinfo):
                 return
             else:
                 print "\nPlease enter a valid command"
         
+    #diagnostic output from the CorDebug callbacks. The fields are the
+    #machine readable version of the message, for headless mode
+    def _log_event(self, event, message, **fields):
+        _event_output.post([("%s %s\n" % (event, message), 'DarkGray')])
+
+    def _log_error(self, message):
+        _event_output.post([(message + "\n", 'Red')])
+
     def OnCreateAppDomain(self, sender,e):
-        with CC.DarkGray: 
-          print "OnCreateAppDomain", e.AppDomain.Name
+        self._log_event("OnCreateAppDomain", e.AppDomain.Name, name = e.AppDomain.Name)
         e.AppDomain.Attach()
   
     def OnProcessExit(self, sender,e):
-        with CC.DarkGray:
-          print "OnProcessExit"
+        self._log_event("OnProcessExit", "")
+        if self.instrumentation != None and self.stats_file != None:
+          try:
+            self.instrumentation.dump(self.stats_file)
+          except Exception, msg:
+            self._log_error("Writing stats to %s failed %s" % (self.stats_file, msg))
         self.terminate_event.Set()
    
     infrastructure_methods =  ['TryGetExtraValue', 
@@ -507,87 +1428,934 @@ class IPyDebugProcess(object):
       'CustomSymbolDictionary.GetExtraKeys', 
       'IModuleDictionaryInitialization.InitializeModuleDictionary']
       
+    #python classes in the IronPython.NewTypes namespace only implement python
+    #class semantics, they have no python code in them so they aren't JMC
+    _jmc = jmc_classifier(infrastructure_methods, ['IronPython.NewTypes'])
+
+    #class loads are only logged when asked for, since IronPython loads a
+    #huge number of types on the way to the first breakpoint
+    log_class_loads = False
+
+    #exceptions are only counted by type when asked for, for the same reason
+    count_exceptions = False
+
     def OnClassLoad(self, sender, e):
-        mt = e.Class.GetTypeInfo()
-        with CC.DarkGray:
-          print "OnClassLoad", mt.Name
-        
+        module = e.Class.Module
+        #python classes wait for their module to be needed, and the rest 
+        #are left as non-user code, which is what all code starts out as
+        if self.lazy_jmc and not self.log_class_loads:
+          if module.IsDynamic:
+            cls = e.Class
+            self.deferred_jmc.defer(module, lambda: self._set_class_jmc(cls, module))
+          return
+
+        mt = e.Class.GetTypeInfo() \
+            if self.log_class_loads or module.IsDynamic else None
+        if self.log_class_loads:
+          self.class_loads.append(mt.Name)
+          if len(self.class_loads) >= 256:
+            self._flush_class_loads()
+        self._set_class_jmc(e.Class, module, mt)
+
+    def _set_class_jmc(self, cls, module, mt = None):
         #python code is always in a dynamic module, 
-        #so non-dynamic modules aren't JMC
-        if not e.Class.Module.IsDynamic:
-          e.Class.JMCStatus = False
-        
-        #python classes in the IronPython.NewTypes only implement python class 
-        #semantics, they have no python code in them so they aren't JMC
-        elif mt.Name.startswith('IronPython.NewTypes'):
-          e.Class.JMCStatus = False
+        #so non-dynamic modules aren't JMC. That only needs setting once 
+        #for the whole module
+        if not module.IsDynamic:
+          if module not in self.non_user_modules:
+            module.SetJmcStatus(False, None)
+            self.non_user_modules.add(module)
+          return
+
+        if mt == None:
+          mt = cls.GetTypeInfo()
+        if not IPyDebugProcess._jmc.is_user_type(mt.Name, True):
+          cls.JMCStatus = False
           
         #assume that dynamic module classes not in the IronPython.NewTypes 
-        #namespace are python modules, so mark them as JMC and iterate thru
-        #the methods looking for standard infrastructure methods to mark as
-        #JMC disabled
+        #namespace are python modules, so mark them as JMC and queue up the 
+        #standard infrastructure methods to mark as JMC disabled
         else:
-          e.Class.JMCStatus = True
-          
-          for mmi in mt.GetMethods():
-            if mmi.Name in IPyDebugProcess.infrastructure_methods:
-              f = e.Class.Module.GetFunctionFromToken(mmi.MetadataToken)
-              f.JMCStatus = False
+          cls.JMCStatus = True
+          tokens = IPyDebugProcess._jmc.infrastructure_tokens(
+            (mmi.Name, mmi.MetadataToken) for mmi in mt.GetMethods())
+          if self.jmc_batch.add(module, tokens) or self._jmc_in_use():
+            self._flush_jmc()
+
+    #JMC statuses are read by JMC steppers and by stopping on exceptions in
+    #user code. Without either, nothing reads them before the debuggee next
+    #stops, and every stop flushes the batch first
+    def _jmc_in_use(self):
+        return self.stepper != None or \
+            self.exception_filter.stops_on('user_first_chance')
+
+    def _flush_jmc(self):
+        def disable(module, tokens):
+          for token in tokens:
+            module.GetFunctionFromToken(token).JMCStatus = False
+        self.jmc_batch.flush(disable)
+
+    def _flush_class_loads(self):
+        if self.class_loads:
+          self._log_class_loads(self.class_loads)
+          self.class_loads = []
+
+    def _log_class_loads(self, names):
+        _event_output.post([("".join("OnClassLoad %s\n" % name for name in names), 
+                             'DarkGray')])
 
     def OnUpdateModuleSymbols(self, sender,e):
-        with CC.DarkGray:
-          print "OnUpdateModuleSymbols", e.Module.Name
+        self._log_event("OnUpdateModuleSymbols", e.Module.Name, module = e.Module.Name)
 
-        e.Module.UpdateSymbolReaderFromStream(e.Stream)
-        if self.initial_breakpoint == None:
-            self.initial_breakpoint = create_breakpoint(e.Module, self.py_file, 1)
+        #the stream is kept until the module is needed, and only the latest
+        #one is read. Breakpoints waiting for their file can't wait though
+        module, stream = e.Module, e.Stream
+        if self.lazy_modules and len(self.pending_breakpoints) == 0:
+          with self.symbols.lock:
+            self.symbols.deferred.defer(module, 
+              lambda: self._update_module_symbols(module, stream), 'symbols')
+        else:
+          self._update_module_symbols(module, stream)
+
+    def _update_module_symbols(self, module, stream):
+        self.deferred_jmc.realize(module)
+        self.symbols.update_module(module, load_module_symbols(module, stream))
+        self._bind_pending_breakpoints(module)
+        if self.initial_breakpoint == None and self.py_file != None:
+            self.initial_breakpoint = create_breakpoint(self.symbols, module, 
+                                                        self.py_file, 1)
             if self.initial_breakpoint != None:
-              self.initial_breakpoint.Activate(True)
-              self.breakpoints.append(self.initial_breakpoint)
+              self._add_breakpoint(self.initial_breakpoint)
+
+    #binds the spec to every module its file is loaded in. Files that 
+    #haven't been loaded yet get a pending breakpoint, bound when their 
+    #module's symbols show up
+    def _set_breakpoint(self, spec):
+        docs = find_documents(self.symbols, spec.filename)
+        if len(docs) == 0:
+          self.pending_breakpoints.add(spec)
+          return "Breakpoint pending until %s is loaded" % spec.filename
+        urls = dict((normalize_path(doc.URL), doc.URL) for mod, doc in docs)
+        if len(urls) > 1:
+          raise Exception, "%s is ambiguous, use one of %s" % (spec.filename, 
+            ", ".join(sorted(urls.values())))
+
+        for mod, doc in docs:
+          bp = create_document_breakpoint(self.symbols, mod, doc, spec.line)
+          self._add_breakpoint(bp, spec.condition, "%s:%d" % (doc.URL, spec.line))
+        return "Breakpoint set"
+
+    def _bind_pending_breakpoints(self, module):
+        with self.symbols.lock:
+          matches = self.pending_breakpoints.take_module_matches(
+            self.symbols.index, module)
+        for spec, doc in matches:
+          try:
+            bp = create_document_breakpoint(self.symbols, module, doc, spec.line)
+            self._add_breakpoint(bp, spec.condition, "%s:%d" % (doc.URL, spec.line))
+            self._log_event("BoundPendingBreakpoint", str(spec), spec = str(spec))
+          except Exception, msg:
+            self._log_error("Bind breakpoint %s failed %s" % (spec, msg))
+
+    def _add_breakpoint(self, bp, condition = None, location = None):
+        bp.Activate(True)
+        self.breakpoints.append(bp)
+        self.breakpoint_states[bp] = breakpoint_state(condition, location, 
+                                                      self.trace_log)
+
+    #counts the hit and checks the breakpoint's condition. Hits that don't 
+    #satisfy it continue the process right here in the callback, without 
+    #ever waking up the input loop
+    def _should_break(self, e):
+        state = self.breakpoint_states.get(e.Breakpoint)
+        if state == None:
+          return True
+        try:
+          return state.hit(lambda names: 
+                           get_frame_values(self.symbols, e.Thread.ActiveFrame, names))
+        except Exception, msg:
+          self._log_error("Breakpoint condition %s failed %s" % (state.condition, msg))
+          return True
 
     def OnBreakpoint(self, sender,e):
-        method_info =  e.Thread.ActiveFrame.Function.GetMethodInfo()
-        offset, sp = get_frame_location(e.Thread.ActiveFrame)
-        with CC.DarkGray:
-          print "OnBreakpoint", method_info.Name, "Location:", sp if sp != None else "offset %d" % offset
-        self._do_break_event(e)
+        #breakpoints hit by code an eval runs don't stop
+        if self.evaluating != None or not self._should_break(e):
+          e.Continue = True
+          return
+        snapshot = thread_snapshot(self.symbols, e.Thread)
+        method_info = snapshot.method_info(snapshot.active_frame)
+        offset, sp = snapshot.location(snapshot.active_frame)
+        self._log_event("OnBreakpoint", "%s Location: %s" % (method_info.Name, 
+            sp if sp != None else "offset %d" % offset), 
+          method = method_info.Name, thread = e.Thread.Id, 
+          **location_fields(offset, sp))
+        self._do_break_event(e, snapshot)
+
+    #exceptions the filter doesn't stop on are dismissed right here without
+    #waking up the input loop. Reading an exception's type is several 
+    #debuggee queries, so it's only read for kinds the filter stops on, or
+    #when exceptions are being counted
+    def OnException2(self, sender, e):
+        self._flush_jmc()
+        kind = _exception_kinds[e.EventType]
+        if kind == 'catch_handler_found' or self.evaluating != None:
+          return
+        stops = self.exception_filter.stops_on(kind)
+        if not stops and not self.count_exceptions:
+          return
+        type_name = get_exception_type(e.Thread)
+        if self.count_exceptions:
+          self.exception_counters.count(type_name, kind)
+        if not stops or not self.exception_filter.matches_type(type_name):
+          return
+
+        snapshot = thread_snapshot(self.symbols, e.Thread)
+        offset, sp = snapshot.location(snapshot.active_frame)
+        self._log_event("OnException", "%s %s Location: %s" % (kind, type_name,
+            sp if sp != None else "offset %d" % offset), 
+          kind = kind, type = type_name, thread = e.Thread.Id, 
+          **location_fields(offset, sp))
+        self._do_break_event(e, snapshot)
 
+    #an abandoned eval that finishes later has nobody waiting for it, so 
+    #the process just carries on, whether or not another eval is running
+    def OnEvalComplete(self, sender, e):
+        if e.Eval != self.evaluating:
+          self._log_event("OnEvalComplete", "abandoned eval finished")
+          e.Continue = True
+          return
+        self.eval_exception = False
+        e.Continue = False
+        self.eval_done.Set()
+
+    def OnEvalException(self, sender, e):
+        if e.Eval != self.evaluating:
+          self._log_event("OnEvalException", "abandoned eval threw")
+          e.Continue = True
+          return
+        self.eval_exception = True
+        e.Continue = False
+        self.eval_done.Set()
+
+    #steps that aren't done yet - stopped on a call, off a source line or 
+    #short of the number of lines asked for - step on from right here, 
+    #without waking up the input loop
     def OnStepComplete(self, sender,e):
-        offset, sp = get_frame_location(e.Thread.ActiveFrame)
-        with CC.DarkGray:
-          print "OnStepComplete Reason:", e.StepReason, "Location:", sp if sp != None else "offset %d" % offset
-        if e.StepReason == CorDebugStepReason.STEP_CALL:
-          do_step(e.Thread, False)
-        else:
-          self._do_break_event(e)
+        self._flush_jmc()
+        snapshot = thread_snapshot(self.symbols, e.Thread)
+        offset, sp = snapshot.location(snapshot.active_frame)
+        request = self.step_request if self.step_request != None \
+            else step_request('over')
+        into_call = e.StepReason == CorDebugStepReason.STEP_CALL
+        if request.step_again(into_call, sp != None):
+          self.step_request = request
+          #a step that stopped on a call steps over it, as it always has
+          kind = 'over' if into_call else request.next_kind
+          self.stepper = do_step(self.symbols, e.Thread, kind, snapshot)
+          return
+
+        self.step_stats.add(request)
+        self.step_request = None
+        self.stepper = None
+        self._log_event("OnStepComplete", "Reason: %s Location: %s (%s)" % (
+            e.StepReason, sp if sp != None else "offset %d" % offset, request), 
+          reason = str(e.StepReason), thread = e.Thread.Id, lines = request.lines,
+          intermediate = request.intermediate, **location_fields(offset, sp))
+        self._do_break_event(e, snapshot)
             
-    def _do_break_event(self, e):
+    #the snapshot collects what gets read from the thread during this stop,
+    #and is thrown away when the process continues
+    def _do_break_event(self, e, snapshot = None):
+        self._flush_jmc()
+        self._flush_class_loads()
+        #a breakpoint or exception cut the step short
+        if self.step_request != None:
+          self.step_stats.add(self.step_request, False)
+          self.step_request = None
+          if self.stepper != None and self.stepper.IsActive():
+            self.stepper.Deactivate()
+          self.stepper = None
+        for bp in self.run_to_breakpoints:
+          bp.Activate(False)
+        self.run_to_breakpoints = []
         self.active_appdomain = e.AppDomain
         self.active_thread = e.Thread
+        self.snapshot = snapshot if snapshot != None \
+            else thread_snapshot(self.symbols, e.Thread)
         e.Continue = False
         self.break_event.Set()
         
     def _get_file(self,filename):
-        filename = Path.GetFullPath(filename)
-        if not filename in self.source_files:
-          self.source_files[filename] = File.ReadAllLines(filename)
-        return self.source_files[filename] 
+        with _shared_lock:
+          return _source_files.get(Path.GetFullPath(filename))
     
 
       
 
-def run_debugger(py_file):
+#--------------------------------------------
+# attaching
+
+#debugs a process that's already running, like a service that takes
+#minutes to restart. It can have thousands of types loaded by the time we
+#attach, so their JMC status and module symbols wait until a module is
+#first needed for a breakpoint, a stack frame or a step. Ctrl+C while it's
+#running, or D at a stop, detaches and leaves the process running
+class AttachDebugProcess(IPyDebugProcess):
+    lazy_modules = True
+
+    def run(self, pid, breakpoint_file = None, trace_file = None, 
+            exceptions = None):
+        watch = Stopwatch.StartNew()
+        self.attach(pid, breakpoint_file, trace_file, exceptions)
+        watch.Stop()
+        self._log_event("Attached", "to process %d in %.0fms" % (pid, 
+          watch.Elapsed.TotalMilliseconds), pid = pid)
+
+        detach_event = AutoResetEvent(False)
+        def cancel(sender, e):
+          e.Cancel = True
+          detach_event.Set()
+        Console.CancelKeyPress += cancel
+
+        handles = Array.CreateInstance(WaitHandle, 3)
+        handles[0] = self.terminate_event
+        handles[1] = self.break_event
+        handles[2] = detach_event
+        try:
+          while not self.detached:
+            self._resume()
+            i = WaitHandle.WaitAny(handles)
+            if i == 0:
+              break
+            if i == 2:
+              self.process.Stop(-1)
+              self.detach()
+              break
+            self._input()
+        finally:
+          Console.CancelKeyPress -= cancel
+        if self.detached:
+          print "\nDetached from process %d, it's still running" % pid
+        self._finish()
+
+    #the process has to be stopped. Breakpoints and steppers go first, 
+    #or the process would hit them with no debugger to handle them
+    def detach(self):
+        for bp in self.breakpoints + self.run_to_breakpoints:
+          if bp.IsActive:
+            bp.Activate(False)
+        if self.stepper != None and self.stepper.IsActive():
+          self.stepper.Deactivate()
+        self.process.Detach()
+        self.detached = True
+
+    _inputcmds = dict(IPyDebugProcess._inputcmds)
+
+    @inputcmd(_inputcmds, ConsoleKey.D)
+    def _input_detach_cmd(self, keyinfo):
+      print "\nDetach"
+      try:
+        self.detach()
+        return True
+      except Exception, msg:
+        with CC.Red: print "Detach failed", msg
+        return False
+
+#--------------------------------------------
+# debugger backend
+
+#the debugger_backend interface over CorDebug, for the front ends that 
+#don't use the console
+class BackendDebugProcess(IPyDebugProcess, debugger_backend):
+    def get_locals(self):
+        frame = self.snapshot.active_frame
+        result = []
+        for name, value in self.snapshot.locals(frame) + self.snapshot.arguments(frame):
+          if name.startswith("$"):
+            continue
+          display, type_name = display_value(self.snapshot.value(value))
+          result.append(dict(name = name, value = display, type = type_name))
+        return result
+
+    def get_stack(self):
+        result = []
+        for f in self.snapshot.frames():
+          offset, sp = self.snapshot.location(f)
+          method_info = self.snapshot.method_info(f)
+          frame = location_fields(offset, sp)
+          if method_info != None:
+            frame['function'] = "%s::%s" % (method_info.DeclaringType.Name, 
+                                             method_info.Name)
+          result.append(frame)
+        return result
+
+    def get_threads(self):
+        groups, resolver = get_thread_stacks(self.symbols, self.process)
+        return thread_stack_fields(groups)
+
+    def add_breakpoint(self, spec):
+        return self._set_breakpoint(parse_breakpoint_spec(spec))
+
+    def step(self, kind):
+        self._step(kind)
+
+    def get_stats(self):
+        if self.instrumentation == None:
+          return dict()
+        return dict(self.instrumentation.summary())
+
+    def quit(self):
+        self.process.Stop(0)
+        self.process.Terminate(255)
+
+    def resume(self):
+        self._resume()
+
+    def _log_class_loads(self, names):
+        for name in names:
+          self._log_event("OnClassLoad", name, name = name)
+
+#--------------------------------------------
+# headless batch mode
+
+#runs debugger commands from a script or stdin instead of the console, 
+#and reports everything that happens as JSON lines
+class HeadlessDebugProcess(BackendDebugProcess):
+    def __init__(self, commands, events, debugger=None):
+        IPyDebugProcess.__init__(self, debugger)
+        self.events = events
+        self.batch = batch_commands(self, commands, events)
+
+    def run(self, py_file, breakpoint_file = None, trace_file = None, 
+            exceptions = None):
+        try:
+          IPyDebugProcess.run(self, py_file, breakpoint_file, trace_file, 
+                              exceptions)
+        finally:
+          self.events.flush()
+
+    def _log_event(self, event, message, **fields):
+        self.events.emit(event, **fields)
+
+    def _log_error(self, message):
+        self.events.emit("error", message = message)
+
+    def _input(self):
+        self.batch.on_stop()
+
+#--------------------------------------------
+# session recording
+
+#debugs on the console as usual, and records every event and the stack 
+#and locals at every stop, to replay without a live process with 
+#recording.py. Class loads are always recorded, but only printed if 
+#they're being logged
+class RecordingDebugProcess(BackendDebugProcess):
+    def __init__(self, recorder, debugger=None):
+        IPyDebugProcess.__init__(self, debugger)
+        self.recorder = recorder
+        self.print_class_loads = self.log_class_loads
+        self.log_class_loads = True
+
+    def run(self, py_file, breakpoint_file = None, trace_file = None, 
+            exceptions = None):
+        try:
+          IPyDebugProcess.run(self, py_file, breakpoint_file, trace_file, 
+                              exceptions)
+        finally:
+          self.recorder.close()
+
+    def _log_event(self, event, message, **fields):
+        self.recorder.record(event, **fields)
+        IPyDebugProcess._log_event(self, event, message, **fields)
+
+    def _log_class_loads(self, names):
+        for name in names:
+          self.recorder.record("OnClassLoad", name = name)
+        if self.print_class_loads:
+          IPyDebugProcess._log_class_loads(self, names)
+
+    def _input(self):
+        self.recorder.record_stop(self.get_stack(), self.get_locals(), 
+                                  thread = self.active_thread.Id)
+        IPyDebugProcess._input(self)
+
+#--------------------------------------------
+# debug server
+
+#serves the session to protocol clients over a socket. The server loop 
+#runs on this thread and drives the process; the callbacks just post 
+#their events to it
+class ServerDebugProcess(BackendDebugProcess):
+    def __init__(self, address, debugger=None):
+        IPyDebugProcess.__init__(self, debugger)
+        self.address = address
+
+    def run(self, py_file, breakpoint_file = None, trace_file = None, 
+            exceptions = None):
+        self.server = debug_server(self, self.address)
+        self.start(py_file, breakpoint_file, trace_file, exceptions)
+        try:
+          self.server.serve()
+        finally:
+          self._finish()
+
+    def _log_event(self, event, message, **fields):
+        self.server.post(event, **fields)
+
+    def _log_error(self, message):
+        self.server.post("error", message = message)
+
+    def _do_break_event(self, e, snapshot = None):
+        IPyDebugProcess._do_break_event(self, e, snapshot)
+        self.server.post_stop(thread = e.Thread.Id)
+
+    def OnProcessExit(self, sender, e):
+        IPyDebugProcess.OnProcessExit(self, sender, e)
+        self.server.post_exit()
+
+#--------------------------------------------
+# multiple sessions
+
+#one of several processes debugged side by side from the console. Events 
+#are queued on the session instead of printed, and P adds commands to list, 
+#switch between and control the sessions
+class SessionDebugProcess(IPyDebugProcess):
+    def __init__(self, manager, debugger):
+        IPyDebugProcess.__init__(self, debugger)
+        self.manager = manager
+        self.session = None
+        self.switched = False
+
+    def _log_event(self, event, message, **fields):
+        self.manager.post(self.session, event, message)
+
+    def _log_error(self, message):
+        self.manager.post(self.session, "error", message)
+
+    def _do_break_event(self, e, snapshot = None):
+        IPyDebugProcess._do_break_event(self, e, snapshot)
+        self.manager.stopped(self.session)
+
+    def OnProcessExit(self, sender, e):
+        IPyDebugProcess.OnProcessExit(self, sender, e)
+        self.manager.exited(self.session)
+
+    def resume(self):
+        self._resume()
+
+    def quit(self):
+        self.process.Stop(0)
+        self.process.Terminate(255)
+
+    def _log_class_loads(self, names):
+        for name in names:
+          self._log_event("OnClassLoad", name)
+
+    _inputcmds = dict(IPyDebugProcess._inputcmds)
+    _sessioncmds = dict()
+
+    @inputcmd(_sessioncmds, ConsoleKey.L)
+    def _session_list(self, keyinfo):
+      print "\nList Sessions"
+      for session in self.manager.sessions:
+        marker = "*" if session is self.session else " "
+        events = len(session.events) if session is not self.session else 0
+        print " %s%s%s" % (marker, session, 
+          " (%d new events)" % events if events > 0 else "")
+      return False
+
+    #hands the console to another stopped session. This one stays stopped
+    @inputcmd(_sessioncmds, ConsoleKey.S)
+    def _session_switch(self, keyinfo):
+      try:
+        session = self.manager.find(int(Console.ReadLine()))
+        if session.state != 'stopped':
+          raise Exception, "Session %d is %s" % (session.id, session.state)
+        if session is self.session:
+          return False
+        self.manager.current = session
+        self.switched = True
+        return True
+      except Exception, msg:
+        with CC.Red: print "Switch session failed", msg
+
+    @inputcmd(_sessioncmds, ConsoleKey.C)
+    def _session_continue_all(self, keyinfo):
+      print "\nContinuing %d sessions" % self.manager.resume_all()
+      return True
+
+    @inputcmd(_sessioncmds, ConsoleKey.Q)
+    def _session_quit_all(self, keyinfo):
+      print "\nQuitting all sessions"
+      for session in self.manager.sessions:
+        if session.state != 'exited':
+          session.process.quit()
+      self.manager.resume_all()
+      return True
+
+    @inputcmd(_inputcmds, ConsoleKey.P)
+    def _input_session(self, keyinfo):
+        keyinfo2 = Console.ReadKey()
+        if keyinfo2.Key in SessionDebugProcess._sessioncmds:
+            return SessionDebugProcess._sessioncmds[keyinfo2.Key](self, keyinfo2)
+        else:
+            print "\nInvalid session command", str(keyinfo2.Key)
+            return False
+
+def _print_session_events(manager, session):
+    _console.write([("%s %s\n" % (event, message), 'DarkGray') 
+                      for event, message in manager.take_events(session)])
+
+#debugs all the py_files at once from one CorDebugger. The console goes to 
+#whichever session stops, staying with the current one while it's stopped
+def run_sessions(py_files, breakpoint_file = None, trace_file = None, 
+                 exceptions = None):
+    def run():
+        debugger = CorDebugger(CorDebugger.GetDefaultDebuggerVersion())
+        manager = session_manager()
+        for py_file in py_files:
+          process = SessionDebugProcess(manager, debugger)
+          process.session = manager.add(py_file, process)
+          process.start(py_file, breakpoint_file, trace_file, exceptions)
+        for session in manager.sessions:
+          session.process.resume()
+
+        while True:
+          session = manager.next_stop()
+          if session == None:
+            break
+          if session is not manager.current:
+            with CC.Cyan: print "\nSession", session
+            manager.current = session
+          _print_session_events(manager, session)
+          session.process.switched = False
+          session.process._input()
+          if not session.process.switched:
+            manager.resume(session)
+
+        for session in manager.sessions:
+          session.process._finish()
+          _print_session_events(manager, session)
+    run_in_mta(run)
+
+#--------------------------------------------
+# sampling profiler
+
+#a thread's python stack, innermost first, as (function, file, line) frames.
+#The resolver is shared by all the threads in a sample
+def get_profile_stack(thread, resolver):
+    chain = thread.ActiveChain
+    if chain == None:
+      return []
+    return resolver.stack(chain.Frames)
+
+#runs the debuggee without stopping at breakpoints, pausing it every 
+#interval milliseconds to sample the stacks of all its threads
+class ProfileDebugProcess(IPyDebugProcess):
+    def __init__(self, interval = 10, debugger=None):
+        IPyDebugProcess.__init__(self, debugger)
+        self.interval = interval
+        self.profile = sample_profile()
+
+    def run(self, py_file, collapsed_file = None, trace_file = None):
+        self.start(py_file, trace_file = trace_file)
+        self.process.Continue(False)
+        while not self.terminate_event.WaitOne(self.interval):
+          self._sample()
+        self._finish()
+
+        self._print_profile()
+        if collapsed_file != None:
+          self.profile.write_collapsed(collapsed_file)
+
+    def _sample(self):
+        watch = Stopwatch.StartNew()
+        try:
+          self.process.Stop(-1)
+        except Exception, msg:
+          #the process is on its way out
+          return
+        stacks = []
+        resolver = create_frame_resolver(self.symbols)
+        for thread in self.process.Threads:
+          try:
+            stacks.append(get_profile_stack(thread, resolver))
+          except Exception, msg:
+            self._log_error("Sampling thread %d failed %s" % (thread.Id, msg))
+        self.process.Continue(False)
+        watch.Stop()
+        self.profile.add_sample(stacks, watch.Elapsed.TotalSeconds)
+
+    def _do_break_event(self, e, snapshot = None):
+        e.Continue = True
+
+    def _print_profile(self):
+        profile = self.profile
+        stats = profile.pause_stats()
+        with CC.Cyan: print "\nProfile"
+        print "  %d samples, %d stacks" % (profile.samples, profile.stacks)
+        print "  pauses %.3fms mean, %.3fms max, %.1fms total" % (stats['mean'], 
+          stats['max'], stats['total'])
+
+        with CC.Cyan: print "\nFunctions (self, total)"
+        for function, count, total in profile.top_functions():
+          with CC.Magenta: print "  ", function,
+          print count, total
+
+        with CC.Cyan: print "\nLines"
+        for (filename, line), count in profile.top_lines():
+          with CC.Magenta: print "   %s:%d" % (filename, line),
+          print count
+
+#--------------------------------------------
+# line coverage
+
+#runs the script to completion with a breakpoint on every sequence point.
+#Each line's breakpoints are deactivated the first time it runs, right in
+#the callback, so the debuggee only pays for the lines it hasn't run yet.
+#With instrument off it's the same run without the breakpoints, to measure 
+#the overhead against
+class CoverageDebugProcess(IPyDebugProcess):
+    def __init__(self, instrument = True, debugger=None):
+        IPyDebugProcess.__init__(self, debugger)
+        self.instrument = instrument
+        self.coverage = line_coverage()
+
+    def run(self, py_file, trace_file = None):
+        watch = Stopwatch.StartNew()
+        self.start(py_file, trace_file = trace_file)
+        self.process.Continue(False)
+        self.terminate_event.WaitOne()
+        self._finish()
+        watch.Stop()
+        self.elapsed = watch.Elapsed.TotalSeconds
+
+    def OnUpdateModuleSymbols(self, sender, e):
+        IPyDebugProcess.OnUpdateModuleSymbols(self, sender, e)
+        if self.instrument:
+          self._instrument(e.Module)
+
+    def _instrument(self, module):
+        reader = get_symbol_reader(self.symbols, module)
+        for token, symmethod in get_symbol_methods(module, reader):
+          if not self.coverage.add_method(module, token):
+            continue
+          function = module.GetFunctionFromToken(token)
+          table = get_sequence_point_table(self.symbols, function)
+          if table == None:
+            continue
+          for i in range(len(table)):
+            bp = function.ILCode.CreateBreakpoint(table.offsets[i])
+            if self.coverage.add_breakpoint(bp, table.docs[i].URL, 
+                                            table.start_lines[i]):
+              bp.Activate(True)
+
+    def OnBreakpoint(self, sender, e):
+        if e.Breakpoint in self.coverage:
+          for bp in self.coverage.hit(e.Breakpoint):
+            bp.Activate(False)
+          e.Continue = True
+          return
+        IPyDebugProcess.OnBreakpoint(self, sender, e)
+
+    def _do_break_event(self, e, snapshot = None):
+        e.Continue = True
+
+def print_coverage(coverage, elapsed, baseline = None):
+    found, hit = coverage.totals()
+    with CC.Cyan: print "\nCoverage"
+    for url, lines, covered in coverage.summary():
+      with CC.Magenta: print "  ", url,
+      print "%d/%d lines" % (covered, lines)
+    print "  %d/%d lines, %d breakpoints, %d hits, %d bytes of bitmaps" % (hit, 
+      found, coverage.breakpoints, coverage.hits, coverage.nbytes())
+    print "  %.3fs" % elapsed,
+    if baseline != None:
+      print "vs %.3fs without coverage (%.2fx)" % (baseline, 
+        elapsed / baseline if baseline else 0.0),
+    print
+
+#--------------------------------------------
+# entry points
+
+#CorDebug has to be driven from an MTA thread
+def run_in_mta(f):
     if Thread.CurrentThread.GetApartmentState() == ApartmentState.STA:
-        t = Thread(ParameterizedThreadStart(run_debugger))
+        t = Thread(ThreadStart(f))
         t.SetApartmentState(ApartmentState.MTA)
-        t.Start(py_file)
+        t.Start()
         t.Join()   
     else:
-        p = IPyDebugProcess()
-        p.run(py_file)
+        f()
+
+def run_debugger(py_file, breakpoint_file = None, trace_file = None, 
+                 exceptions = None):
+    run_in_mta(lambda: 
+      IPyDebugProcess().run(py_file, breakpoint_file, trace_file, exceptions))
+
+def run_attached(pid, breakpoint_file = None, trace_file = None, 
+                 exceptions = None):
+    run_in_mta(lambda: 
+      AttachDebugProcess().run(pid, breakpoint_file, trace_file, exceptions))
+
+def run_recording(py_file, recording_file, breakpoint_file = None, 
+                  trace_file = None, exceptions = None):
+    run_in_mta(lambda: 
+      RecordingDebugProcess(session_recorder(recording_file)).run(py_file, 
+        breakpoint_file, trace_file, exceptions))
+
+#commands is an iterable of command lines, events a stream for the JSON events
+def run_headless(py_file, commands, events, breakpoint_file = None, trace_file = None,
+                 exceptions = None):
+    run_in_mta(lambda: 
+      HeadlessDebugProcess(commands, event_writer(events)).run(py_file, 
+        breakpoint_file, trace_file, exceptions))
+
+#report_file gets LCOV, or Cobertura XML if it ends in .xml. With baseline
+#the script is run once without coverage first, to compare the times
+def run_coverage(py_file, report_file = None, baseline = False, trace_file = None):
+    def run():
+        baseline_time = None
+        if baseline:
+          dp = CoverageDebugProcess(instrument = False)
+          dp.run(py_file, trace_file)
+          baseline_time = dp.elapsed
+        dp = CoverageDebugProcess()
+        dp.run(py_file, trace_file)
+        print_coverage(dp.coverage, dp.elapsed, baseline_time)
+        if report_file != None:
+          dp.coverage.write(report_file)
+    run_in_mta(run)
+
+def run_profiler(py_file, interval = 10, collapsed_file = None, trace_file = None):
+    run_in_mta(lambda: 
+      ProfileDebugProcess(interval).run(py_file, collapsed_file, trace_file))
+
+#address is (host, port) or the path of a unix socket
+def run_server(py_file, address, breakpoint_file = None, trace_file = None, 
+               exceptions = None):
+    run_in_mta(lambda: 
+      ServerDebugProcess(address).run(py_file, breakpoint_file, trace_file, 
+                                      exceptions))
 
 if __name__ == "__main__":        
+    from optparse import OptionParser
+    parser = OptionParser(usage = "%prog [options] script.py [script.py ...]\n"
+                                  "       %prog [options] -a PID")
+    parser.add_option("-b", "--breakpoints", dest = "breakpoint_file",
+      help = "file of file:line breakpoints to set, one per line")
+    parser.add_option("-t", "--trace-log", dest = "trace_file",
+      help = "append tracepoint records to this file as JSON lines")
+    parser.add_option("-x", "--batch", dest = "commands_file",
+      help = "run without the console, reading debugger commands from this "
+             "file (- for stdin) and writing JSON events to stdout")
+    parser.add_option("-e", "--events", dest = "events_file",
+      help = "write the batch mode events to this file instead of stdout")
+    parser.add_option("-s", "--server", dest = "server_address",
+      help = "run without the console, serving debug protocol clients on "
+             "ADDRESS (host:port, port or a unix socket path)", 
+      metavar = "ADDRESS")
+    parser.add_option("-p", "--profile", dest = "profile", action = "store_true",
+      default = False, help = "profile the script instead of debugging it")
+    parser.add_option("-i", "--interval", dest = "interval", type = "int", 
+      default = 10, help = "milliseconds between profiler samples")
+    parser.add_option("-f", "--flamegraph", dest = "collapsed_file",
+      help = "write the profile's collapsed stacks to this file")
+    parser.add_option("-E", "--break-on-exception", dest = "exceptions",
+      help = "stop on exceptions: a comma separated list of first, user "
+             "(first chance in user code) or unhandled, and the exception types "
+             "to stop on", metavar = "FILTER")
+    parser.add_option("-C", "--count-exceptions", dest = "count_exceptions",
+      action = "store_true", default = False,
+      help = "count the exceptions the debuggee throws by type and kind, and "
+             "print the counts when it exits")
+    parser.add_option("-l", "--log-class-loads", dest = "log_class_loads",
+      action = "store_true", default = False, 
+      help = "log every class the debuggee loads")
+    parser.add_option("-m", "--source-cache", dest = "source_cache", type = "int",
+      default = 32, help = "megabytes of source files to keep in memory")
+    parser.add_option("-c", "--coverage", dest = "coverage", action = "store_true",
+      default = False, help = "collect line coverage instead of debugging")
+    parser.add_option("-o", "--coverage-report", dest = "coverage_file",
+      help = "write the coverage to this file, as Cobertura XML if it ends in "
+             ".xml and LCOV otherwise")
+    parser.add_option("-O", "--coverage-baseline", dest = "coverage_baseline",
+      action = "store_true", default = False, 
+      help = "run the script without coverage first to measure the overhead")
+    parser.add_option("-S", "--stats", dest = "stats_file",
+      help = "time the debugger's callbacks and helpers, and write the "
+             "latency stats to this file as JSON when the debuggee exits")
+    parser.add_option("-y", "--symbol-cache", dest = "symbol_cache",
+      help = "keep the debuggee's symbols in this directory, to skip reading "
+             "them again on later runs of the same script", metavar = "DIR")
+    parser.add_option("-a", "--attach", dest = "attach_pid", type = "int",
+      help = "debug the running process PID instead of starting a script", 
+      metavar = "PID")
+    parser.add_option("-H", "--heap-budget", dest = "heap_budget", type = "int",
+      default = 50000, help = "most objects a heap summary counts", 
+      metavar = "OBJECTS")
+    parser.add_option("-r", "--record", dest = "recording_file",
+      help = "record the session to this file, to replay with recording.py")
+    options, args = parser.parse_args()
+    if options.attach_pid != None and (len(args) > 0 or options.profile or
+        options.coverage or options.server_address != None or 
+        options.commands_file != None or options.recording_file != None):
+      parser.error("attaching debugs on the console, with no python file")
+    if len(args) == 0 and options.attach_pid == None:
+      parser.error("expected the python file to debug")
+    if len(args) > 1 and (options.server_address != None or 
+                          options.commands_file != None):
+      parser.error("batch and server modes debug a single python file")
+    if len(args) > 1 and options.profile:
+      parser.error("the profiler runs a single python file")
+    if len(args) > 1 and options.coverage:
+      parser.error("coverage runs a single python file")
+    if options.recording_file != None and (len(args) > 1 or options.profile or 
+        options.server_address != None or options.commands_file != None):
+      parser.error("only a single console session can be recorded")
 
-    run_debugger(sys.argv[1])        
+    IPyDebugProcess.log_class_loads = options.log_class_loads
+    IPyDebugProcess.count_exceptions = options.count_exceptions
+    IPyDebugProcess.heap_max_objects = options.heap_budget
+    if options.stats_file != None:
+      IPyDebugProcess.instrumentation = instrumentation()
+      IPyDebugProcess.stats_file = options.stats_file
+      instrument_helpers(IPyDebugProcess.instrumentation)
+    _source_files.budget = options.source_cache * 1024 * 1024
+    if options.symbol_cache != None:
+      _symbol_store = symbol_store(options.symbol_cache)
+    exceptions = parse_exception_filter(options.exceptions) \
+      if options.exceptions != None else None
+
+    if options.attach_pid != None:
+      run_attached(options.attach_pid, options.breakpoint_file, 
+                   options.trace_file, exceptions)
+    elif options.coverage:
+      run_coverage(args[0], options.coverage_file, options.coverage_baseline,
+                   options.trace_file)
+    elif options.profile:
+      run_profiler(args[0], options.interval, options.collapsed_file, 
+                   options.trace_file)
+    elif options.server_address != None:
+      run_server(args[0], parse_address(options.server_address), 
+                 options.breakpoint_file, options.trace_file, exceptions)
+    elif options.commands_file != None:
+      #readline rather than iterating the file, which reads ahead and would 
+      #block a driver that waits for our events before sending a command
+      commands = sys.stdin if options.commands_file == '-' \
+        else open(options.commands_file)
+      events = open(options.events_file, 'w') if options.events_file != None \
+        else sys.stdout
+      run_headless(args[0], iter(commands.readline, ''), events, 
+                   options.breakpoint_file, options.trace_file, exceptions)
+    elif len(args) > 1:
+      run_sessions(args, options.breakpoint_file, options.trace_file, exceptions)
+    elif options.recording_file != None:
+      run_recording(args[0], options.recording_file, options.breakpoint_file, 
+                    options.trace_file, exceptions)
+    else:
+      run_debugger(args[0], options.breakpoint_file, options.trace_file, 
+                   exceptions)
 
 
@@ -0,0 +1,88 @@
+#--------------------------------------------
+# just my code classification
+
+#maps name prefixes to values. match returns the value of the longest
+#prefix of name that was added, or default
+class prefix_trie(object):
+  def __init__(self):
+    self._root = dict()
+
+  def add(self, prefix, value):
+    node = self._root
+    for c in prefix:
+      node = node.setdefault(c, dict())
+    node[None] = value
+
+  def match(self, name, default = None):
+    node = self._root
+    result = node.get(None, default)
+    for c in name:
+      node = node.get(c)
+      if node == None:
+        break
+      if None in node:
+        result = node[None]
+    return result
+
+#decides which loaded classes are python code. Python code is always in a
+#dynamic module, and the classes under the non-user prefixes only implement
+#python semantics with no python code in them. The decision is remembered
+#by type name, since IronPython loads the same generated types over and
+#over
+class jmc_classifier(object):
+  def __init__(self, infrastructure_methods, non_user_prefixes = ()):
+    self.infrastructure_methods = frozenset(infrastructure_methods)
+    self._rules = prefix_trie()
+    for prefix in non_user_prefixes:
+      self._rules.add(prefix, False)
+    self._decisions = dict()
+    self.hits = 0
+    self.misses = 0
+
+  def is_user_type(self, type_name, is_dynamic):
+    if not is_dynamic:
+      return False
+    if type_name in self._decisions:
+      self.hits += 1
+      return self._decisions[type_name]
+    self.misses += 1
+    decision = self._decisions[type_name] = self._rules.match(type_name, True)
+    return decision
+
+  #the tokens of the infrastructure methods among (name, token) methods
+  def infrastructure_tokens(self, methods):
+    names = self.infrastructure_methods
+    return [token for name, token in methods if name in names]
+
+#JMCStatus updates waiting to be made. OnClassLoad queues them instead of
+#making a round trip per method, and they are applied together before
+#anything that depends on them - a stop, a step or an exception - with
+#apply(module, tokens) called once per module
+class jmc_batch(object):
+  def __init__(self, batch_size = 256):
+    self.batch_size = batch_size
+    self.applied = 0
+    self.flushes = 0
+    self._pending = dict()
+    self._count = 0
+
+  def __len__(self):
+    return self._count
+
+  #returns True once the batch is full and should be flushed
+  def add(self, module, tokens):
+    if tokens:
+      self._pending.setdefault(module, []).extend(tokens)
+      self._count += len(tokens)
+    return self._count >= self.batch_size
+
+  def flush(self, apply):
+    if self._count == 0:
+      return
+    pending = self._pending
+    self._pending = dict()
+    self._count = 0
+    self.flushes += 1
+    for module, tokens in pending.items():
+      apply(module, tokens)
+      self.applied += len(tokens)
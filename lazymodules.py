@@ -0,0 +1,54 @@
+#--------------------------------------------
+# deferred module work
+
+#work for modules that's put off until the module is first needed, for
+#attaching to a process that already has thousands of types loaded. Work
+#deferred with a key replaces whatever was deferred with that key before,
+#so only the last symbol update for a module is read, and keyed work runs
+#after the rest. Nothing runs for modules that are never needed
+class deferred_modules(object):
+  def __init__(self):
+    self._work = dict()
+    self._keyed = dict()
+    self.deferred = 0
+    self.replaced = 0
+    self.realized = 0
+
+  def defer(self, module, work, key = None):
+    self.deferred += 1
+    if key == None:
+      self._work.setdefault(module, []).append(work)
+      return
+    keyed = self._keyed.setdefault(module, dict())
+    if key in keyed:
+      self.replaced += 1
+    keyed[key] = work
+
+  #runs the module's deferred work, if it has any. The work is taken
+  #first, so anything it needs from the module doesn't run it again
+  def realize(self, module):
+    work = self._work.pop(module, [])
+    keyed = self._keyed.pop(module, dict())
+    if not (work or keyed):
+      return False
+    self.realized += 1
+    for f in work:
+      f()
+    for key in sorted(keyed):
+      keyed[key]()
+    return True
+
+  def realize_all(self):
+    for module in list(set(self._work) | set(self._keyed)):
+      self.realize(module)
+
+  def __contains__(self, module):
+    return module in self._work or module in self._keyed
+
+  #the modules still waiting
+  def __len__(self):
+    return len(set(self._work) | set(self._keyed))
+
+  def stats(self):
+    return dict(waiting = len(self), realized = self.realized,
+                deferred = self.deferred, replaced = self.replaced)
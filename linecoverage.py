@@ -0,0 +1,172 @@
+import time
+from xml.sax.saxutils import quoteattr
+
+#--------------------------------------------
+# line bitmaps
+
+#a set of line numbers as one bit per line
+class line_bitmap(object):
+  def __init__(self):
+    self._bits = bytearray()
+    self._count = 0
+
+  def add(self, line):
+    i, bit = line >> 3, 1 << (line & 7)
+    if i >= len(self._bits):
+      self._bits.extend(bytearray(i + 1 - len(self._bits)))
+    if self._bits[i] & bit:
+      return False
+    self._bits[i] |= bit
+    self._count += 1
+    return True
+
+  def __contains__(self, line):
+    i = line >> 3
+    return i < len(self._bits) and bool(self._bits[i] & (1 << (line & 7)))
+
+  def __len__(self):
+    return self._count
+
+  def __iter__(self):
+    for i, byte in enumerate(self._bits):
+      if byte:
+        for bit in range(8):
+          if byte & (1 << bit):
+            yield (i << 3) | bit
+
+  @property
+  def nbytes(self):
+    return len(self._bits)
+
+#--------------------------------------------
+# line coverage
+
+#the lines of each document that have code, and the ones that ran.
+#Breakpoints are one shot: hit returns the breakpoints to deactivate, which
+#is every breakpoint left on the line that was hit, since once a line has
+#run the others can't tell us anything new. Breakpoints and modules are
+#only used as keys
+class line_coverage(object):
+  def __init__(self):
+    self.lines = dict()
+    self.covered = dict()
+    self.breakpoints = 0
+    self.hits = 0
+    self._methods = set()
+    self._locations = dict()
+    self._line_breakpoints = dict()
+
+  #True the first time a method is seen, so a module whose symbols are
+  #updated again only gets its new methods instrumented
+  def add_method(self, module, token):
+    key = (module, token)
+    if key in self._methods:
+      return False
+    self._methods.add(key)
+    return True
+
+  def _document(self, url):
+    if url not in self.lines:
+      self.lines[url] = line_bitmap()
+      self.covered[url] = line_bitmap()
+    return self.lines[url], self.covered[url]
+
+  def add_breakpoint(self, bp, url, line):
+    lines, covered = self._document(url)
+    lines.add(line)
+    if line in covered:
+      return False
+    self._locations[bp] = (url, line)
+    self._line_breakpoints.setdefault((url, line), []).append(bp)
+    self.breakpoints += 1
+    return True
+
+  def __contains__(self, bp):
+    return bp in self._locations
+
+  def hit(self, bp):
+    self.hits += 1
+    location = self._locations.get(bp)
+    if location == None:
+      return []
+    url, line = location
+    self.covered[url].add(line)
+    done = self._line_breakpoints.pop(location)
+    for b in done:
+      del self._locations[b]
+    return done
+
+  #breakpoints still waiting for their first hit
+  @property
+  def pending(self):
+    return len(self._locations)
+
+  #(url, lines with code, lines covered), by url
+  def summary(self):
+    return [(url, len(self.lines[url]), len(self.covered[url]))
+              for url in sorted(self.lines)]
+
+  def totals(self):
+    found = sum(len(b) for b in self.lines.values())
+    hit = sum(len(b) for b in self.covered.values())
+    return found, hit
+
+  def nbytes(self):
+    return sum(b.nbytes for b in self.lines.values()) + \
+           sum(b.nbytes for b in self.covered.values())
+
+  def lcov(self, test_name = ""):
+    out = []
+    for url in sorted(self.lines):
+      lines, covered = self.lines[url], self.covered[url]
+      out.append("TN:%s" % test_name)
+      out.append("SF:%s" % url)
+      for line in lines:
+        out.append("DA:%d,%d" % (line, 1 if line in covered else 0))
+      out.append("LF:%d" % len(lines))
+      out.append("LH:%d" % len(covered))
+      out.append("end_of_record")
+    return "\n".join(out) + "\n"
+
+  def cobertura(self, timestamp = None):
+    def rate(found, hit):
+      return "%.4f" % (float(hit) / found if found else 1.0)
+    if timestamp == None:
+      timestamp = int(time.time())
+    found, hit = self.totals()
+    out = ['<?xml version="1.0" ?>',
+           '<!DOCTYPE coverage SYSTEM "http://cobertura.sourceforge.net/xml/coverage-04.dtd">',
+           '<coverage line-rate="%s" branch-rate="0" lines-valid="%d" '
+           'lines-covered="%d" branches-valid="0" branches-covered="0" '
+           'complexity="0" version="ipydbg" timestamp="%d">' % (
+             rate(found, hit), found, hit, timestamp),
+           '  <sources><source></source></sources>',
+           '  <packages>',
+           '    <package name="ipydbg" line-rate="%s" branch-rate="0" '
+           'complexity="0">' % rate(found, hit),
+           '      <classes>']
+    for url in sorted(self.lines):
+      lines, covered = self.lines[url], self.covered[url]
+      out.append('        <class name=%s filename=%s line-rate="%s" '
+                 'branch-rate="0" complexity="0">' % (quoteattr(url),
+                   quoteattr(url), rate(len(lines), len(covered))))
+      out.append('          <methods/>')
+      out.append('          <lines>')
+      for line in lines:
+        out.append('            <line number="%d" hits="%d"/>' % (line,
+                     1 if line in covered else 0))
+      out.append('          </lines>')
+      out.append('        </class>')
+    out.extend(['      </classes>', '    </package>', '  </packages>',
+                '</coverage>'])
+    return "\n".join(out) + "\n"
+
+  #cobertura XML for .xml files, LCOV tracefiles for anything else
+  def write(self, filename):
+    report = self.cobertura() if filename.lower().endswith('.xml') \
+      else self.lcov()
+    f = open(filename, 'w')
+    try:
+      f.write(report)
+    finally:
+      f.close()
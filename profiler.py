@@ -0,0 +1,75 @@
+#--------------------------------------------
+# sampling profiler
+
+#aggregates the stacks sampled from a paused debuggee. A stack is a list of
+#(function, file, line) frames, innermost first - the order the frame
+#helpers walk them in. file and line are None for frames without source
+class sample_profile(object):
+  def __init__(self):
+    self.samples = 0
+    self.stacks = 0
+    self.function_self = dict()
+    self.function_total = dict()
+    self.line_counts = dict()
+    self.collapsed_counts = dict()
+    self.pause_times = []
+
+  def add_stack(self, stack):
+    if len(stack) == 0:
+      return
+    self.stacks += 1
+
+    function, file, line = stack[0]
+    self.function_self[function] = self.function_self.get(function, 0) + 1
+    if file != None:
+      key = (file, line)
+      self.line_counts[key] = self.line_counts.get(key, 0) + 1
+
+    #recursive functions only count once per stack towards their total
+    for function in set(f[0] for f in stack):
+      self.function_total[function] = self.function_total.get(function, 0) + 1
+
+    key = ";".join(f[0] for f in reversed(stack))
+    self.collapsed_counts[key] = self.collapsed_counts.get(key, 0) + 1
+
+  #one pause of the debuggee: a stack per thread, and how long the
+  #debuggee was paused for to take them, in seconds
+  def add_sample(self, stacks, pause_time):
+    self.samples += 1
+    self.pause_times.append(pause_time)
+    for stack in stacks:
+      self.add_stack(stack)
+
+  #(function, self count, total count), busiest first
+  def top_functions(self, n = 10):
+    functions = [(f, count, self.function_total[f])
+                   for f, count in self.function_self.items()]
+    functions.sort(key = lambda x: (-x[1], -x[2], x[0]))
+    return functions[:n]
+
+  #((file, line), count), busiest first
+  def top_lines(self, n = 10):
+    lines = sorted(self.line_counts.items(), key = lambda x: (-x[1], x[0]))
+    return lines[:n]
+
+  #pause count, total, mean and max pause in milliseconds
+  def pause_stats(self):
+    count = len(self.pause_times)
+    total = sum(self.pause_times) * 1e3
+    return dict(count = count, total = total,
+                mean = total / count if count else 0.0,
+                max = max(self.pause_times) * 1e3 if count else 0.0)
+
+  #the collapsed stack format flamegraph.pl and speedscope read: outermost
+  #frame first, frames separated by semicolons, then the sample count
+  def collapsed(self):
+    return ["%s %d" % (stack, count)
+              for stack, count in sorted(self.collapsed_counts.items())]
+
+  def write_collapsed(self, filename):
+    f = open(filename, 'w')
+    try:
+      for line in self.collapsed():
+        f.write(line + "\n")
+    finally:
+      f.close()
@@ -0,0 +1,293 @@
+from __future__ import with_statement
+
+import json
+import os
+import struct
+import threading
+
+from headless import debugger_backend, batch_commands, event_writer
+from dbgserver import debug_server
+
+#--------------------------------------------
+# session recording
+
+#a recording is a JSON lines log of the events a session reports, in the
+#order it reports them, plus an index file of the byte offset each stop's
+#line starts at, as 8 byte little endian integers. Stops are the 'stop' 
+#events, numbered from zero, and carry the stack, the locals and the stop
+#number. Both files are only ever appended to
+_offset = struct.Struct('<Q')
+
+def index_path(path):
+  return path + '.idx'
+
+#only lines with a stack are parsed, since most of a log is class loads and
+#the like. Other events can have a stack too, and a line cut short by a 
+#crash isn't a stop
+def _is_stop(line):
+  if '"stack": ' not in line:
+    return False
+  try:
+    return json.loads(line).get('event') == 'stop'
+  except ValueError:
+    return False
+
+#appends to a recording. Events are buffered and written in batches, since
+#the callbacks can report thousands of class loads a second; a stop writes
+#everything up to and including it, so a crashed session keeps all the
+#stops it got to. record can be called from any thread
+class session_recorder(object):
+  def __init__(self, path, buffer_size = 256):
+    self.path = path
+    self.buffer_size = buffer_size
+    self._log = open(path, 'ab')
+    self._log.seek(0, os.SEEK_END)
+    self._index = open(index_path(path), 'ab')
+    self._index.seek(0, os.SEEK_END)
+    self._offset = self._log.tell()
+    self.stops = self._index.tell() // _offset.size
+    self.count = 0
+    self._buffer = []
+    self._stop_offsets = []
+    self._lock = threading.Lock()
+
+  def record(self, event, **fields):
+    fields['event'] = event
+    with self._lock:
+      self._append(json.dumps(fields) + "\n")
+      if len(self._buffer) >= self.buffer_size:
+        self._write()
+
+  #stack and locals are in the form debugger_backend returns them
+  def record_stop(self, stack, locals, **fields):
+    fields.update(event = 'stop', stack = stack, locals = locals)
+    with self._lock:
+      fields['stop'] = self.stops
+      self._stop_offsets.append(self._offset)
+      self._append(json.dumps(fields) + "\n")
+      self.stops += 1
+      self._write()
+
+  def _append(self, line):
+    self._buffer.append(line)
+    self._offset += len(line)
+    self.count += 1
+
+  def _write(self):
+    if self._buffer:
+      self._log.write("".join(self._buffer))
+      self._buffer = []
+      self._log.flush()
+    if self._stop_offsets:
+      self._index.write("".join(_offset.pack(o) for o in self._stop_offsets))
+      self._stop_offsets = []
+      self._index.flush()
+
+  def flush(self):
+    with self._lock:
+      self._write()
+
+  def close(self):
+    with self._lock:
+      self._write()
+      self._log.close()
+      self._index.close()
+
+#--------------------------------------------
+# session log
+
+#reads a recording. stop(n) seeks straight to a stop through the index; if
+#the index is missing or behind the log, as after a crash between the two
+#writes, it's rebuilt from the log
+class session_log(object):
+  def __init__(self, path):
+    self.path = path
+    self._log = open(path, 'rb')
+    self._offsets = None
+
+  def _index(self):
+    if self._offsets == None:
+      self._offsets = self._read_index()
+      if self._offsets == None:
+        self._offsets = self._build_index()
+    return self._offsets
+
+  def _read_index(self):
+    try:
+      f = open(index_path(self.path), 'rb')
+    except IOError:
+      return None
+    try:
+      data = f.read()
+    finally:
+      f.close()
+    count = len(data) // _offset.size
+    offsets = [_offset.unpack_from(data, i * _offset.size)[0] for i in range(count)]
+    size = os.path.getsize(self.path)
+    if offsets and offsets[-1] >= size:
+      return None
+    #stops the log has but the index doesn't
+    if self._stop_count_after(offsets[-1] if offsets else 0, bool(offsets)) > 0:
+      return None
+    return offsets
+
+  def _stop_count_after(self, offset, skip_first):
+    self._log.seek(offset)
+    if skip_first:
+      self._log.readline()
+    return sum(1 for line in self._log if _is_stop(line))
+
+  def _build_index(self):
+    offsets = []
+    self._log.seek(0)
+    offset = 0
+    for line in self._log:
+      if _is_stop(line):
+        offsets.append(offset)
+      offset += len(line)
+    return offsets
+
+  def __len__(self):
+    return len(self._index())
+
+  def stop(self, n):
+    offsets = self._index()
+    if n < 0 or n >= len(offsets):
+      raise IndexError, "Stop %d not in %s (%d stops)" % (n, self.path, len(offsets))
+    self._log.seek(offsets[n])
+    return json.loads(self._log.readline())
+
+  #the records from stop n on, or from the start of the log
+  def events(self, start = None):
+    offset = 0 if start == None or start == 0 else self._index()[start]
+    self._log.seek(offset)
+    while True:
+      line = self._log.readline()
+      if not line:
+        break
+      if line.strip():
+        yield json.loads(line)
+
+  def close(self):
+    self._log.close()
+
+#--------------------------------------------
+# replay
+
+#a debugger_backend over a recording, for driving batch commands or the
+#debug server with no live process. The debuggee does what it did when it
+#was recorded: steps and breakpoints are noted but can't change where the
+#next stop is
+class replay_backend(debugger_backend):
+  def __init__(self, log, start = None):
+    self.log = log
+    self.start = start
+    self.current = None
+    self.breakpoints = []
+    self.steps = []
+    self.quit_requested = False
+    self.server = None
+    self._events = None
+    self._exited = False
+
+  def get_locals(self):
+    return self.current.get('locals', [])
+
+  def get_stack(self):
+    return self.current['stack']
+
+  #only the stopped thread was recorded
+  def get_threads(self):
+    return [dict(threads = [self.current.get('thread')], 
+                 frames = self.current['stack'])]
+
+  def add_breakpoint(self, spec):
+    self.breakpoints.append(spec)
+    return "Breakpoint noted, replay follows the recorded session"
+
+  def step(self, kind):
+    self.steps.append(kind)
+
+  def quit(self):
+    self.quit_requested = True
+
+  def get_stats(self):
+    return dict()
+
+  @staticmethod
+  def _fields(record):
+    return dict((str(k), v) for k, v in record.items()
+                  if k not in ('event', 'locals', 'stack'))
+
+  def resume(self):
+    if self._events == None:
+      self._events = self.log.events(self.start)
+    for record in self._events:
+      if self.quit_requested:
+        break
+      self.server.post(record['event'], **self._fields(record))
+      self._exited = self._exited or record['event'] == 'OnProcessExit'
+      if 'stack' in record:
+        self.current = record
+        self.server.post_stop()
+        return
+    if not self._exited:
+      self.server.post('OnProcessExit')
+    self.server.post_exit()
+
+  def serve(self, address):
+    self.server = debug_server(self, address)
+    self.server.serve()
+
+  def run(self, commands, writer):
+    batch = batch_commands(self, commands, writer)
+    exited = False
+    for record in self.log.events(self.start):
+      if self.quit_requested:
+        break
+      writer.emit(record['event'], **self._fields(record))
+      exited = exited or record['event'] == 'OnProcessExit'
+      if 'stack' in record:
+        self.current = record
+        batch.on_stop()
+    if not exited:
+      writer.emit('OnProcessExit')
+    writer.flush()
+
+#replays a recording through batch commands, writing the events to
+#events. With the same commands, the events are the same every time, so
+#their output can be checked against a known good run
+def replay(path, commands, events, start = None):
+  log = session_log(path)
+  try:
+    replay_backend(log, start).run(commands, event_writer(events))
+  finally:
+    log.close()
+
+if __name__ == "__main__":
+  import sys
+  from optparse import OptionParser
+  from dbgserver import parse_address
+  parser = OptionParser(usage = "%prog [options] recording")
+  parser.add_option("-x", "--batch", dest = "commands_file", default = '-',
+    help = "read debugger commands from this file (- for stdin)")
+  parser.add_option("-e", "--events", dest = "events_file",
+    help = "write the events to this file instead of stdout")
+  parser.add_option("-s", "--server", dest = "server_address",
+    help = "serve debug protocol clients on ADDRESS instead", metavar = "ADDRESS")
+  parser.add_option("-n", "--stop", dest = "stop", type = "int",
+    help = "start replaying from this stop")
+  options, args = parser.parse_args()
+  if len(args) != 1:
+    parser.error("expected a recording to replay")
+
+  if options.server_address != None:
+    log = session_log(args[0])
+    backend = replay_backend(log, options.stop)
+    backend.serve(parse_address(options.server_address))
+  else:
+    commands = sys.stdin if options.commands_file == '-' \
+      else open(options.commands_file)
+    events = open(options.events_file, 'w') if options.events_file != None \
+      else sys.stdout
+    replay(args[0], iter(commands.readline, ''), events, options.stop)
@@ -0,0 +1,173 @@
+from __future__ import with_statement
+
+from collections import deque
+import threading
+
+#--------------------------------------------
+# styled spans
+
+#output is built up as lists of (text, color) spans, where color is the
+#name of a System.ConsoleColor or None for the default, and written to the
+#console in one call per line or screen instead of switching the console
+#colors around every fragment
+
+#SGR foreground codes for the ConsoleColor names
+ansi_colors = {
+  'Black': 30, 'DarkRed': 31, 'DarkGreen': 32, 'DarkYellow': 33,
+  'DarkBlue': 34, 'DarkMagenta': 35, 'DarkCyan': 36, 'Gray': 37,
+  'DarkGray': 90, 'Red': 91, 'Green': 92, 'Yellow': 93,
+  'Blue': 94, 'Magenta': 95, 'Cyan': 96, 'White': 97,
+}
+
+#joins neighbouring spans of the same color and drops empty ones
+def merge_spans(spans):
+  merged = []
+  for text, color in spans:
+    if not text:
+      continue
+    if merged and merged[-1][1] == color:
+      merged[-1] = (merged[-1][0] + text, color)
+    else:
+      merged.append((text, color))
+  return merged
+
+def render_ansi(spans):
+  parts = []
+  for text, color in spans:
+    if color == None:
+      parts.append(text)
+    else:
+      parts.append("\x1b[%dm%s\x1b[0m" % (ansi_colors[color], text))
+  return "".join(parts)
+
+def render_plain(spans):
+  return "".join(text for text, color in spans)
+
+#whether the terminal understands ANSI escape sequences: anything with a
+#TERM other than dumb, or a Windows console known to translate them
+def supports_ansi(environ):
+  term = environ.get('TERM')
+  if term != None:
+    return term != 'dumb'
+  return 'WT_SESSION' in environ or 'ANSICON' in environ \
+    or environ.get('ConEmuANSI') == 'ON'
+
+#writes span lists with one write(text) call each when ansi is on.
+#Otherwise write_colored(spans) gets the merged spans, to set the console
+#colors once per run of a color, or with no write_colored the text goes
+#out plain
+class console_renderer(object):
+  def __init__(self, write, write_colored = None, ansi = True):
+    self._write = write
+    self._write_colored = write_colored
+    self.ansi = ansi
+    self.writes = 0
+
+  def write(self, spans):
+    spans = merge_spans(spans)
+    if not spans:
+      return
+    self.writes += 1
+    if self.ansi:
+      self._write(render_ansi(spans))
+    elif self._write_colored != None:
+      self._write_colored(spans)
+    else:
+      self._write(render_plain(spans))
+
+#--------------------------------------------
+# background writer
+
+#writes diagnostic output from the CorDebug callback threads on a thread
+#of its own, so a callback never waits on the terminal. post only queues
+#the spans; the writer renders everything queued since its last write in
+#one go. If it falls capacity posts behind, post waits for it to catch up
+#rather than lose output, and counts the wait. Without a writer thread a 
+#full queue is written out by post itself. flush waits until everything 
+#posted has been written, and has to be called before writing to the 
+#console from anywhere else
+class background_writer(object):
+  def __init__(self, renderer, capacity = 10000):
+    self.renderer = renderer
+    self.capacity = capacity
+    self.posted = 0
+    self.written = 0
+    self.waits = 0
+    self._queue = deque()
+    self._busy = False
+    self._closing = False
+    self._cond = threading.Condition()
+    self._writer = None
+
+  def post(self, spans):
+    with self._cond:
+      if len(self._queue) >= self.capacity:
+        if self._writer == None:
+          batch = list(self._queue)
+          self._queue.clear()
+          self._write(batch)
+        else:
+          self.waits += 1
+          #a writer that has died won't catch up, so the queue grows instead
+          while len(self._queue) >= self.capacity and self._writer.isAlive():
+            self._cond.wait(1.0)
+      self._queue.append(spans)
+      self.posted += 1
+      #the writer only waits when the queue is empty
+      if len(self._queue) == 1:
+        self._cond.notifyAll()
+
+  def start(self):
+    if self._writer != None:
+      return
+    self._closing = False
+    self._writer = threading.Thread(target = self._run)
+    self._writer.setDaemon(True)
+    self._writer.start()
+
+  def _run(self):
+    while True:
+      with self._cond:
+        while not self._queue and not self._closing:
+          self._cond.wait()
+        if not self._queue:
+          return
+        batch = list(self._queue)
+        self._queue.clear()
+        self._busy = True
+        self._cond.notifyAll()
+      try:
+        self._write(batch)
+      finally:
+        with self._cond:
+          self._busy = False
+          self._cond.notifyAll()
+
+  def _write(self, batch):
+    spans = []
+    for s in batch:
+      spans.extend(s)
+    try:
+      self.renderer.write(spans)
+    finally:
+      self.written += len(batch)
+
+  def flush(self):
+    if self._writer == None:
+      with self._cond:
+        batch = list(self._queue)
+        self._queue.clear()
+      self._write(batch)
+      return
+    with self._cond:
+      while self._queue or self._busy:
+        self._cond.wait()
+
+  def close(self):
+    if self._writer != None:
+      with self._cond:
+        self._closing = True
+        self._cond.notifyAll()
+      self._writer.join()
+      self._writer = None
+    self.flush()
@@ -0,0 +1,96 @@
+from __future__ import with_statement
+
+from collections import deque
+import threading
+
+#--------------------------------------------
+# debug sessions
+
+#one debuggee process. state is 'running', 'stopped' or 'exited'. The
+#callbacks queue their events here rather than printing them, so the
+#output of processes running side by side doesn't interleave; a session's
+#events are shown when it gets the console
+class debug_session(object):
+  def __init__(self, id, name, process):
+    self.id = id
+    self.name = name
+    self.process = process
+    self.state = 'running'
+    self.events = deque()
+    self.stops = 0
+    self.stop_order = None
+
+  def __str__(self):
+    return "%d. %s %s (stops: %d)" % (self.id, self.name, self.state, self.stops)
+
+#supervises the sessions debugged together. The callback threads report
+#events and state changes; the console thread waits in next_stop for a
+#session that needs it. process is anything with a resume method
+class session_manager(object):
+  def __init__(self):
+    self.sessions = []
+    self.current = None
+    self._stop_count = 0
+    self._changed = threading.Condition()
+
+  def add(self, name, process):
+    with self._changed:
+      session = debug_session(len(self.sessions) + 1, name, process)
+      self.sessions.append(session)
+      return session
+
+  def find(self, id):
+    for session in self.sessions:
+      if session.id == id:
+        return session
+    raise Exception, "Session %d not found" % id
+
+  def post(self, session, event, message):
+    with self._changed:
+      session.events.append((event, message))
+
+  def take_events(self, session):
+    with self._changed:
+      events = list(session.events)
+      session.events.clear()
+    return events
+
+  def stopped(self, session):
+    with self._changed:
+      self._stop_count += 1
+      session.state = 'stopped'
+      session.stops += 1
+      session.stop_order = self._stop_count
+      self._changed.notifyAll()
+
+  def exited(self, session):
+    with self._changed:
+      session.state = 'exited'
+      self._changed.notifyAll()
+
+  def resume(self, session):
+    with self._changed:
+      if session.state != 'stopped':
+        return False
+      session.state = 'running'
+    session.process.resume()
+    return True
+
+  #resumes every stopped session, returning how many there were
+  def resume_all(self):
+    return len([s for s in list(self.sessions) if self.resume(s)])
+
+  #the session that should get the console next: the current one if it's
+  #stopped, otherwise whichever has been waiting longest. Blocks until
+  #there is one, and returns None once every session has exited
+  def next_stop(self):
+    with self._changed:
+      while True:
+        stopped = [s for s in self.sessions if s.state == 'stopped']
+        if self.current in stopped:
+          return self.current
+        if stopped:
+          return min(stopped, key = lambda s: s.stop_order)
+        if len([s for s in self.sessions if s.state != 'exited']) == 0:
+          return None
+        self._changed.wait()
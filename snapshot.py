@@ -0,0 +1,33 @@
+#--------------------------------------------
+# per stop memoization
+
+#remembers whatever is read from the debuggee while it is stopped, so
+#repeated commands in the same stop are answered without another round
+#trip. A snapshot is only valid until the process continues, at which point
+#it should be thrown away. A miss reads from the debuggee, which can be 
+#one query or, like reading a frame's locals, a good many. Misses are 
+#counted by kind
+class stop_snapshot(object):
+  def __init__(self):
+    self._memo = dict()
+    self.hits = 0
+    self.misses = 0
+    self.misses_by_kind = dict()
+
+  def memo(self, kind, key, compute):
+    k = (kind, key)
+    if k in self._memo:
+      self.hits += 1
+      return self._memo[k]
+
+    self.misses += 1
+    self.misses_by_kind[kind] = self.misses_by_kind.get(kind, 0) + 1
+    value = self._memo[k] = compute()
+    return value
+
+  def has(self, kind, key):
+    return (kind, key) in self._memo
+
+  def stats(self):
+    return dict(hits = self.hits, misses = self.misses, 
+                misses_by_kind = dict(self.misses_by_kind))
@@ -0,0 +1,133 @@
+import os
+
+#--------------------------------------------
+# source file cache
+
+#byte order marks, longest first since the UTF-32 LE mark starts with the
+#UTF-16 LE one. Files without one are read as UTF-8, like File.ReadAllLines
+_boms = [('\x00\x00\xfe\xff', 'utf-32-be'), ('\xff\xfe\x00\x00', 'utf-32-le'),
+         ('\xef\xbb\xbf', 'utf-8'), ('\xfe\xff', 'utf-16-be'),
+         ('\xff\xfe', 'utf-16-le')]
+
+def decode_source(data):
+  encoding = 'utf-8'
+  for bom, name in _boms:
+    if data.startswith(bom):
+      data, encoding = data[len(bom):], name
+      break
+  return data.decode(encoding, 'replace')
+
+#a file's lines without their line endings, split on \r\n, \n and \r the
+#way File.ReadAllLines does. Other characters splitlines treats as line 
+#breaks, like form feeds, don't start a new line for the compiler either
+def read_source_lines(path):
+  f = open(path, 'rb')
+  try:
+    text = decode_source(f.read())
+  finally:
+    f.close()
+  if '\r' in text:
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+  lines = text.split('\n')
+  if lines[-1] == '':
+    lines.pop()
+  return lines
+
+#roughly what a list of lines takes in memory: two bytes a character, as
+#.NET strings are, and a string object's overhead per line. A file with 
+#many short lines takes much more than its size on disk
+_line_overhead = 32
+
+def source_nbytes(lines):
+  return sum(len(line) for line in lines) * 2 + len(lines) * _line_overhead
+
+#a source file's lines as read, with the mtime and size they were read at.
+#Indexing is zero based like the list of lines it stands for. nbytes is 
+#what the lines count against the cache's budget
+class source_file(object):
+  def __init__(self, path, lines, mtime, size):
+    self.path = path
+    self._lines = lines
+    self.mtime = mtime
+    self.size = size
+    self.nbytes = source_nbytes(lines)
+
+  def __len__(self):
+    return len(self._lines)
+
+  def __getitem__(self, index):
+    return self._lines[index]
+
+  #lines start to end inclusive, numbered from one
+  def lines(self, start, end):
+    return [self._lines[i] for i in range(max(start, 1) - 1, min(end, len(self)))]
+
+#source files by full path, least recently used first out once their lines
+#take up more than budget bytes. Every lookup checks the file's mtime and
+#size, so files edited while debugging are read again. read(path) returns
+#the file's lines
+class source_cache(object):
+  def __init__(self, budget = 32 * 1024 * 1024, stat = os.stat, 
+               read = read_source_lines):
+    self.budget = budget
+    self._stat = stat
+    self._read = read
+    self._files = dict()
+    self._used = dict()
+    self._tick = 0
+    self.bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.reloads = 0
+    self.evictions = 0
+
+  def __len__(self):
+    return len(self._files)
+
+  def __contains__(self, path):
+    return path in self._files
+
+  def get(self, path):
+    st = self._stat(path)
+    f = self._files.get(path)
+    if f != None:
+      if f.mtime == st.st_mtime and f.size == st.st_size:
+        self.hits += 1
+        self._touch(path)
+        return f
+      self.reloads += 1
+      self._remove(path)
+
+    self.misses += 1
+    f = source_file(path, self._read(path), st.st_mtime, st.st_size)
+    self._files[path] = f
+    self.bytes += f.nbytes
+    self._touch(path)
+    self._evict(path)
+    return f
+
+  def clear(self):
+    self._files.clear()
+    self._used.clear()
+    self.bytes = 0
+
+  def stats(self):
+    return dict(files = len(self._files), bytes = self.bytes, hits = self.hits,
+                misses = self.misses, reloads = self.reloads,
+                evictions = self.evictions)
+
+  def _touch(self, path):
+    self._tick += 1
+    self._used[path] = self._tick
+
+  def _remove(self, path):
+    f = self._files.pop(path)
+    del self._used[path]
+    self.bytes -= f.nbytes
+
+  #the file just read stays even if it's bigger than the whole budget
+  def _evict(self, keep):
+    while self.bytes > self.budget and len(self._files) > 1:
+      path = min((p for p in self._files if p != keep), key = self._used.get)
+      self._remove(path)
+      self.evictions += 1
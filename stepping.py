@@ -0,0 +1,86 @@
+#--------------------------------------------
+# step ranges
+
+#the IL range a step from an offset has to leave, from the offset to the
+#start of the next sequence point, by (module, method token, offset).
+#load() works the range out and returns it in the form the stepper takes.
+#Kept until the module's symbols are updated
+class step_range_cache(object):
+  def __init__(self):
+    self._ranges = dict()
+    self.hits = 0
+    self.misses = 0
+
+  def lookup(self, module, token, offset, load):
+    key = (module, token, offset)
+    if key in self._ranges:
+      self.hits += 1
+      return self._ranges[key]
+    self.misses += 1
+    result = self._ranges[key] = load()
+    return result
+
+  def invalidate(self, module):
+    for key in [key for key in self._ranges if key[0] == module]:
+      del self._ranges[key]
+
+  def __len__(self):
+    return len(self._ranges)
+
+#--------------------------------------------
+# user level steps
+
+#one step the user asked for: kind is 'over', 'in' or 'out', count the
+#number of lines to step. Steps that land on a call into code without
+#symbols, or somewhere with no source line, are stepped on from right in
+#the callback, and counted as intermediate stops instead of lines
+class step_request(object):
+  def __init__(self, kind, count = 1):
+    if count < 1:
+      raise Exception, "Can't step %d lines" % count
+    self.kind = kind
+    self.count = count
+    self.lines = 0
+    self.intermediate = 0
+
+  #whether to step again after a step completes. into_call is a step that
+  #stopped on a call, has_location whether it stopped on a source line
+  def step_again(self, into_call, has_location):
+    if into_call or not has_location:
+      self.intermediate += 1
+      return True
+    self.lines += 1
+    if self.lines < self.count:
+      self.intermediate += 1
+      return True
+    return False
+
+  #the kind of step to take next. Stepping out lands in the middle of the
+  #caller's statement, so it's finished with steps over
+  @property
+  def next_kind(self):
+    return 'over' if self.kind == 'out' else self.kind
+
+  def __str__(self):
+    lines = "%d line%s" % (self.lines, "" if self.lines == 1 else "s")
+    return "step %s, %s, %d intermediate stops" % (self.kind, lines,
+                                                   self.intermediate)
+
+#how many stops each kind of user level step took, for the steps that
+#finished and the ones a breakpoint or exception cut short
+class step_stats(object):
+  def __init__(self):
+    self.steps = dict()
+    self.interrupted = 0
+
+  def add(self, request, finished = True):
+    if not finished:
+      self.interrupted += 1
+    steps, lines, intermediate, most = self.steps.get(request.kind, (0, 0, 0, 0))
+    self.steps[request.kind] = (steps + 1, lines + request.lines,
+                                intermediate + request.intermediate,
+                                max(most, request.intermediate))
+
+  #(kind, steps, lines, intermediate stops, most intermediate stops in a step)
+  def summary(self):
+    return [(kind,) + self.steps[kind] for kind in sorted(self.steps)]
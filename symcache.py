@@ -0,0 +1,249 @@
+from bisect import bisect_right
+import os.path
+
+#--------------------------------------------
+# sequence point tables
+
+HIDDEN_LINE = 0xfeefee
+
+class sequence_point(object):
+  def __init__(self, offset, doc, start_line, start_col, end_line, end_col):
+    self.offset = offset
+    self.doc = doc
+    self.start_line = start_line
+    self.start_col = start_col
+    self.end_line = end_line
+    self.end_col = end_col
+
+  def __str__(self):
+    return "%s %d:%d-%d:%d (offset:%d)" % (os.path.basename(self.doc.URL),
+      self.start_line, self.start_col, self.end_line, self.end_col, self.offset)
+
+#a method's sequence points, stored as parallel lists sorted by IL offset.
+#sequence_point objects are only created for the rows that actually get
+#looked up, and are then reused for the lifetime of the table
+class sequence_point_table(object):
+  def __init__(self, offsets, docs, start_lines, start_cols, end_lines, end_cols,
+               include_hidden_lines = False):
+    rows = [i for i in range(len(offsets))
+              if start_lines[i] != HIDDEN_LINE or include_hidden_lines]
+    #symbol readers normally return sequence points in offset order already,
+    #but the lookups below depend on it so sort (stable) to be sure
+    rows.sort(key=lambda i: offsets[i])
+
+    self.offsets     = [offsets[i] for i in rows]
+    self.docs        = [docs[i] for i in rows]
+    self.start_lines = [start_lines[i] for i in rows]
+    self.start_cols  = [start_cols[i] for i in rows]
+    self.end_lines   = [end_lines[i] for i in rows]
+    self.end_cols    = [end_cols[i] for i in rows]
+    self._points = [None] * len(rows)
+    self._lines = None
+
+  def __len__(self):
+    return len(self.offsets)
+
+  def __getitem__(self, i):
+    sp = self._points[i]
+    if sp == None:
+      sp = sequence_point(self.offsets[i], self.docs[i], self.start_lines[i],
+             self.start_cols[i], self.end_lines[i], self.end_cols[i])
+      self._points[i] = sp
+    return sp
+
+  def __iter__(self):
+    for i in range(len(self.offsets)):
+      yield self[i]
+
+  #the sequence point containing the IL offset, i.e. the last one
+  #that starts at or before it
+  def find(self, offset):
+    i = bisect_right(self.offsets, offset) - 1
+    return self[i] if i >= 0 else None
+
+  #the offset of the first sequence point that starts after the IL offset
+  def next_offset(self, offset):
+    i = bisect_right(self.offsets, offset)
+    return self.offsets[i] if i < len(self.offsets) else None
+
+  #the offset of the first sequence point starting on the line of the
+  #document with the given URL
+  def find_line(self, url, line):
+    if self._lines == None:
+      self._lines = dict()
+      for i in range(len(self.offsets)):
+        key = (self.docs[i].URL, self.start_lines[i])
+        if key not in self._lines:
+          self._lines[key] = self.offsets[i]
+    return self._lines.get((url, line))
+
+#sequence point tables keyed by (module, method token). CorDebug wrappers
+#compare and hash by their underlying COM object, so the module objects handed
+#out by different callbacks all map to the same entries
+class sequence_point_cache(object):
+  def __init__(self):
+    self._tables = dict()
+    self._module_keys = dict()
+    self.hits = 0
+    self.misses = 0
+
+  def lookup(self, module, token, load):
+    key = (module, token)
+    if key in self._tables:
+      self.hits += 1
+      return self._tables[key]
+
+    self.misses += 1
+    table = load()
+    self._tables[key] = table
+    self._module_keys.setdefault(module, []).append(key)
+    return table
+
+  def invalidate(self, module):
+    for key in self._module_keys.pop(module, []):
+      del self._tables[key]
+
+  def clear(self):
+    self._tables.clear()
+    self._module_keys.clear()
+
+  def __len__(self):
+    return len(self._tables)
+
+#anything else read once per method, like its local scopes, is cached and
+#invalidated the same way
+method_cache = sequence_point_cache
+
+#--------------------------------------------
+# local scopes
+
+#a method's local variable scopes, read from the symbol reader's scope
+#objects once, so the locals in scope at an offset are found without
+#walking them again at every stop. The root scope's locals are always in
+#scope, a child's when the offset is in its range and its parent's are.
+#Scopes are (start, end, locals, child indexes), the root first. Locals
+#named in skip are left out
+class scope_table(object):
+  def __init__(self, root, skip = ('$site',)):
+    self.scopes = []
+    self._offsets = dict()
+    if root != None:
+      self._add(root, skip)
+
+  def _add(self, scope, skip):
+    index = len(self.scopes)
+    children = []
+    self.scopes.append((scope.StartOffset, scope.EndOffset,
+      [(lv.Name, lv.AddressField1) for lv in scope.GetLocals() 
+         if lv.Name not in skip], children))
+    for child in scope.GetChildren():
+      children.append(self._add(child, skip))
+    return index
+
+  #(name, address) of the locals in scope at the IL offset, in the order
+  #the scopes are nested, outermost first
+  def locals_at(self, offset):
+    result = self._offsets.get(offset)
+    if result != None:
+      return result
+    result = []
+    if self.scopes:
+      pending = [0]
+      while pending:
+        start, end, locals, children = self.scopes[pending.pop()]
+        result.extend(locals)
+        for child in reversed(children):
+          start, end = self.scopes[child][:2]
+          if start <= offset <= end:
+            pending.append(child)
+    self._offsets[offset] = result
+    return result
+
+#--------------------------------------------
+# document index
+
+#full paths are compared the way the file system does, so on windows
+#c:\Foo\bar.py and C:\foo\BAR.py are the same document
+def normalize_path(path):
+  return os.path.normcase(os.path.abspath(path))
+
+def _remove_module_entries(d, key, module):
+  entries = [entry for entry in d.get(key, []) if entry[0] != module]
+  if entries:
+    d[key] = entries
+  elif key in d:
+    del d[key]
+
+#maps source documents to the modules whose symbols reference them, by
+#normalized full path and by base name, and caches the method/offset that
+#each requested line resolves to. Kept current by calling update_module
+#from OnUpdateModuleSymbols
+class symbol_index(object):
+  def __init__(self, tables, read_sequence_points):
+    self.tables = tables
+    self.read_sequence_points = read_sequence_points
+    self._paths = dict()
+    self._names = dict()
+    self._module_docs = dict()
+    self._readers = dict()
+    self._lines = dict()
+
+  def update_module(self, module, reader):
+    self.remove_module(module)
+    if reader == None:
+      return
+
+    self._readers[module] = reader
+    docs = self._module_docs[module] = []
+    for doc in reader.GetDocuments():
+      path = normalize_path(doc.URL)
+      name = os.path.basename(path)
+      self._paths.setdefault(path, []).append((module, doc))
+      self._names.setdefault(name, []).append((module, doc))
+      docs.append((path, doc))
+
+  def remove_module(self, module):
+    self.tables.invalidate(module)
+    self._readers.pop(module, None)
+    for path, doc in self._module_docs.pop(module, []):
+      _remove_module_entries(self._paths, path, module)
+      _remove_module_entries(self._names, os.path.basename(path), module)
+    for key in [key for key in self._lines if key[0] == module]:
+      del self._lines[key]
+
+  #(normalized path, document) pairs for the documents in a module
+  def module_documents(self, module):
+    return list(self._module_docs.get(module, []))
+
+  #(module, document) pairs for a file name. Names with a directory part
+  #are matched on their full path, bare names on the base name alone
+  def find_documents(self, filename):
+    if os.path.dirname(filename):
+      return list(self._paths.get(normalize_path(filename), []))
+    return list(self._names.get(os.path.normcase(filename), []))
+
+  def find_module_document(self, module, filename):
+    for mod, doc in self.find_documents(filename):
+      if mod == module:
+        return doc
+    return None
+
+  #the (method token, IL offset) a breakpoint on the line should be bound to.
+  #The offset is None when the closest line has no sequence point of its own
+  #and the breakpoint has to go on the start of the method
+  def resolve_line(self, module, doc, line):
+    key = (module, doc.URL, line)
+    if key in self._lines:
+      return self._lines[key]
+
+    reader = self._readers[module]
+    closest = doc.FindClosestLine(line)
+    method = reader.GetMethodFromDocumentPosition(doc, closest, 0)
+    token = method.Token.GetToken()
+    table = self.tables.lookup(module, token,
+      lambda: sequence_point_table(*self.read_sequence_points(method)))
+    result = self._lines[key] = (token, table.find_line(doc.URL, closest))
+    return result
+
+  def __contains__(self, module):
+    return module in self._readers
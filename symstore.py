@@ -0,0 +1,363 @@
+from __future__ import with_statement
+
+from bisect import bisect_left
+import json
+import os
+import Queue
+import struct
+import threading
+
+from symcache import HIDDEN_LINE
+
+#--------------------------------------------
+# cached symbols
+
+#stand-ins for the symbol store objects ipydbg reads, over symbols loaded
+#from a symbol_store file. They have the members of ISymbolReader,
+#ISymbolDocument, ISymbolMethod and ISymbolScope that ipydbg uses
+
+class symbol_token(object):
+  def __init__(self, token):
+    self.token = token
+
+  def GetToken(self):
+    return self.token
+
+#load() returns the sorted lines that have sequence points, and the token
+#of the method the symbol reader said each is in. It's only called once 
+#the document is used
+class cached_document(object):
+  def __init__(self, url, load):
+    self.URL = url
+    self._load = load
+    self._lines = None
+
+  def _table(self):
+    if self._lines == None:
+      self._lines, self._tokens = self._load()
+    return self._lines
+
+  #the first line at or after line that has a sequence point
+  def FindClosestLine(self, line):
+    lines = self._table()
+    i = bisect_left(lines, line)
+    if i == len(lines):
+      raise Exception, "No sequence point at or after line %d" % line
+    return lines[i]
+
+  #the token of the method containing the line, for a line with a
+  #sequence point
+  def method_token(self, line):
+    lines = self._table()
+    i = bisect_left(lines, line)
+    if i < len(lines) and lines[i] == line:
+      return self._tokens[i]
+    return None
+
+class cached_local(object):
+  def __init__(self, name, address):
+    self.Name = name
+    self.AddressField1 = address
+
+class cached_scope(object):
+  def __init__(self, start, end, locals, children):
+    self.StartOffset = start
+    self.EndOffset = end
+    self._locals = locals
+    self._children = children
+
+  def GetLocals(self):
+    return [cached_local(name, address) for name, address in self._locals]
+
+  def GetChildren(self):
+    return [_load_scope(child) for child in self._children]
+
+def _load_scope(scope):
+  if scope == None:
+    return None
+  start, end, locals, children = scope
+  return cached_scope(start, end, locals, children)
+
+class cached_method(object):
+  #points are the (offsets, docs, start lines, start cols, end lines, end
+  #cols) lists read_sequence_points returns
+  def __init__(self, token, points, scope):
+    self.Token = symbol_token(token)
+    self.points = points
+    self._scope = scope
+
+  @property
+  def SequencePointCount(self):
+    return len(self.points[0])
+
+  @property
+  def RootScope(self):
+    return _load_scope(self._scope)
+
+  def GetSequencePoints(self, offsets, docs, start_lines, start_cols,
+                        end_lines, end_cols):
+    for dest, src in zip((offsets, docs, start_lines, start_cols, end_lines,
+                          end_cols), self.points):
+      for i, value in enumerate(src):
+        dest[i] = value
+
+  #the parallel lists, without going through arrays the caller supplies
+  def read_sequence_points(self):
+    return [list(a) for a in self.points]
+
+def _read(path, offset, length):
+  f = open(path, 'rb')
+  try:
+    f.seek(offset)
+    return f.read(length)
+  finally:
+    f.close()
+
+def _unpack_ints(data, count, fmt = 'i', offset = 0):
+  return struct.unpack_from('<%d%s' % (count, fmt), data, offset)
+
+#a module's symbols, loaded from a symbol_store file. Opening it reads the
+#document names and where each method is; a document's lines are read when
+#it's first used, and a method's sequence points and scopes when it's
+#first asked for
+class cached_symbols(object):
+  def __init__(self, path, index, method_table):
+    self.path = path
+    count = len(method_table) // 12
+    ints = _unpack_ints(method_table, 3 * count, 'I')
+    self._methods = dict(zip(ints[:count], zip(ints[count:2 * count],
+                                               ints[2 * count:])))
+    self.documents = [cached_document(url, self._line_loader(offset, count))
+                        for url, offset, count in index['documents']]
+    self._loaded = dict()
+    self.loads = 0
+
+  def _line_loader(self, offset, count):
+    def load():
+      ints = _unpack_ints(_read(self.path, offset, 8 * count), 2 * count)
+      return list(ints[:count]), list(ints[count:])
+    return load
+
+  def GetDocuments(self):
+    return list(self.documents)
+
+  def GetMethodFromDocumentPosition(self, doc, line, column):
+    token = doc.method_token(line)
+    return self.GetMethod(token) if token != None else None
+
+  #token is a SymbolToken or an int
+  def GetMethod(self, token):
+    if hasattr(token, 'GetToken'):
+      token = token.GetToken()
+    if token not in self._loaded:
+      entry = self._methods.get(token)
+      self._loaded[token] = self._load_method(token, *entry) \
+        if entry != None else None
+    return self._loaded[token]
+
+  def _load_method(self, token, offset, length):
+    self.loads += 1
+    data = _read(self.path, offset, length)
+    count = _count.unpack_from(data)[0]
+    ints = struct.unpack_from('<%di' % (6 * count), data, _count.size)
+    points = [list(ints[i * count:(i + 1) * count]) for i in range(6)]
+    points[1] = [self.documents[d] for d in points[1]]
+    scope = json.loads(data[_count.size + 4 * 6 * count:])
+    return cached_method(token, points, scope)
+
+#--------------------------------------------
+# symbol store
+
+#a file per symbol stream, named for the stream's hash. After the header
+#come each method's sequence points as packed int32 arrays followed by its
+#scopes as JSON, then each document's lines with sequence points and the
+#token of the method each is in, then the table of method tokens, offsets
+#and lengths, all as packed arrays. The JSON index at the end has the
+#document names and where their lines are, and the header says where the
+#method table and index are
+_magic = 'IPYSYMC2'
+_header = struct.Struct('<8sIIII')
+_count = struct.Struct('<I')
+
+def _scope_tree(scope):
+  if scope == None:
+    return None
+  return [scope.StartOffset, scope.EndOffset,
+          [[lv.Name, lv.AddressField1] for lv in scope.GetLocals()],
+          [_scope_tree(child) for child in scope.GetChildren()]]
+
+#the contents of a store file for methods (token, points, root scope), with
+#points as the lists read_sequence_points returns and the scopes as 
+#ISymbolScopes. containing_method(doc, line) gives the token of the method
+#the symbol reader says contains a line, which for a line more than one 
+#method has sequence points on isn't necessarily the first of them. 
+#Everything is read from the symbol objects here, and what's returned is
+#plain strings: the method records and document lines, the method table 
+#and the index
+def encode_symbols(methods, containing_method = None):
+  urls = []
+  url_docs = dict()
+  doc_numbers = dict()
+  lines = dict()
+  tokens = []
+  records = []
+  data = []
+  offset = _header.size
+  for token, points, scope in methods:
+    offsets, docs, start_lines, start_cols, end_lines, end_cols = points
+    numbers = []
+    for doc, line in zip(docs, start_lines):
+      url = doc.URL
+      if url not in doc_numbers:
+        doc_numbers[url] = len(urls)
+        urls.append(url)
+        url_docs[url] = doc
+        lines[url] = dict()
+      numbers.append(doc_numbers[url])
+      if line != HIDDEN_LINE:
+        lines[url].setdefault(line, token)
+    count = len(offsets)
+    record = _count.pack(count) + struct.pack('<%di' % (6 * count),
+      *(list(offsets) + numbers + list(start_lines) + list(start_cols) +
+        list(end_lines) + list(end_cols))) + json.dumps(_scope_tree(scope))
+    tokens.append(token)
+    records.append((offset, len(record)))
+    data.append(record)
+    offset += len(record)
+
+  documents = []
+  for url in urls:
+    doc_lines = sorted(lines[url])
+    if containing_method != None:
+      for line in doc_lines:
+        lines[url][line] = containing_method(url_docs[url], line)
+    table = struct.pack('<%di' % (2 * len(doc_lines)),
+      *(doc_lines + [lines[url][line] for line in doc_lines]))
+    documents.append([url, offset, len(doc_lines)])
+    data.append(table)
+    offset += len(table)
+
+  method_table = struct.pack('<%dI' % (3 * len(tokens)), *(tokens +
+    [o for o, l in records] + [l for o, l in records]))
+  index = json.dumps(dict(documents = documents))
+  return "".join(data), method_table, index
+
+#one store can be shared by several debugged processes, whose callbacks
+#load from it on threads of their own, so the counts and the saver thread
+#are only touched holding _lock
+class symbol_store(object):
+  def __init__(self, directory, max_files = 256):
+    self.directory = directory
+    self.max_files = max_files
+    self.hits = 0
+    self.misses = 0
+    self.saves = 0
+    self.failures = 0
+    self._pending = Queue.Queue()
+    self._saver = None
+    self._lock = threading.Lock()
+
+  def _add(self, name):
+    with self._lock:
+      setattr(self, name, getattr(self, name) + 1)
+
+  def path(self, key):
+    return os.path.join(self.directory, key + '.symbols')
+
+  #the cached_symbols for the key, or None if it hasn't been saved
+  def load(self, key):
+    path = self.path(key)
+    try:
+      f = open(path, 'rb')
+    except IOError:
+      self._add('misses')
+      return None
+    try:
+      magic, table_offset, table_length, index_offset, index_length = \
+        _header.unpack(f.read(_header.size))
+      if magic != _magic:
+        self._add('misses')
+        return None
+      #the index follows the method table
+      f.seek(table_offset)
+      method_table = f.read(table_length)
+      index = json.loads(f.read(index_length))
+    finally:
+      f.close()
+    self._add('hits')
+    return cached_symbols(path, index, method_table)
+
+  #methods and containing_method are as encode_symbols takes them
+  def save(self, key, methods, containing_method = None):
+    self.write(key, encode_symbols(methods, containing_method))
+
+  #writes what encode_symbols returned as the file for key
+  def write(self, key, encoded):
+    data, method_table, index = encoded
+    if not os.path.isdir(self.directory):
+      os.makedirs(self.directory)
+    path = self.path(key)
+    temp = "%s.%d.tmp" % (path, os.getpid())
+    offset = _header.size + len(data)
+    f = open(temp, 'wb')
+    try:
+      f.write(_header.pack(_magic, offset, len(method_table),
+                           offset + len(method_table), len(index)))
+      f.write(data)
+      f.write(method_table)
+      f.write(index)
+    finally:
+      f.close()
+    #another run may have saved the same symbols in the meantime
+    try:
+      if os.path.exists(path):
+        os.remove(path)
+      os.rename(temp, path)
+    except OSError:
+      if os.path.exists(temp):
+        os.remove(temp)
+    self._add('saves')
+    self._prune()
+
+  #writes on a thread of its own, one file after another, so the debug
+  #callback the symbols were read in goes straight on. The symbols are 
+  #encoded by then, since the symbol reader's objects belong to the 
+  #callback's thread. The store is only a cache, so a write that fails is
+  #counted and otherwise ignored
+  def save_in_background(self, key, encoded):
+    with self._lock:
+      if self._saver == None:
+        self._saver = threading.Thread(target = self._save_pending)
+        self._saver.setDaemon(True)
+        self._saver.start()
+    self._pending.put((key, encoded))
+
+  def _save_pending(self):
+    while True:
+      key, encoded = self._pending.get()
+      try:
+        self.write(key, encoded)
+      except Exception:
+        self._add('failures')
+      self._pending.task_done()
+
+  #waits for the saves in progress, for tests and benchmarks
+  def join(self):
+    self._pending.join()
+
+  #the least recently written files go once there are too many
+  def _prune(self):
+    names = [n for n in os.listdir(self.directory) if n.endswith('.symbols')]
+    if len(names) <= self.max_files:
+      return
+    paths = [os.path.join(self.directory, n) for n in names]
+    paths.sort(key = os.path.getmtime)
+    for path in paths[:len(paths) - self.max_files]:
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+
+  def stats(self):
+    return dict(hits = self.hits, misses = self.misses, saves = self.saves,
+                failures = self.failures)
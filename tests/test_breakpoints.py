@@ -0,0 +1,196 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+os.environ['IPYDBG_FAKES'] = '1'
+
+import ipydbg
+from breakpoints import parse_breakpoint_spec, breakpoint_condition, \
+  breakpoint_state, tracepoint, pending_breakpoints
+from symcache import sequence_point_cache, symbol_index
+from fakedbg import FakeRoundTrips, FakeSymDocument, FakeSymReader, \
+  FakeScope, FakeLocal, FakeLocalsFrame, FakeModule, FakeThread, FakeChain, \
+  FakeGenericValue, FakeDebugger, FakeScriptedProcess, generate_symmethod, \
+  ELEMENT_TYPE_I4
+
+#--------------------------------------------
+# specs and conditions
+
+class breakpoint_spec_tests(unittest.TestCase):
+  def test_plain_spec(self):
+    spec = parse_breakpoint_spec("script.py:12")
+    self.assertEqual(("script.py", 12, None),
+                     (spec.filename, spec.line, spec.condition))
+
+  def test_drive_letter_and_condition(self):
+    spec = parse_breakpoint_spec(r"c:\scripts\script.py:7 if d['a:1'] > 2")
+    self.assertEqual(r"c:\scripts\script.py", spec.filename)
+    self.assertEqual(7, spec.line)
+    self.assertTrue(isinstance(spec.condition, breakpoint_condition))
+
+  def test_tracepoint(self):
+    spec = parse_breakpoint_spec("script.py:3 log x is %(x)s")
+    self.assertTrue(isinstance(spec.condition, tracepoint))
+    self.assertEqual(frozenset(['x']), spec.condition.names)
+
+  def test_bad_specs(self):
+    self.assertRaises(Exception, parse_breakpoint_spec, "script.py")
+    self.assertRaises(Exception, parse_breakpoint_spec, "script.py:3 when x")
+    self.assertRaises(Exception, parse_breakpoint_spec, "script.py:3 every 0")
+
+class breakpoint_condition_tests(unittest.TestCase):
+  def test_every(self):
+    state = breakpoint_state(breakpoint_condition("every 3"))
+    stops = [state.hit(None) for i in range(7)]
+    self.assertEqual([False, False, True, False, False, True, False], stops)
+    self.assertEqual(7, state.hit_count)
+
+  #a hit_count test never asks the frame for anything
+  def test_hit_count_needs_no_values(self):
+    def get_values(names):
+      self.fail("read %s from the frame" % names)
+    state = breakpoint_state(breakpoint_condition("if hit_count > 2"))
+    self.assertEqual([False, False, True], [state.hit(get_values) for i in range(3)])
+
+  def test_only_named_values_are_read(self):
+    asked = []
+    def get_values(names):
+      asked.append(set(names))
+      return dict(x = 3)
+    state = breakpoint_state(breakpoint_condition("if x == 3 and hit_count"))
+    self.assertTrue(state.hit(get_values))
+    self.assertEqual([set(['x'])], asked)
+
+#--------------------------------------------
+# breakpoints in a debugged process
+
+#IPyDebugProcess with the console left out: events are collected, and
+#_input records the hit count of each breakpoint it's woken up for
+class scripted_debug_process(ipydbg.IPyDebugProcess):
+  def __init__(self, debugger):
+    ipydbg.IPyDebugProcess.__init__(self, debugger)
+    self.events = []
+    self.errors = []
+    self.inputs = []
+
+  def _log_event(self, event, message, **fields):
+    self.events.append(event)
+
+  def _log_error(self, message):
+    self.errors.append(message)
+
+  def _input(self):
+    self.inputs.append(self.breakpoint_states[self.active_breakpoint].hit_count)
+
+  def OnBreakpoint(self, sender, e):
+    self.active_breakpoint = e.Breakpoint
+    ipydbg.IPyDebugProcess.OnBreakpoint(self, sender, e)
+
+class conditional_breakpoint_tests(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.script = os.path.join(self.directory, "script.py")
+    self.trips = FakeRoundTrips()
+    #script.py is ten lines of one method, with x in scope throughout
+    self.doc = FakeSymDocument(self.script)
+    method = generate_symmethod(0x06000001, self.doc, 1, 10)
+    method.RootScope = FakeScope(self.trips, 0, 1000,
+                                 [FakeLocal(self.trips, 'x', 0)], [])
+    self.reader = FakeSymReader([method])
+    self.module = FakeModule(self.trips, "script", True)
+    self.function = self.module.GetFunctionFromToken(0x06000001)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  #runs script.py with the breakpoint spec, hitting line 3 once for each
+  #value of x. Returns the process, after it has run to the end, having
+  #logged the given number of errors
+  def run_script(self, spec, xs, errors = 0):
+    breakpoint_file = os.path.join(self.directory, "breakpoints.txt")
+    f = open(breakpoint_file, 'w')
+    f.write(spec + "\n")
+    f.close()
+
+    events = [('OnUpdateModuleSymbols', dict(Module = self.module,
+                                             Stream = self.reader))]
+    for x in xs:
+      frame = FakeLocalsFrame(self.trips, 24,
+                              [FakeGenericValue(x, ELEMENT_TYPE_I4)], self.function)
+      thread = FakeThread(self.trips, 1, [FakeChain([frame])])
+      events.append(('OnBreakpoint', self.hit(thread)))
+    process = FakeScriptedProcess(self.trips, events)
+    dp = scripted_debug_process(FakeDebugger(process = process))
+    self.dp = dp
+    dp.run(self.script, breakpoint_file)
+    self.assertEqual(errors, len(dp.errors))
+    self.assertEqual([], process.script)
+    return dp
+
+  #a hit on the breakpoint bound from the spec, which doesn't exist until
+  #the module's symbols have been loaded
+  def hit(self, thread):
+    def fields():
+      bp = [bp for bp, state in self.dp.breakpoint_states.items()
+              if state.condition != None][0]
+      return dict(Breakpoint = bp, Thread = thread, AppDomain = None)
+    return fields
+
+  def test_binds_when_symbols_load(self):
+    dp = self.run_script("script.py:3 if x == 3", [])
+    self.assertTrue("BoundPendingBreakpoint" in dp.events)
+    self.assertEqual(0, len(dp.pending_breakpoints))
+
+  #hits that don't satisfy the condition continue the process from the
+  #callback, so the input loop is never woken up for them
+  def test_unmatched_hits_never_reach_input(self):
+    dp = self.run_script("script.py:3 if x == 3", [1, 2, 4, 5, 6])
+    self.assertEqual([], dp.inputs)
+    self.assertFalse("OnBreakpoint" in dp.events)
+    self.assertFalse(dp.break_event.WaitOne(0))
+
+  def test_matched_hit_reaches_input(self):
+    dp = self.run_script("script.py:3 if x == 3", [1, 2, 3, 4, 3])
+    self.assertEqual([3, 5], dp.inputs)
+    self.assertEqual(2, dp.events.count("OnBreakpoint"))
+
+  def test_every(self):
+    dp = self.run_script("script.py:3 every 2", [0] * 5)
+    self.assertEqual([2, 4], dp.inputs)
+
+  def test_tracepoint_never_stops(self):
+    dp = self.run_script("script.py:3 log x=%(x)s", [7, 8])
+    self.assertEqual([], dp.inputs)
+    self.assertEqual(["x=7", "x=8"],
+                     [message for t, location, hit, message in dp.trace_log.recent(2)])
+
+  #a condition that fails to evaluate stops, so it isn't silently ignored
+  def test_failing_condition_stops(self):
+    dp = self.run_script("script.py:3 if undefined_name", [1], errors = 1)
+    self.assertEqual([1], dp.inputs)
+
+#--------------------------------------------
+# pending breakpoints
+
+class pending_breakpoint_tests(unittest.TestCase):
+  def test_take_module_matches(self):
+    doc = FakeSymDocument(os.path.abspath("a.py"))
+    other = FakeSymDocument(os.path.abspath("b.py"))
+    reader = FakeSymReader([generate_symmethod(1, doc, 1, 5),
+                            generate_symmethod(2, other, 1, 5)])
+    index = symbol_index(sequence_point_cache(), lambda m: m.read_sequence_points())
+    index.update_module("a", reader)
+
+    pending = pending_breakpoints()
+    pending.add(parse_breakpoint_spec("a.py:2"))
+    pending.add(parse_breakpoint_spec(os.path.abspath("a.py") + ":3"))
+    pending.add(parse_breakpoint_spec("c.py:3"))
+    matches = pending.take_module_matches(index, "a")
+    self.assertEqual([(2, doc), (3, doc)],
+                     sorted((spec.line, d) for spec, d in matches))
+    self.assertEqual(["c.py"], [spec.filename for spec in pending])
+    self.assertEqual([], pending_breakpoints().take_module_matches(index, "a"))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,85 @@
+import os
+import threading
+import unittest
+
+os.environ['IPYDBG_FAKES'] = '1'
+
+import consolecolor as CC
+from renderer import merge_spans, render_ansi, supports_ansi, \
+  console_renderer, background_writer
+
+#--------------------------------------------
+# styled spans
+
+class console_renderer_tests(unittest.TestCase):
+  def test_merge_spans(self):
+    self.assertEqual([("ab", 'Red'), ("c", None)],
+                     merge_spans([("a", 'Red'), ("", 'Gray'), ("b", 'Red'),
+                                  ("c", None)]))
+
+  def test_render_ansi(self):
+    self.assertEqual("\x1b[91mx\x1b[0m y", render_ansi([("x", 'Red'), (" y", None)]))
+
+  def test_supports_ansi(self):
+    self.assertTrue(supports_ansi(dict(TERM = 'xterm')))
+    self.assertFalse(supports_ansi(dict(TERM = 'dumb')))
+    self.assertFalse(supports_ansi(dict()))
+    self.assertTrue(supports_ansi(dict(WT_SESSION = '1')))
+
+  #one write per span list, whichever way it goes out
+  def test_writes(self):
+    written = []
+    colored = []
+    spans = [("a", 'Red'), ("b", 'Red'), ("\n", None)]
+    console_renderer(written.append).write(spans)
+    console_renderer(written.append, colored.append, ansi = False).write(spans)
+    console_renderer(written.append, ansi = False).write(spans)
+    console_renderer(written.append).write([("", 'Red')])
+    self.assertEqual(["\x1b[91mab\x1b[0m\n", "ab\n"], written)
+    self.assertEqual([[("ab", 'Red'), ("\n", None)]], colored)
+
+#--------------------------------------------
+# background writer
+
+class background_writer_tests(unittest.TestCase):
+  def test_flush_writes_everything_posted(self):
+    written = []
+    writer = background_writer(console_renderer(written.append, ansi = False))
+    writer.start()
+    for i in range(100):
+      writer.post([("%d\n" % i, None)])
+    writer.flush()
+    self.assertEqual("".join("%d\n" % i for i in range(100)), "".join(written))
+    self.assertEqual((100, 100), (writer.posted, writer.written))
+    writer.close()
+
+  #without a writer thread, flush writes the queue itself
+  def test_without_a_thread(self):
+    written = []
+    writer = background_writer(console_renderer(written.append, ansi = False))
+    writer.post([("a", None)])
+    writer.post([("b", None)])
+    self.assertEqual([], written)
+    writer.flush()
+    self.assertEqual(["ab"], written)
+
+#--------------------------------------------
+# console colors
+
+class console_color_tests(unittest.TestCase):
+  #another thread can't change the colors while a with block has them set
+  def test_color_blocks_hold_the_console_lock(self):
+    acquired = []
+    def other_thread():
+      acquired.append(CC.console_lock.acquire(False))
+    with CC.Red:
+      with CC.Cyan:
+        thread = threading.Thread(target = other_thread)
+        thread.start()
+        thread.join()
+    self.assertEqual([False], acquired)
+    self.assertTrue(CC.console_lock.acquire(False))
+    CC.console_lock.release()
+
+if __name__ == '__main__':
+  unittest.main()
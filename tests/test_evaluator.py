@@ -0,0 +1,87 @@
+import os
+import unittest
+
+os.environ['IPYDBG_FAKES'] = '1'
+
+import ipydbg
+from evaluator import expression_evaluator, expression_names, eval_error
+from snapshot import stop_snapshot
+from fakedbg import FakeEvalBackend, FakeRoundTrips, FakeSymReader, \
+  FakeSymMethod, FakeScope, FakeLocal, FakeLocalsFrame, FakeModule, \
+  FakeThread, FakeChain, FakeGenericValue, FakeDebugger, ELEMENT_TYPE_I4
+
+class expression_names_tests(unittest.TestCase):
+  def test_names(self):
+    self.assertEqual(set(['a', 'b', 'len']), expression_names("len(a.b) + b"))
+    self.assertEqual(set(['x']), expression_names("not x and x.y"))
+    self.assertEqual(set(['a']), expression_names("a + ("))
+
+class expression_evaluator_tests(unittest.TestCase):
+  def setUp(self):
+    self.backend = FakeEvalBackend(dict(x = 3, items = [1, 2]))
+    self.evaluator = expression_evaluator(self.backend, timeout = 0.5)
+
+  #locals are looked up without running the debuggee, and everything else
+  #is evaluated once per stop
+  def test_once_per_stop(self):
+    stop = stop_snapshot()
+    self.assertEqual(('value', '3', 'int'), self.evaluator.evaluate("x", stop))
+    self.assertEqual(0, self.backend.evals)
+    self.assertEqual(('value', '4', 'int'), self.evaluator.evaluate("x + 1", stop))
+    self.evaluator.evaluate("x + 1", stop)
+    self.assertEqual(1, self.backend.evals)
+    self.evaluator.evaluate("x + 1", stop_snapshot())
+    self.assertEqual(2, self.backend.evals)
+
+  def test_watches_share_a_pass(self):
+    self.evaluator.add_watch("len(items)")
+    self.evaluator.add_watch(" x * 2 ")
+    self.evaluator.add_watch("x")
+    self.evaluator.add_watch("x * 2")
+    results = self.evaluator.evaluate_watches(stop_snapshot())
+    self.assertEqual([("len(items)", ('value', '2', 'int')),
+                      ("x * 2", ('value', '6', 'int')),
+                      ("x", ('value', '3', 'int'))], results)
+    self.assertEqual((1, 1), (self.evaluator.passes, self.backend.passes))
+    self.evaluator.remove_watch(1)
+    self.assertEqual(["x * 2", "x"], self.evaluator.watches)
+    self.assertRaises(Exception, self.evaluator.remove_watch, 3)
+
+  #failures are memoized too, so a hanging watch only times out once
+  def test_failures(self):
+    stop = stop_snapshot()
+    result = self.evaluator.evaluate("hang()", stop)
+    self.assertEqual('error', result[0])
+    self.assertTrue("timed out" in result[1])
+    self.evaluator.evaluate("hang()", stop)
+    self.assertEqual((1, 1), (self.backend.aborts, self.evaluator.timeouts))
+    self.assertEqual(('error', "1 / 0 threw ZeroDivisionError"),
+                     self.evaluator.evaluate("1 / 0", stop))
+
+#--------------------------------------------
+# CorEval lookups
+
+class cor_eval_lookup_tests(unittest.TestCase):
+  def setUp(self):
+    trips = FakeRoundTrips()
+    module = FakeModule(trips, "script", True)
+    root = FakeScope(trips, 0, 100, [FakeLocal(trips, 'x', 0)], [])
+    self.dp = ipydbg.IPyDebugProcess(FakeDebugger())
+    self.dp.attach(0)
+    self.dp.symbols.update_module(module, FakeSymReader([FakeSymMethod(1, [], root)]))
+    frame = FakeLocalsFrame(trips, 5, [FakeGenericValue(3, ELEMENT_TYPE_I4)],
+                            module.GetFunctionFromToken(1))
+    thread = FakeThread(trips, 1, [FakeChain([frame])])
+    self.dp.snapshot = ipydbg.thread_snapshot(self.dp.symbols, thread)
+    self.backend = ipydbg.CorEvalBackend(self.dp)
+
+  def test_paths_read_from_the_frame(self):
+    self.assertEqual(('3', 'System.Int32'), self.backend.lookup("x"))
+
+  #evals can't see the frame's locals, so expressions using them are refused
+  def test_locals_in_expressions_refused(self):
+    self.assertRaises(eval_error, self.backend.lookup, "x + 1")
+    self.assertEqual(None, self.backend.lookup("len(globals())"))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,99 @@
+import os
+import sys
+import unittest
+from StringIO import StringIO
+
+os.environ['IPYDBG_FAKES'] = '1'
+
+import ipydbg
+from excfilter import exception_filter, exception_counters, \
+  parse_exception_filter
+from renderer import console_renderer
+from instrumentation import instrumentation
+from fakedbg import FakeRoundTrips, FakeModule, FakeLocalsFrame, FakeThread, \
+  FakeChain, FakeEventArgs, FakeConsole, FakeKeyInfo, FakeDebugger, ConsoleKey
+
+#--------------------------------------------
+# exception filters
+
+class exception_filter_tests(unittest.TestCase):
+  def test_parse(self):
+    f = parse_exception_filter("first, ArgumentException")
+    self.assertEqual("first_chance of ArgumentException", str(f))
+    self.assertEqual("unhandled", str(parse_exception_filter("")))
+    self.assertEqual("never", str(exception_filter()))
+    self.assertRaises(Exception, exception_filter, ['sometimes'])
+
+  #types match on their full name or just their name
+  def test_should_stop(self):
+    f = parse_exception_filter("user,System.KeyError")
+    self.assertTrue(f.should_stop('user_first_chance', 'System.KeyError'))
+    self.assertFalse(f.should_stop('first_chance', 'System.KeyError'))
+    self.assertFalse(f.should_stop('user_first_chance', 'System.IndexError'))
+    self.assertTrue(f.stops_on('user_first_chance'))
+    self.assertFalse(f.stops_on('unhandled'))
+    f = parse_exception_filter("unhandled,ArgumentException")
+    self.assertTrue(f.should_stop('unhandled', 'System.ArgumentException'))
+
+class exception_counters_tests(unittest.TestCase):
+  def test_summary(self):
+    counters = exception_counters()
+    counters.count('KeyError', 'first_chance')
+    for i in range(2):
+      counters.count('StopIteration', 'first_chance')
+    counters.count('KeyError', 'unhandled')
+    counters.count('IndexError', 'first_chance')
+    self.assertEqual(5, counters.total)
+    self.assertEqual([('KeyError', dict(first_chance = 1, unhandled = 1)),
+                      ('StopIteration', dict(first_chance = 2)),
+                      ('IndexError', dict(first_chance = 1))],
+                     counters.summary())
+
+#--------------------------------------------
+# stops without source
+
+#an exception thrown where there are no symbols, like in library code
+class no_symbols_stop_tests(unittest.TestCase):
+  def setUp(self):
+    trips = FakeRoundTrips()
+    function = FakeModule(trips, "library", False).GetFunctionFromToken(0x06000002)
+    frame = FakeLocalsFrame(trips, 24, [], function)
+    self.dp = ipydbg.IPyDebugProcess(FakeDebugger())
+    self.dp.attach(0)
+    self.dp._do_break_event(FakeEventArgs(AppDomain = None, 
+      Thread = FakeThread(trips, 1, [FakeChain([frame])])))
+
+  #types what's given at the input loop, returning what it printed
+  def input(self, *typed):
+    written = []
+    saved = ipydbg.Console, ipydbg._console, sys.stdout
+    ipydbg.Console = FakeConsole(StringIO(), typed)
+    ipydbg._console = console_renderer(written.append, ansi = False)
+    sys.stdout = StringIO()
+    try:
+      self.dp._input()
+      return "".join(written) + sys.stdout.getvalue()
+    finally:
+      ipydbg.Console, ipydbg._console, sys.stdout = saved
+
+  def test_location_without_source(self):
+    output = self.input(FakeKeyInfo(ConsoleKey.Spacebar))
+    self.assertTrue("module::method6000002 -- offset 24, no source" in output)
+
+  #the time waiting at the prompt isn't counted against the stop
+  def test_only_showing_the_stop_timed(self):
+    self.dp.instrumentation = instrumentation()
+    self.dp.instrumentation.instrument(self.dp, ipydbg._instrumented_methods)
+    self.input(FakeKeyInfo(ConsoleKey.Spacebar))
+    histograms = self.dp.instrumentation.histograms
+    self.assertFalse('_input' in histograms)
+    self.assertEqual(1, histograms['_print_location'].count)
+
+  def test_run_to_line_needs_a_file(self):
+    output = self.input(FakeKeyInfo(ConsoleKey.U), "5", 
+                        FakeKeyInfo(ConsoleKey.Spacebar))
+    self.assertTrue("Run to line failed there's no source here" in output)
+    self.assertEqual([], self.dp.run_to_breakpoints)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,218 @@
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+from StringIO import StringIO
+
+from headless import event_writer, batch_commands
+from dbgserver import debug_server, encode_message, decode_messages, \
+  parse_address
+from recording import session_recorder, session_log
+from fakedbg import FakeBackend
+
+#a session that stops twice, at lines 3 and 4 of script.py
+def _events():
+  return [dict(event = 'OnCreateAppDomain', name = 'main'),
+          dict(event = 'OnBreakpoint', line = 3,
+               stack = [dict(function = 'f', file = 'script.py', line = 3)],
+               locals = [dict(name = 'x', value = '1', type = 'System.Int32')]),
+          dict(event = 'OnStepComplete', line = 4,
+               stack = [dict(function = 'f', file = 'script.py', line = 4)])]
+
+def _read_events(stream):
+  return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+#--------------------------------------------
+# headless batch mode
+
+class event_writer_tests(unittest.TestCase):
+  def test_buffers_until_flush(self):
+    stream = StringIO()
+    writer = event_writer(stream, buffer_size = 3)
+    writer.emit('a', n = 1)
+    writer.emit('b')
+    self.assertEqual("", stream.getvalue())
+    writer.emit('c')
+    self.assertEqual(['a', 'b', 'c'], [e['event'] for e in _read_events(stream)])
+    writer.emit('d')
+    writer.flush()
+    self.assertEqual(dict(event = 'd'), _read_events(stream)[-1])
+    self.assertEqual(4, writer.count)
+
+class batch_commands_tests(unittest.TestCase):
+  def run_batch(self, commands):
+    stream = StringIO()
+    backend = FakeBackend(_events())
+    backend.run(commands, event_writer(stream))
+    return backend, _read_events(stream)
+
+  def test_commands_at_each_stop(self):
+    backend, events = self.run_batch(["locals", "break other.py:3 every 2",
+                                      "step", "# a comment", "", "stack", "c"])
+    self.assertEqual(['OnCreateAppDomain', 'OnBreakpoint', 'locals',
+                      'breakpoint_added', 'OnStepComplete', 'stack',
+                      'OnProcessExit'], [e['event'] for e in events])
+    self.assertEqual('x', events[2]['locals'][0]['name'])
+    self.assertEqual(4, events[5]['frames'][0]['line'])
+    self.assertEqual(["other.py:3 every 2"], backend.breakpoints)
+    self.assertEqual(['over'], backend.steps)
+
+  def test_unknown_command(self):
+    backend, events = self.run_batch(["frobnicate"])
+    self.assertEqual('error', events[2]['event'])
+    self.assertEqual('frobnicate', events[2]['command'])
+
+  #once the commands run out, the debuggee runs to the end
+  def test_runs_on_after_commands(self):
+    backend, events = self.run_batch([])
+    self.assertEqual('OnProcessExit', events[-1]['event'])
+
+  def test_quit(self):
+    backend, events = self.run_batch(["quit"])
+    self.assertTrue(backend.quit_requested)
+    self.assertEqual(['OnCreateAppDomain', 'OnBreakpoint', 'OnProcessExit'],
+                     [e['event'] for e in events])
+
+  def test_threads(self):
+    stream = StringIO()
+    backend = FakeBackend(_events())
+    batch = batch_commands(backend, [], event_writer(stream))
+    backend.current = backend.events[1]
+    batch.execute("threads")
+    batch.writer.flush()
+    self.assertEqual([dict(threads = [1], frames = backend.current['stack'])],
+                     _read_events(stream)[0]['threads'])
+
+#--------------------------------------------
+# debug server
+
+class message_tests(unittest.TestCase):
+  def test_round_trip(self):
+    data = encode_message(dict(seq = 1)) + encode_message(dict(seq = 2))
+    messages, rest = decode_messages(data + data[:10])
+    self.assertEqual([dict(seq = 1), dict(seq = 2)], messages)
+    self.assertEqual(data[:10], rest)
+
+  def test_missing_length(self):
+    self.assertRaises(Exception, decode_messages, "Foo: 1\r\n\r\n{}")
+
+  def test_parse_address(self):
+    self.assertEqual(("127.0.0.1", 4711), parse_address("4711"))
+    self.assertEqual(("127.0.0.1", 4711), parse_address(":4711"))
+    self.assertEqual(("example", 4711), parse_address("example:4711"))
+    self.assertEqual("/tmp/ipydbg.sock", parse_address("/tmp/ipydbg.sock"))
+
+#a client of a fake session's server on the loopback interface
+class _client(object):
+  def __init__(self, server):
+    self.sock = socket.create_connection(server.listener.getsockname())
+    self.sock.settimeout(10)
+    self.buf = ""
+    self.messages = []
+    self.seq = 0
+
+  def receive(self, done):
+    while True:
+      while self.messages:
+        m = self.messages.pop(0)
+        if done(m):
+          return m
+      data = self.sock.recv(65536)
+      if not data:
+        raise Exception, "The server closed the connection"
+      messages, self.buf = decode_messages(self.buf + data)
+      self.messages += messages
+
+  def next_stop(self):
+    return self.receive(lambda m: m.get('event') in ('stopped', 'exited'))
+
+  def request(self, command, **arguments):
+    self.seq += 1
+    seq = self.seq
+    self.sock.sendall(encode_message(dict(seq = seq, type = 'request',
+                                          command = command, arguments = arguments)))
+    return self.receive(lambda m: m.get('request_seq') == seq)
+
+class debug_server_tests(unittest.TestCase):
+  def setUp(self):
+    self.backend = FakeBackend(_events())
+    self.backend.server = debug_server(self.backend, ('127.0.0.1', 0))
+    self.thread = threading.Thread(target = self.backend.server.serve)
+    self.thread.setDaemon(True)
+    self.thread.start()
+
+  def tearDown(self):
+    self.thread.join(10)
+    self.assertFalse(self.thread.isAlive())
+
+  #the stack and locals come in the stopped event, and a client that
+  #connects while the debuggee is stopped is sent it straight away
+  def test_session(self):
+    client = _client(self.backend.server)
+    stop = client.next_stop()
+    self.assertEqual('stopped', stop['event'])
+    self.assertEqual(3, stop['body']['stack'][0]['line'])
+    self.assertEqual('x', stop['body']['locals'][0]['name'])
+
+    late = _client(self.backend.server)
+    self.assertEqual(stop['body'], late.next_stop()['body'])
+
+    response = client.request('setBreakpoint', spec = "other.py:7")
+    self.assertTrue(response['success'])
+    self.assertEqual(["other.py:7"], self.backend.breakpoints)
+
+    self.assertTrue(client.request('next')['success'])
+    self.assertEqual(4, client.next_stop()['body']['stack'][0]['line'])
+    self.assertEqual(4, late.next_stop()['body']['stack'][0]['line'])
+    self.assertEqual(['over'], self.backend.steps)
+
+    client.request('continue')
+    self.assertEqual('exited', client.next_stop()['event'])
+    #the server closes the connections once the debuggee has exited
+    self.assertRaises(Exception, client.next_stop)
+    client.sock.close()
+    late.sock.close()
+
+  def test_bad_requests(self):
+    client = _client(self.backend.server)
+    client.next_stop()
+    response = client.request('frobnicate')
+    self.assertFalse(response['success'])
+    self.assertEqual("Unknown command frobnicate", response['message'])
+    client.request('terminate')
+    self.assertTrue(self.backend.quit_requested)
+    self.assertEqual('exited', client.next_stop()['event'])
+    client.sock.close()
+
+#--------------------------------------------
+# session recording
+
+class session_log_tests(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, "session.log")
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  #events besides stops can have a stack, and they don't make the index 
+  #look out of date
+  def test_index_kept(self):
+    recorder = session_recorder(self.path)
+    recorder.record('OnCreateAppDomain', name = 'main')
+    recorder.record_stop([dict(function = 'f', file = 'script.py', line = 3)], [])
+    recorder.record('threads', stack = [dict(function = 'g')])
+    recorder.close()
+    log = session_log(self.path)
+    self.assertEqual([len(json.dumps(dict(event = 'OnCreateAppDomain', 
+                                          name = 'main'))) + 1],
+                     log._read_index())
+    self.assertEqual(1, len(log))
+    self.assertEqual(3, log.stop(0)['stack'][0]['line'])
+    log.close()
+
+if __name__ == '__main__':
+  unittest.main()
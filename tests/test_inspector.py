@@ -0,0 +1,94 @@
+import os
+import unittest
+
+os.environ['IPYDBG_FAKES'] = '1'
+
+import ipydbg
+from inspector import value_inspector, parse_path
+from fakedbg import FakeRoundTrips, FakeClass, FakeObjectValue, \
+  FakeGenericValue, FakeStringValue, FakeReferenceValue, generate_list, \
+  ELEMENT_TYPE_I4
+
+class parse_path_tests(unittest.TestCase):
+  def test_parse_path(self):
+    self.assertEqual(['items', 3, 'name'], parse_path("items[3].name"))
+    self.assertEqual(['x'], parse_path(" x "))
+    self.assertRaises(Exception, parse_path, "items[x]")
+
+class value_inspector_tests(unittest.TestCase):
+  def setUp(self):
+    self.trips = FakeRoundTrips()
+    self.inspector = value_inspector(ipydbg.extract_value, ipydbg.display_value,
+                                     ipydbg.get_fields, ipydbg.get_elements,
+                                     page_size = 10)
+    self.lst = generate_list(self.trips, 95)
+    self.data = self.lst.values[0]
+    self.roots = []
+
+  def root(self, name):
+    self.roots.append(name)
+    return self.lst if name == 'lst' else None
+
+  #a list shows its elements, not the array it keeps them in, and only the
+  #pages asked for are read from the debuggee
+  def test_list_pages(self):
+    node = self.inspector.root('lst', self.root)
+    self.assertEqual(('<...>', 'IronPython.Runtime.List'), node.display())
+    self.assertEqual(95, node.count)
+    self.assertEqual(10, node.page_count)
+    self.assertEqual(0, self.data.reads)
+    page = node.children(3)
+    self.assertEqual(["[%d]" % i for i in range(30, 40)], [c.name for c in page])
+    self.assertEqual([str(i) for i in range(30, 40)], [c.display()[0] for c in page])
+    self.assertEqual(10, self.data.reads)
+    self.assertTrue(node.children(3) is page)
+    self.assertEqual(10, self.data.reads)
+    #the array is over-allocated, but the last page stops at the size
+    self.assertEqual(5, len(node.children(9)))
+
+  def test_find(self):
+    node = self.inspector.find("lst[42]", self.root)
+    self.assertEqual(('42', 'System.Int32'), node.display())
+    self.assertEqual(10, self.data.reads)
+    self.assertRaises(Exception, self.inspector.find, "lst[200]", self.root)
+    self.assertRaises(Exception, self.inspector.find, "other", self.root)
+    #roots are only asked for once per stop
+    self.inspector.find("lst[43]", self.root)
+    self.assertEqual(['lst', 'other'], self.roots)
+    self.inspector.clear()
+    self.inspector.find("lst[43]", self.root)
+    self.assertEqual(['lst', 'other', 'lst'], self.roots)
+
+  def test_object_fields(self):
+    point = FakeClass(self.trips, None, 'Point', [], ['x', 'name', 'next'])
+    null = FakeReferenceValue(None, point)
+    value = FakeObjectValue(point, [FakeGenericValue(3, ELEMENT_TYPE_I4),
+                                    FakeStringValue("p"), null])
+    node = self.inspector.root('p', lambda name: value)
+    self.assertEqual(3, node.count)
+    self.assertEqual([('x', '3'), ('name', '"p"'), ('next', '<None>')],
+                     [(c.name, c.display()[0]) for c in node.children()])
+    self.assertEqual(3, value.reads)
+    self.assertFalse(node.child('x').expandable)
+    self.assertEqual(None, node.child(0))
+
+  #a list laid out differently than expected shows its fields instead
+  def test_list_without_a_size(self):
+    list_class = FakeClass(self.trips, None, 'IronPython.Runtime.List', [], 
+                           ['_data', '_count'])
+    value = FakeObjectValue(list_class, self.lst.values)
+    node = self.inspector.root('l', lambda name: value)
+    self.assertEqual(2, node.count)
+    self.assertEqual(['_data', '_count'], [c.name for c in node.children()])
+    self.assertEqual(None, node.child(0))
+
+  def test_max_depth(self):
+    inspector = value_inspector(ipydbg.extract_value, ipydbg.display_value,
+                                ipydbg.get_fields, ipydbg.get_elements,
+                                max_depth = 0)
+    node = inspector.root('lst', self.root)
+    self.assertFalse(node.expandable)
+    self.assertEqual([], node.children())
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,86 @@
+import os
+import unittest
+
+os.environ['IPYDBG_FAKES'] = '1'
+
+import ipydbg
+from jmc import prefix_trie, jmc_classifier, jmc_batch
+from excfilter import parse_exception_filter
+from fakedbg import FakeRoundTrips, FakeModule, FakeClass, FakeProcess, \
+  FakeDebugger
+
+#--------------------------------------------
+# just my code classification
+
+class jmc_classifier_tests(unittest.TestCase):
+  def test_longest_prefix(self):
+    trie = prefix_trie()
+    trie.add("IronPython.", False)
+    trie.add("IronPython.NewTypes.Mine", True)
+    self.assertEqual(False, trie.match("IronPython.Runtime.List"))
+    self.assertEqual(True, trie.match("IronPython.NewTypes.Mine$1"))
+    self.assertEqual(None, trie.match("module$1"))
+
+  def test_decisions_remembered(self):
+    classifier = jmc_classifier(['.ctor'], ['IronPython.NewTypes'])
+    self.assertFalse(classifier.is_user_type("IronPython.NewTypes.Object_1", True))
+    self.assertTrue(classifier.is_user_type("module$1", True))
+    self.assertTrue(classifier.is_user_type("module$1", True))
+    self.assertFalse(classifier.is_user_type("module$1", False))
+    self.assertEqual((1, 2), (classifier.hits, classifier.misses))
+    self.assertEqual([2], classifier.infrastructure_tokens([('f', 1), ('.ctor', 2)]))
+
+  def test_batch(self):
+    batch = jmc_batch(batch_size = 3)
+    self.assertFalse(batch.add("a", [1, 2]))
+    self.assertFalse(batch.add("b", []))
+    self.assertTrue(batch.add("b", [3]))
+    applied = []
+    batch.flush(lambda module, tokens: applied.append((module, tokens)))
+    self.assertEqual([("a", [1, 2]), ("b", [3])], sorted(applied))
+    self.assertEqual(0, len(batch))
+
+#class loads replayed through IPyDebugProcess.OnClassLoad
+class class_load_tests(unittest.TestCase):
+  def setUp(self):
+    self.trips = FakeRoundTrips()
+    self.process = FakeProcess(self.trips)
+    self.dp = ipydbg.IPyDebugProcess(FakeDebugger(process = self.process))
+    self.dp.start("script.py")
+
+  #a static module's JMC status is set once, however many of its classes
+  #load, and a python class's infrastructure methods wait in the batch
+  def test_jmc_status(self):
+    static = FakeModule(self.trips, "static.dll", False)
+    dynamic = FakeModule(self.trips, "dynamic", True)
+    python = FakeClass(self.trips, dynamic, "module$1", [('.ctor', 1), ('f', 2)])
+    self.process.dispatch([('OnClassLoad', dict(Class = FakeClass(self.trips,
+                                                static, "System.Type%d" % i, [])))
+                             for i in range(10)] +
+                          [('OnClassLoad', dict(Class = python))])
+    self.assertEqual(1, len(self.dp.non_user_modules))
+    self.assertEqual(1, len(self.dp.jmc_batch))
+    self.dp._flush_jmc()
+    self.assertEqual(1, self.dp.jmc_batch.applied)
+
+  def load_python_class(self):
+    dynamic = FakeModule(self.trips, "dynamic", True)
+    python = FakeClass(self.trips, dynamic, "module$1", [('.ctor', 1), ('f', 2)])
+    self.process.dispatch([('OnClassLoad', dict(Class = python))])
+    return len(self.dp.jmc_batch), self.dp.jmc_batch.applied
+
+  #while a stepper is out, or when stopping on exceptions in user code, a 
+  #python class's infrastructure methods are disabled before its class 
+  #load callback returns
+  def test_applied_while_stepping(self):
+    self.dp.stepper = object()
+    self.assertEqual((0, 1), self.load_python_class())
+
+  def test_applied_when_stopping_in_user_code(self):
+    self.process = FakeProcess(self.trips)
+    self.dp = ipydbg.IPyDebugProcess(FakeDebugger(process = self.process))
+    self.dp.start("script.py", exceptions = parse_exception_filter("user"))
+    self.assertEqual((0, 1), self.load_python_class())
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,92 @@
+import os
+import unittest
+
+os.environ['IPYDBG_FAKES'] = '1'
+
+import ipydbg
+from profiler import sample_profile
+from threadstacks import frame_resolver, dump_threads, group_stacks
+from fakedbg import FakeRoundTrips, FakeFrame, FakeChain, FakeThread, \
+  FakeLocalsFrame, FakeGenericValue, FakeModule, fake_describe_frame, \
+  generate_threads, ELEMENT_TYPE_I4
+
+#--------------------------------------------
+# stop snapshots
+
+class stop_snapshot_tests(unittest.TestCase):
+  #a miss is counted once, however many queries it took
+  def test_misses_by_kind(self):
+    trips = FakeRoundTrips()
+    function = FakeModule(trips, "library", False).GetFunctionFromToken(1)
+    frame = FakeLocalsFrame(trips, 24, [FakeGenericValue(i, ELEMENT_TYPE_I4)
+                                          for i in range(5)], function)
+    frame.GetLocalVariablesCount = lambda: 5
+    snapshot = ipydbg.thread_snapshot(ipydbg.debuggee_symbols(), 
+                                      FakeThread(trips, 1, [FakeChain([frame])]))
+    for i in range(3):
+      self.assertEqual(5, len(snapshot.locals(snapshot.active_frame)))
+    stats = snapshot.stats()
+    self.assertEqual((4, 2), (stats['hits'], stats['misses']))
+    self.assertEqual(dict(active_frame = 1, locals = 1), stats['misses_by_kind'])
+    self.assertTrue(trips.count > stats['misses'])
+
+#--------------------------------------------
+# sampling profiler
+
+class sample_profile_tests(unittest.TestCase):
+  def setUp(self):
+    self.profile = sample_profile()
+    main = ("main", "a.py", 1)
+    self.profile.add_sample([[("f", "a.py", 10), ("f", "a.py", 12), main],
+                             [("g", None, None), main]], 0.002)
+    self.profile.add_sample([[("f", "a.py", 10), main], []], 0.004)
+
+  def test_counts(self):
+    self.assertEqual(2, self.profile.samples)
+    self.assertEqual(3, self.profile.stacks)
+    #f recursing still only counts once towards its total
+    self.assertEqual([("f", 2, 2), ("g", 1, 1)], self.profile.top_functions())
+    self.assertEqual(3, self.profile.function_total["main"])
+    self.assertEqual([(("a.py", 10), 2)], self.profile.top_lines())
+
+  def test_collapsed(self):
+    self.assertEqual(["main;f 1", "main;f;f 1", "main;g 1"], self.profile.collapsed())
+
+  def test_pause_stats(self):
+    stats = self.profile.pause_stats()
+    self.assertEqual(2, stats['count'])
+    self.assertAlmostEqual(3.0, stats['mean'])
+    self.assertAlmostEqual(4.0, stats['max'])
+    self.assertEqual(0.0, sample_profile().pause_stats()['max'])
+
+#--------------------------------------------
+# thread dumps
+
+class thread_dump_tests(unittest.TestCase):
+  #frames shared between threads are only described once
+  def test_frames_resolved_once(self):
+    trips = FakeRoundTrips()
+    threads = generate_threads(trips, 50, busy = 0)
+    resolver = frame_resolver(ipydbg.get_frame_key, fake_describe_frame(trips))
+    groups = group_stacks(dump_threads(threads, ipydbg.get_thread_frames, resolver))
+    self.assertTrue(len(groups) <= 4)
+    self.assertEqual(50, sum(len(ids) for stack, ids in groups))
+    self.assertEqual(sorted(len(ids) for stack, ids in groups)[::-1],
+                     [len(ids) for stack, ids in groups])
+    distinct = set(ipydbg.get_frame_key(f) for stack in [t.chains[0].Frames
+                     for t in threads] for f in stack)
+    self.assertEqual(len(distinct), resolver.misses)
+    #the native frame has no offset, and isn't shown
+    self.assertTrue(all(len(stack) == 20 for stack, ids in groups))
+
+  def test_unreadable_thread(self):
+    trips = FakeRoundTrips()
+    good = FakeThread(trips, 1, [FakeChain([FakeFrame("f", 10)])])
+    bad = FakeThread(trips, 2, None)
+    resolver = frame_resolver(ipydbg.get_frame_key, lambda f, offset: (f, offset))
+    dump = dump_threads([good, bad], ipydbg.get_thread_frames, resolver)
+    self.assertEqual([(1, [("f", 10)]), (2, None)], dump)
+    self.assertEqual([([("f", 10)], [1]), (None, [2])], group_stacks(dump))
+
+if __name__ == '__main__':
+  unittest.main()
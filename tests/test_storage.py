@@ -0,0 +1,166 @@
+import codecs
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from symstore import symbol_store, encode_symbols
+from tracelog import trace_log
+from sourcecache import decode_source, read_source_lines, source_cache, \
+  source_nbytes
+from fakedbg import FakeRoundTrips, FakeSymDocument, FakeSymMethod, \
+  FakeScope, FakeLocal, generate_symmethod
+
+class _directory_test(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def path(self, name):
+    return os.path.join(self.directory, name)
+
+#--------------------------------------------
+# symbol store
+
+class symbol_store_tests(_directory_test):
+  def setUp(self):
+    _directory_test.setUp(self)
+    self.store = symbol_store(self.path("symbols"))
+    trips = FakeRoundTrips()
+    self.doc = FakeSymDocument("a.py")
+    root = FakeScope(trips, 0, 100, [FakeLocal(trips, 'x', 0)],
+                     [FakeScope(trips, 10, 20, [FakeLocal(trips, 'y', 1)], [])])
+    self.outer = generate_symmethod(1, self.doc, 1, 10)
+    self.outer.RootScope = root
+    #a lambda on line 5, whose points are also in the outer method's
+    self.inner = FakeSymMethod(2, [(0, self.doc, 5, 20, 5, 30)])
+
+  def methods(self):
+    return [(m.Token.GetToken(), m.read_sequence_points(), m.RootScope)
+              for m in (self.outer, self.inner)]
+
+  def test_round_trip(self):
+    self.assertEqual(None, self.store.load('key'))
+    self.store.save('key', self.methods())
+    cached = self.store.load('key')
+    self.assertEqual((1, 1, 1), (self.store.misses, self.store.hits, self.store.saves))
+    self.assertEqual(["a.py"], [doc.URL for doc in cached.GetDocuments()])
+    method = cached.GetMethod(1)
+    self.assertEqual(1, cached.loads)
+    offsets, docs, lines = method.read_sequence_points()[:3]
+    self.assertEqual(self.outer.read_sequence_points()[0], offsets)
+    self.assertEqual(self.outer.read_sequence_points()[2], lines)
+    scope = method.RootScope
+    self.assertEqual(['x'], [lv.Name for lv in scope.GetLocals()])
+    self.assertEqual([(10, 20)], [(s.StartOffset, s.EndOffset) for s in scope.GetChildren()])
+    self.assertEqual(None, cached.GetMethod(3))
+
+  #a line more than one method has points on is in the method the symbol
+  #reader says, not whichever was saved first
+  def test_containing_method(self):
+    def containing(d, line):
+      return 2 if line == 5 else 1
+    self.store.save('key', self.methods(), containing)
+    cached = self.store.load('key')
+    cached_doc = cached.GetDocuments()[0]
+    token = lambda line: \
+      cached.GetMethodFromDocumentPosition(cached_doc, line, 0).Token.GetToken()
+    self.assertEqual((2, 1), (token(5), token(4)))
+    self.assertEqual(6, cached_doc.FindClosestLine(6))
+
+  #the symbols are encoded before they're handed to the writer thread, 
+  #and a write that fails is counted
+  def test_background_writes(self):
+    encoded = encode_symbols(self.methods())
+    self.store.save_in_background('key', encoded)
+    self.store.join()
+    self.assertEqual(["x"], [lv.Name for lv in
+                             self.store.load('key').GetMethod(1).RootScope.GetLocals()])
+    open(self.path("file"), 'w').close()
+    not_a_directory = symbol_store(self.path("file"))
+    not_a_directory.save_in_background('key', encoded)
+    not_a_directory.join()
+    self.assertEqual(dict(hits = 1, misses = 0, saves = 1, failures = 0),
+                     self.store.stats())
+    self.assertEqual(1, not_a_directory.stats()['failures'])
+
+  def test_prune(self):
+    store = symbol_store(self.path("symbols"), max_files = 2)
+    for key in ('a', 'b', 'c'):
+      store.save(key, self.methods())
+    self.assertEqual(2, len(os.listdir(self.path("symbols"))))
+
+#--------------------------------------------
+# trace log
+
+class trace_log_tests(_directory_test):
+  #when the writer falls behind, appends wait for it rather than drop records
+  def test_nothing_dropped(self):
+    filename = self.path("trace.log")
+    log = trace_log(filename, capacity = 10, flush_interval = 0.01)
+    log.start()
+    for i in range(1000):
+      log.append("a.py:3", i + 1, "x=%d" % i)
+    log.close()
+    self.assertEqual((1000, 1000), (log.count, log.written))
+    f = open(filename)
+    records = [json.loads(line) for line in f]
+    f.close()
+    self.assertEqual(range(1, 1001), [r['hit'] for r in records])
+    self.assertEqual("x=999", records[-1]['message'])
+
+  def test_without_a_file(self):
+    log = trace_log(capacity = 4)
+    log.start()
+    for i in range(10):
+      log.append(None, i + 1, str(i))
+    self.assertEqual(["7", "8", "9"], [r[3] for r in log.recent(3)])
+    self.assertEqual([], log.recent(0))
+    log.close()
+
+#--------------------------------------------
+# source files
+
+class source_file_tests(_directory_test):
+  def write(self, name, data):
+    f = open(self.path(name), 'wb')
+    f.write(data)
+    f.close()
+    return self.path(name)
+
+  def test_decode_boms(self):
+    text = u"print 'caf\xe9'\n"
+    self.assertEqual(text, decode_source(text.encode('utf-8')))
+    self.assertEqual(text, decode_source(codecs.BOM_UTF8 + text.encode('utf-8')))
+    self.assertEqual(text, decode_source(codecs.BOM_UTF16_LE + text.encode('utf-16-le')))
+    self.assertEqual(text, decode_source(codecs.BOM_UTF16_BE + text.encode('utf-16-be')))
+    self.assertEqual(text, decode_source(codecs.BOM_UTF32_LE + text.encode('utf-32-le')))
+
+  def test_line_endings(self):
+    path = self.write("a.py", "a\r\nb\rc\nd\x0ce\n")
+    self.assertEqual([u"a", u"b", u"c", u"d\x0ce"], read_source_lines(path))
+
+  #files are charged for their lines in memory, not their size on disk
+  def test_cache(self):
+    nbytes = source_nbytes([u"1", u"2", u"3"])
+    cache = source_cache(budget = nbytes + 1)
+    a = self.write("a.py", "1\n2\n3\n")
+    b = self.write("b.py", "4\n5\n6\n")
+    self.assertEqual([u"2", u"3"], cache.get(a).lines(2, 5))
+    self.assertTrue(cache.get(a) is cache.get(a))
+    self.assertEqual((2, 1), (cache.hits, cache.misses))
+    self.assertEqual(nbytes, cache.bytes)
+    #b doesn't fit alongside a
+    cache.get(b)
+    self.assertFalse(a in cache)
+    self.assertEqual(1, cache.evictions)
+    #files changed on disk are read again
+    self.write("b.py", "4\n5\n6\n7\n")
+    self.assertEqual(4, len(cache.get(b)))
+    self.assertEqual(1, cache.reloads)
+
+if __name__ == '__main__':
+  unittest.main()
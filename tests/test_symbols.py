@@ -0,0 +1,169 @@
+import os
+import unittest
+
+os.environ['IPYDBG_FAKES'] = '1'
+
+import ipydbg
+from symcache import sequence_point_table, sequence_point_cache, symbol_index, \
+  scope_table, HIDDEN_LINE
+from fakedbg import FakeRoundTrips, FakeSymDocument, FakeSymReader, \
+  FakeSymMethod, FakeScope, FakeLocal, FakeLocalsFrame, FakeModule, \
+  FakeGenericValue, generate_symmethod, ELEMENT_TYPE_I4
+
+#--------------------------------------------
+# sequence point tables
+
+class sequence_point_table_tests(unittest.TestCase):
+  def setUp(self):
+    self.doc = FakeSymDocument(os.path.abspath("a.py"))
+    self.method = generate_symmethod(1, self.doc, 10, 8)
+    self.table = sequence_point_table(*self.method.read_sequence_points())
+
+  def test_hidden_lines_left_out(self):
+    self.assertEqual(8, len(self.table))
+    self.assertFalse(HIDDEN_LINE in self.table.start_lines)
+
+  def test_find(self):
+    self.assertEqual(None, self.table.find(-1))
+    self.assertEqual(10, self.table.find(0).start_line)
+    self.assertEqual(10, self.table.find(11).start_line)
+    self.assertEqual(11, self.table.find(12).start_line)
+    #the offset after line 13 is a hidden point, which belongs to line 13
+    self.assertEqual(13, self.table.find(49).start_line)
+    self.assertTrue(self.table.find(0) is self.table.find(5))
+
+  def test_next_offset_and_find_line(self):
+    self.assertEqual(12, self.table.next_offset(0))
+    self.assertEqual(None, self.table.next_offset(1000))
+    self.assertEqual(24, self.table.find_line(self.doc.URL, 12))
+    self.assertEqual(None, self.table.find_line(self.doc.URL, 100))
+
+class sequence_point_cache_tests(unittest.TestCase):
+  def test_lookup_and_invalidate(self):
+    cache = sequence_point_cache()
+    loads = []
+    def load():
+      loads.append(1)
+      return len(loads)
+    self.assertEqual(1, cache.lookup('m', 1, load))
+    self.assertEqual(1, cache.lookup('m', 1, load))
+    self.assertEqual((1, 1), (cache.hits, cache.misses))
+    cache.invalidate('m')
+    self.assertEqual(2, cache.lookup('m', 1, load))
+    self.assertEqual(1, len(cache))
+
+#--------------------------------------------
+# document index
+
+class symbol_index_tests(unittest.TestCase):
+  def setUp(self):
+    self.tables = sequence_point_cache()
+    self.index = symbol_index(self.tables, lambda m: m.read_sequence_points())
+    self.a = FakeSymDocument(os.path.abspath(os.path.join("one", "a.py")))
+    self.other_a = FakeSymDocument(os.path.abspath(os.path.join("two", "a.py")))
+    self.index.update_module("one",
+                             FakeSymReader([generate_symmethod(1, self.a, 1, 10)]))
+    self.index.update_module("two",
+                             FakeSymReader([generate_symmethod(1, self.other_a, 1, 10)]))
+
+  def test_find_by_name_and_path(self):
+    self.assertEqual(2, len(self.index.find_documents("a.py")))
+    self.assertEqual([("one", self.a)],
+                     self.index.find_documents(os.path.join("one", "a.py")))
+    self.assertEqual([], self.index.find_documents("b.py"))
+    self.assertEqual(self.other_a, self.index.find_module_document("two", "a.py"))
+
+  def test_resolve_line(self):
+    self.assertEqual((1, 36), self.index.resolve_line("one", self.a, 4))
+    self.assertEqual(1, self.tables.misses)
+    self.index.resolve_line("one", self.a, 4)
+    self.assertEqual(1, self.tables.misses)
+
+  def test_remove_module(self):
+    self.index.resolve_line("one", self.a, 4)
+    self.index.remove_module("one")
+    self.assertEqual([("two", self.other_a)], self.index.find_documents("a.py"))
+    self.assertFalse("one" in self.index)
+    self.assertEqual(0, len(self.tables))
+
+#--------------------------------------------
+# local scopes
+
+class scope_table_tests(unittest.TestCase):
+  def test_locals_at(self):
+    trips = FakeRoundTrips()
+    inner = FakeScope(trips, 10, 19, [FakeLocal(trips, 'b', 1)], [])
+    root = FakeScope(trips, 0, 100, [FakeLocal(trips, 'a', 0),
+                                     FakeLocal(trips, '$site', 2)], [inner])
+    table = scope_table(root)
+    self.assertEqual([('a', 0)], table.locals_at(5))
+    self.assertEqual([('a', 0), ('b', 1)], table.locals_at(15))
+    #the scopes are only read once
+    reads = trips.count
+    table.locals_at(16)
+    self.assertEqual(reads, trips.count)
+
+#--------------------------------------------
+# each process's symbols
+
+class debuggee_symbols_tests(unittest.TestCase):
+  def setUp(self):
+    self.trips = FakeRoundTrips()
+    self.doc = FakeSymDocument(os.path.abspath("script.py"))
+
+  #the module's symbols, read the way OnUpdateModuleSymbols reads them
+  def load(self, symbols, name):
+    module = FakeModule(self.trips, name, True)
+    symbols.update_module(module, FakeSymReader([generate_symmethod(
+      0x06000001, self.doc, 1, 10)]))
+    return module
+
+  #a breakpoint set in one session only binds in that session's modules,
+  #even when another session is running the same script
+  def test_sessions_are_separate(self):
+    one, two = ipydbg.debuggee_symbols(), ipydbg.debuggee_symbols()
+    module = self.load(one, "one")
+    other = self.load(two, "two")
+    self.assertEqual([(module, self.doc)], ipydbg.find_documents(one, "script.py"))
+    self.assertEqual([(other, self.doc)], ipydbg.find_documents(two, "script.py"))
+    bp = ipydbg.create_breakpoint(one, module, "script.py", 3)
+    self.assertTrue(bp.function.Module is module)
+    self.assertEqual(24, bp.offset)
+    self.assertEqual(None, ipydbg.create_breakpoint(two, module, "script.py", 3))
+
+  def test_get_location(self):
+    symbols = ipydbg.debuggee_symbols()
+    module = self.load(symbols, "one")
+    function = module.GetFunctionFromToken(0x06000001)
+    self.assertEqual(3, ipydbg.get_location(symbols, function, 30).start_line)
+    self.assertEqual(1, symbols.sequence_point_tables.misses)
+    unloaded = FakeModule(self.trips, "two", True).GetFunctionFromToken(1)
+    self.assertEqual(None, ipydbg.get_location(symbols, unloaded, 30))
+
+  def test_deferred_symbols_read_on_first_use(self):
+    symbols = ipydbg.debuggee_symbols()
+    module = FakeModule(self.trips, "one", True)
+    reader = FakeSymReader([generate_symmethod(0x06000001, self.doc, 1, 10)])
+    symbols.deferred.defer(module, lambda: symbols.update_module(module, reader))
+    self.assertEqual([(module, self.doc)], ipydbg.find_documents(symbols, "script.py"))
+    self.assertEqual(0, len(symbols.deferred))
+
+  #the locals come from the method's scope table, which is read again when
+  #the module's symbols are updated
+  def test_get_locals(self):
+    symbols = ipydbg.debuggee_symbols()
+    module = FakeModule(self.trips, "one", True)
+    root = FakeScope(self.trips, 0, 100, [FakeLocal(self.trips, 'x', 0)], [])
+    symbols.update_module(module, FakeSymReader([FakeSymMethod(1, [], root)]))
+    function = module.GetFunctionFromToken(1)
+    frame = FakeLocalsFrame(self.trips, 5, [FakeGenericValue(3, ELEMENT_TYPE_I4)],
+                            function)
+    self.assertEqual(['x'], [name for name, value in ipydbg.get_locals(symbols, frame)])
+    self.assertEqual(dict(x = 3), ipydbg.get_frame_values(symbols, frame, ['x']))
+
+    root = FakeScope(self.trips, 0, 100, [FakeLocal(self.trips, 'y', 0)], [])
+    symbols.update_module(module, FakeSymReader([FakeSymMethod(1, [], root)]))
+    self.assertEqual(['y'], [name for name, value in ipydbg.get_locals(symbols, frame)])
+
+if __name__ == '__main__':
+  unittest.main()
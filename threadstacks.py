@@ -0,0 +1,64 @@
+#--------------------------------------------
+# frame resolution
+
+#resolves frames to what's shown for them - (function, file, line) in
+#ipydbg - through a memo keyed by the (function, IL offset) frame_key(frame)
+#returns. One resolver is shared by every thread being walked, and since
+#most threads in a service sit in the same few frames, each distinct frame
+#is only described once. describe(function, offset) returns None for
+#frames that aren't shown, and frame_key returns None for frames that have
+#no IL offset, which are skipped
+class frame_resolver(object):
+  def __init__(self, frame_key, describe):
+    self.frame_key = frame_key
+    self.describe = describe
+    self._memo = dict()
+    self.hits = 0
+    self.misses = 0
+
+  def resolve(self, frame):
+    key = self.frame_key(frame)
+    if key == None:
+      return None
+    if key in self._memo:
+      self.hits += 1
+      return self._memo[key]
+    self.misses += 1
+    result = self._memo[key] = self.describe(*key)
+    return result
+
+  def stack(self, frames):
+    stack = []
+    for frame in frames:
+      resolved = self.resolve(frame)
+      if resolved != None:
+        stack.append(resolved)
+    return stack
+
+#--------------------------------------------
+# thread dumps
+
+#every thread's stack in one pass, as (thread id, stack) with the frames
+#innermost first. frames(thread) gives a thread's frames. A thread whose
+#frames can't be read gets None, rather than losing the whole dump
+def dump_threads(threads, frames, resolver):
+  dump = []
+  for thread in threads:
+    try:
+      stack = resolver.stack(frames(thread))
+    except Exception:
+      stack = None
+    dump.append((thread.Id, stack))
+  return dump
+
+#threads with identical stacks together, like uniq on a thread dump:
+#(stack, thread ids), most threads first
+def group_stacks(dump):
+  groups = dict()
+  for thread_id, stack in dump:
+    key = tuple(stack) if stack != None else None
+    groups.setdefault(key, []).append(thread_id)
+  result = [(list(key) if key != None else None, ids)
+              for key, ids in groups.items()]
+  result.sort(key = lambda g: (-len(g[1]), g[1][0]))
+  return result
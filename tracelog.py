@@ -0,0 +1,114 @@
+from __future__ import with_statement
+
+import json
+import threading
+import time
+
+#--------------------------------------------
+# tracepoint log
+
+_encode_string = json.encoder.encode_basestring_ascii
+
+#a record as a JSON line, formatted by hand since json.dumps of a dict per
+#record is most of what writing the log costs
+def _record_line(t, location, hit_count, message):
+  return '{"time": %r, "location": %s, "hit": %d, "message": %s}\n' % (t, 
+    _encode_string(location) if location != None else 'null', hit_count, 
+    _encode_string(message))
+
+#records from tracepoint hits. append is called on the CorDebug callback
+#thread, so it does no console or file I/O - it just adds the record to the
+#unwritten batch. A background thread takes the batch and writes it to the
+#log file as JSON lines, once per flush interval or as soon as the batch
+#reaches capacity records. If the writer falls a whole batch behind that,
+#append waits for it rather than drop records, which slows the debuggee
+#down to what the file can keep up with. Without a file only the most
+#recent records are kept, for recent
+class trace_log(object):
+  def __init__(self, filename = None, capacity = 10000, flush_interval = 1.0):
+    self.filename = filename
+    self.capacity = capacity
+    self.flush_interval = flush_interval
+    self.count = 0
+    self.written = 0
+    self.waits = 0
+    self._unwritten = []
+    self._last_batch = []
+    self._lock = threading.Lock()
+    self._taken = threading.Condition(self._lock)
+    self._wake = threading.Event()
+    self._stop = False
+    self._writer = None
+    self._file = None
+
+  def append(self, location, hit_count, message):
+    record = (time.time(), location, hit_count, message)
+    with self._lock:
+      self._unwritten.append(record)
+      self.count += 1
+      if len(self._unwritten) % self.capacity == 0:
+        self._full()
+
+  #called with the lock held, each time the batch grows by capacity. A 
+  #writer that has died can't take the batch, so it's left to grow and 
+  #close writes it
+  def _full(self):
+    if self.filename == None:
+      self._last_batch = self._unwritten
+      self._unwritten = []
+      return
+    if self._writer == None:
+      return
+    self._wake.set()
+    if len(self._unwritten) < 2 * self.capacity:
+      return
+    self.waits += 1
+    while len(self._unwritten) >= 2 * self.capacity and self._writer.isAlive():
+      self._taken.wait(self.flush_interval)
+
+  #the most recent n records, oldest first
+  def recent(self, n):
+    if not n:
+      return []
+    with self._lock:
+      records = self._last_batch[-n:] + self._unwritten[-n:]
+    return records[-n:]
+
+  def start(self):
+    if self.filename == None or self._writer != None:
+      return
+    self._file = open(self.filename, 'a')
+    self._writer = threading.Thread(target = self._run)
+    self._writer.setDaemon(True)
+    self._writer.start()
+
+  def _run(self):
+    while not self._stop:
+      self._wake.wait(self.flush_interval)
+      self._wake.clear()
+      self.flush()
+
+  def flush(self):
+    if self._file == None:
+      return
+    with self._lock:
+      batch = self._unwritten
+      if not batch:
+        return
+      self._unwritten = []
+      self._last_batch = batch
+      self._taken.notifyAll()
+    self._file.write("".join([_record_line(*record) for record in batch]))
+    self._file.flush()
+    self.written += len(batch)
+
+  def close(self):
+    if self._writer != None:
+      self._stop = True
+      self._wake.set()
+      self._writer.join()
+      self._writer = None
+    self.flush()
+    if self._file != None:
+      self._file.close()
+      self._file = None